@@ -26,6 +26,31 @@ OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. */
 
 namespace SAOP {
 
+    vector<Cell> FireData::cells_ignited_in(const TimeWindow& tw) const {
+        auto by_ignition = [this](const Cell& c, double t) { return ignitions(c) < t; };
+        auto first = std::lower_bound(cells_by_ignition.begin(), cells_by_ignition.end(), tw.start, by_ignition);
+        vector<Cell> cells;
+        for (auto it = first; it != cells_by_ignition.end() && ignitions(*it) <= tw.end; ++it) {
+            cells.push_back(*it);
+        }
+        return cells;
+    }
+
+    vector<Cell> FireData::sort_by_ignition(const DRaster& ignitions) {
+        vector<Cell> cells;
+        for (size_t x = 0; x < ignitions.x_width; x++) {
+            for (size_t y = 0; y < ignitions.y_height; y++) {
+                if (ignitions(x, y) < numeric_limits<double>::max() / 2) {
+                    cells.emplace_back(x, y);
+                }
+            }
+        }
+        std::stable_sort(cells.begin(), cells.end(), [&ignitions](const Cell& a, const Cell& b) {
+            return ignitions(a) < ignitions(b);
+        });
+        return cells;
+    }
+
     opt<Cell> FireData::project_on_fire_front(const Cell& cell, double time) const {
         ASSERT(ignitions.is_in(cell));
         Cell proj = project_closest_to_fire_front(cell, time);
@@ -92,6 +117,17 @@ namespace SAOP {
         }
     }
 
+    vector<Cell> FireData::project_closest_to_fire_front(const vector<Cell>& cells,
+                                                         const vector<double>& times) const {
+        ASSERT(cells.size() == times.size());
+        vector<Cell> projected;
+        projected.reserve(cells.size());
+        for (size_t i = 0; i < cells.size(); i++) {
+            projected.push_back(project_closest_to_fire_front(cells[i], times[i]));
+        }
+        return projected;
+    }
+
     opt<Segment3d> FireData::project_on_firefront(const Segment3d& seg, const UAV& uav, double time) const {
         const Waypoint3d center = uav.visibility_center(seg);
         if (!ignitions.is_in(center))
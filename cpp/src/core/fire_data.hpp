@@ -59,7 +59,8 @@ namespace SAOP {
                 : ignitions(ignition_raster),
                   traversal_end(compute_traversal_ends(ignition_raster)),
                   propagation_directions(compute_propagation_direction(ignition_raster)),
-                  elevation(make_shared<DRaster>(elevation_raster)) {
+                  elevation(make_shared<DRaster>(elevation_raster)),
+                  cells_by_ignition(sort_by_ignition(ignition_raster)) {
 
             std::vector<double> durations(ignitions.data.size());
             // compute ignition duration
@@ -108,6 +109,11 @@ namespace SAOP {
             return ignitions(cell) < numeric_limits<double>::max() / 2;
         }
 
+        /** Cells whose ignition time is in the time window, by increasing ignition time.
+         *
+         * Relies on an index of the cells sorted by ignition time: only the cells in the time window are visited. */
+        vector<Cell> cells_ignited_in(const TimeWindow& tw) const;
+
         /* Given a cell, get the next cell following the main propagation direction.*/
         opt<Cell> next_in_propagation_direction(const Cell& cell) const;
 
@@ -117,6 +123,9 @@ namespace SAOP {
         /** Finds the closest cell from the fire front of the given time by going up or down the propagation slope.*/
         Cell project_closest_to_fire_front(const Cell& cell, double time) const;
 
+        /** Batch version of project_closest_to_fire_front: projects each cells[i] on the fire front of times[i]. */
+        vector<Cell> project_closest_to_fire_front(const vector<Cell>& cells, const vector<double>& times) const;
+
         /** Returns a segment whose visibility center is on cell on the firefront of the given time.
          *
          * This essentially projects a segment on the firefront, non-touching its orientation.
@@ -135,6 +144,13 @@ namespace SAOP {
         double max_ign_duration;
         double min_ign_duration;
 
+        /** Eventually ignited cells, sorted by increasing ignition time. */
+        vector<Cell> cells_by_ignition;
+
+        /** Builds the list of eventually ignited cells sorted by increasing ignition time.
+         * Cells with the same ignition time are ordered by x, then y. */
+        static vector<Cell> sort_by_ignition(const DRaster& ignitions);
+
         /** Builds a raster containing the times at which the firefront leaves the cells. */
         static DRaster compute_traversal_ends(const DRaster& ignitions);
 
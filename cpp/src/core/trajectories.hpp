@@ -26,21 +26,34 @@ OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. */
 #define PROJECT_TRAJECTORIES_H
 
 #include <algorithm>
+#include <atomic>
+#include <memory>
 #include <ostream>
+#include <boost/iterator/indirect_iterator.hpp>
 #include "trajectory.hpp"
 
 using namespace std;
 
 namespace SAOP {
 
+    /** Set of trajectories with copy-on-write semantics.
+     *
+     * Copies of a Trajectories share their Trajectory objects. A trajectory is only duplicated when it is accessed
+     * for modification while being shared, so that a copy followed by the modification of one trajectory allocates
+     * only this trajectory. */
     struct Trajectories {
+        typedef boost::indirect_iterator<vector<shared_ptr<Trajectory>>::iterator> iterator;
+        typedef boost::indirect_iterator<vector<shared_ptr<Trajectory>>::const_iterator, const Trajectory> const_iterator;
 
-        explicit Trajectories(const vector<Trajectory>& trajectories) : trajs(trajectories) {}
+        explicit Trajectories(const vector<Trajectory>& trajectories) {
+            for (auto& traj : trajectories) {
+                trajs.push_back(make_shared<Trajectory>(traj));
+            }
+        }
 
         explicit Trajectories(vector<TrajectoryConfig> traj_confs) {
             for (auto& conf : traj_confs) {
-                auto traj = Trajectory(conf);
-                trajs.push_back(traj);
+                trajs.push_back(make_shared<Trajectory>(conf));
             }
         }
 
@@ -52,7 +65,7 @@ namespace SAOP {
         /** A plan is valid iff all trajectories are valid (match their configuration. */
         bool is_valid() const {
             for (auto& traj : trajs)
-                if (!traj.has_valid_flight_time())
+                if (!traj->has_valid_flight_time())
                     return false;
             return true;
         }
@@ -61,40 +74,40 @@ namespace SAOP {
         double duration() const {
             double duration = 0;
             for (auto& traj : trajs)
-                duration += traj.duration();
+                duration += traj->duration();
             return duration;
         }
 
         size_t num_segments() const {
             size_t total = 0;
             for (auto& traj : trajs)
-                total += traj.size();
+                total += traj->size();
             return total;
         }
 
         /** Returns the UAV performing the given trajectory */
         UAV uav(size_t traj_id) const {
             ASSERT(traj_id < trajs.size());
-            return trajs[traj_id].conf().uav;
+            return trajs[traj_id]->conf().uav;
         }
 
         /* For every trajectory, make the maneuvers before and including 'man_id' unmodifiable */
         void freeze_before(double time) {
-            for (auto& traj : trajs)
+            for (auto& traj : *this)
                 traj.freeze_before(time);
         }
 
         void freeze_trajectory(std::string traj_name) {
             auto f_traj = std::find_if(trajs.begin(), trajs.end(),
-                                       [&traj_name](const Trajectory& a) { return a.name() == traj_name; });
+                                       [&traj_name](const shared_ptr<Trajectory>& a) { return a->name() == traj_name; });
             if (f_traj != trajs.end()) {
-                f_traj->freeze();
+                detach(f_traj - trajs.begin()).freeze();
             }
         }
 
         /* For every trajectory, make the maneuvers before and including 'man_id' unmodifiable */
         void erase_modifiable_maneuvers() {
-            for (auto& traj : trajs)
+            for (auto& traj : *this)
                 traj.erase_all_modifiable_maneuvers();
         }
 
@@ -102,34 +115,61 @@ namespace SAOP {
 
         bool empty() const { return size() == 0; }
 
-        const Trajectory& operator[](size_t id) const { return trajs[id]; }
+        const Trajectory& operator[](size_t id) const { return *trajs[id]; }
+
+        /* Access a trajectory for modification, copying it first if it is shared with another Trajectories. */
+        Trajectory& operator[](size_t id) { return detach(id); }
 
-        Trajectory& operator[](size_t id) { return trajs[id]; }
+        /* The trajectory shared by this object. It is never modified in place once shared. */
+        shared_ptr<const Trajectory> shared(size_t id) const { return trajs[id]; }
+
+        /* Shares a trajectory obtained with shared(), e.g. from another copy of this object. */
+        void share(size_t id, shared_ptr<const Trajectory> traj) {
+            ASSERT(id < trajs.size());
+            trajs[id] = std::const_pointer_cast<Trajectory>(std::move(traj));
+        }
 
 //        const std::vector<Trajectory>& trajectories() const { return trajs; }
 
-        std::vector<Trajectory>::iterator begin() {
-            return trajs.begin();
+        /* Iterating over non-const trajectories makes all of them exclusive to this object. */
+        iterator begin() {
+            for (size_t i = 0; i < trajs.size(); ++i) {
+                detach(i);
+            }
+            return iterator(trajs.begin());
         }
 
-        std::vector<Trajectory>::iterator end() {
-            return trajs.end();
+        iterator end() {
+            return iterator(trajs.end());
         }
 
-        std::vector<Trajectory>::const_iterator begin() const {
-            return trajs.begin();
+        const_iterator begin() const {
+            return const_iterator(trajs.begin());
         }
 
-        std::vector<Trajectory>::const_iterator end() const {
-            return trajs.end();
+        const_iterator end() const {
+            return const_iterator(trajs.end());
         }
 
-        /* Get a refrence to the internal Trajectory vector in Trajectories.
+        /* Get a copy of the trajectories in Trajectories.
          * To be used only for compatibility in the python interface.*/
-        static const std::vector<Trajectory>& get_internal_vector(const Trajectories& ts) { return ts.trajs; };
+        static std::vector<Trajectory> get_internal_vector(const Trajectories& ts) {
+            return std::vector<Trajectory>(ts.begin(), ts.end());
+        };
 
     private:
-        vector<Trajectory> trajs;
+        vector<shared_ptr<Trajectory>> trajs;
+
+        Trajectory& detach(size_t id) {
+            ASSERT(id < trajs.size());
+            if (trajs[id].use_count() > 1) {
+                trajs[id] = make_shared<Trajectory>(*trajs[id]);
+            } else {
+                // make the writes of the previous owners visible before modifying the trajectory in place
+                std::atomic_thread_fence(std::memory_order_acquire);
+            }
+            return *trajs[id];
+        }
     };
 }
 #endif //PROJECT_TRAJECTORIES_H
@@ -26,6 +26,7 @@ OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. */
 #define PLANNING_CPP_PYTHON_VNS_H
 
 #include <pybind11/pybind11.h>
+#include <pybind11/functional.h> // for std::function callbacks
 #include <pybind11/stl.h> // for conversions between c++ and python collections
 #include <pybind11/numpy.h> // support for numpy arrays
 
@@ -43,7 +44,7 @@ namespace SAOP {
 
     SearchResult
     plan_vns(std::string name, vector<TrajectoryConfig> configs, DRaster ignitions, DRaster elevation,
-             const std::string& json_conf) {
+             const std::string& json_conf, shared_ptr<SearchControl> control = nullptr) {
         auto time = []() {
             struct timeval tp;
             gettimeofday(&tp, NULL);
@@ -76,7 +77,7 @@ namespace SAOP {
 
         BOOST_LOG_TRIVIAL(info) << "Start planning \"" << p.name() << "\"";
         const double planning_start = time();
-        auto res = vns->search(p, max_planning_time, save_every, save_improvements);
+        auto res = vns->search(p, max_planning_time, save_every, save_improvements, control);
         const double planning_end = time();
 
         BOOST_LOG_TRIVIAL(info) << "Plan \"" << p.name() << "\" found in " << planning_end - planning_start
@@ -96,7 +97,8 @@ namespace SAOP {
 
     SearchResult
     plan_vns(Plan p, const std::string& json_conf,
-             double after_time = .0, std::vector<std::string> frozen_trajectories = {}) {
+             double after_time = .0, std::vector<std::string> frozen_trajectories = {},
+             shared_ptr<SearchControl> control = nullptr) {
         auto time = []() {
             struct timeval tp;
             gettimeofday(&tp, NULL);
@@ -128,7 +130,7 @@ namespace SAOP {
 
         BOOST_LOG_TRIVIAL(info) << "Start planning";
         const double planning_start = time();
-        auto res = vns->search(p, max_planning_time, save_every, save_improvements);
+        auto res = vns->search(p, max_planning_time, save_every, save_improvements, control);
         const double planning_end = time();
 
         BOOST_LOG_TRIVIAL(info) << "Plan found in " << planning_end - planning_start << " seconds";
@@ -143,7 +145,8 @@ namespace SAOP {
 
     SearchResult
     replan_vns(Plan p, std::shared_ptr<FireData> fire_data, const std::string& json_conf,
-               double after_time, std::vector<std::string> frozen_trajectories = {}) {
+               double after_time, std::vector<std::string> frozen_trajectories = {},
+               shared_ptr<SearchControl> control = nullptr) {
         auto time = []() {
             struct timeval tp;
             gettimeofday(&tp, NULL);
@@ -176,7 +179,7 @@ namespace SAOP {
 
         BOOST_LOG_TRIVIAL(info) << "Start planning";
         const double planning_start = time();
-        auto res = vns->search(p, max_planning_time, save_every, save_improvements);
+        auto res = vns->search(p, max_planning_time, save_every, save_improvements, control);
         const double planning_end = time();
 
         BOOST_LOG_TRIVIAL(info) << "Plan found in " << planning_end - planning_start << " seconds";
@@ -204,12 +207,17 @@ PYBIND11_MODULE(uav_planning, m) {
     m.doc() = "Python module for UAV trajectory planning";
 
 #ifdef DEBUG
-    srand(0);
     std::cerr << "Warning: Planning module compiled in debug mode. Expect slowness ;)\n";
-#else
-    srand(time(0));
 #endif
 
+    // The random generators are per thread and not seeded here: seeding at import time would only affect the
+    // importing thread. Reproducible searches either call seed_random() from the planning thread or set "seed"
+    // in the VNS configuration.
+    m.def("seed_random", &SAOP::seed_random, py::arg("seed"),
+          "Seeds the random generator used by planning functions called from the current thread. "
+          "Generators of other threads are unaffected: call it from the thread that runs the planning, or set "
+          "\"seed\" in the VNS configuration of plan_vns/replan_vns.");
+
     m.def("set_logger", [&m](py::object& logger) {
         SAOP::set_python_sink(logger);
     }, py::arg("logger").none(false), "Use a python logger as Boost::Log sink");
@@ -394,7 +402,44 @@ PYBIND11_MODULE(uav_planning, m) {
             .def_readonly("ignitions", &FireData::ignitions)
             .def_readonly("traversal_end", &FireData::traversal_end)
             .def_readonly("propagation_directions", &FireData::propagation_directions)
-            .def_readonly("elevation", &FireData::elevation);
+            .def_readonly("elevation", &FireData::elevation)
+            .def("project_closest_to_fire_front",
+                 [](const FireData& self, py::array_t<long, py::array::c_style | py::array::forcecast> cells,
+                    py::array_t<double, py::array::c_style | py::array::forcecast> times) {
+                     if (cells.ndim() != 2 || cells.shape(1) != 2)
+                         throw std::invalid_argument("cells must be an array of shape (n, 2)");
+                     if (times.ndim() != 1 || times.shape(0) != cells.shape(0))
+                         throw std::invalid_argument("times must be an array of shape (n,)");
+                     const size_t n = static_cast<size_t>(cells.shape(0));
+                     auto c = cells.unchecked<2>();
+                     auto t = times.unchecked<1>();
+                     std::vector<Cell> in_cells;
+                     std::vector<double> in_times;
+                     in_cells.reserve(n);
+                     in_times.reserve(n);
+                     for (size_t i = 0; i < n; i++) {
+                         if (c(i, 0) < 0 || c(i, 1) < 0 || !self.ignitions.is_in(Cell(c(i, 0), c(i, 1))))
+                             throw std::invalid_argument("Cell out of the fire map");
+                         in_cells.emplace_back(c(i, 0), c(i, 1));
+                         in_times.push_back(t(i));
+                     }
+
+                     std::vector<Cell> projected;
+                     {
+                         py::gil_scoped_release release;
+                         projected = self.project_closest_to_fire_front(in_cells, in_times);
+                     }
+
+                     py::array_t<long> res({n, static_cast<size_t>(2)});
+                     auto r = res.mutable_unchecked<2>();
+                     for (size_t i = 0; i < n; i++) {
+                         r(i, 0) = projected[i].x;
+                         r(i, 1) = projected[i].y;
+                     }
+                     return res;
+                 }, py::arg("cells"), py::arg("times"),
+                 "Project each cells[i] (array of shape (n, 2)) on the fire front of times[i], going up or down "
+                 "the propagation direction. Returns an array with the n projected cells.");
 
     py::class_<Waypoint3d>(m, "Waypoint")
             .def(py::init<const double, const double, const double, const double>(),
@@ -618,13 +663,48 @@ PYBIND11_MODULE(uav_planning, m) {
             .def("view_trace", (vector<PositionTime> (Plan::*)(const TimeWindow&) const) &Plan::view_trace,
                  py::arg("tw"));
 
+    py::class_<SearchControl, std::shared_ptr<SearchControl>>(m, "SearchControl")
+            .def(py::init<>())
+            .def("cancel", &SearchControl::cancel)
+            .def("is_cancelled", &SearchControl::is_cancelled)
+            .def("set_deadline", &SearchControl::set_deadline, py::arg("seconds"))
+            .def("on_new_best", [](SearchControl& self, py::function callback) {
+                // The Python callable is only called, copied and released with the GIL held: search threads only
+                // copy the shared pointer, whose last owner releases the callable after acquiring the GIL.
+                std::shared_ptr<py::function> held(new py::function(std::move(callback)), [](py::function* f) {
+                    py::gil_scoped_acquire acquire;
+                    delete f;
+                });
+                py::gil_scoped_release release;
+                self.on_new_best([held](const Plan& plan) {
+                    py::gil_scoped_acquire acquire;
+                    (*held)(plan);
+                });
+            }, py::arg("callback"))
+            .def("best_plan", [](SearchControl& self) -> py::object {
+                opt<Plan> best;
+                {
+                    // Do not wait for the lock of the control while holding the GIL
+                    py::gil_scoped_release release;
+                    best = self.best_plan();
+                }
+                return best ? py::cast(*best) : py::none();
+            });
+
     py::class_<SearchResult>(m, "SearchResult")
             .def("initial_plan", &SearchResult::initial)
             .def("final_plan", &SearchResult::final)
-            .def_readonly("intermediate_plans", &SearchResult::intermediate_plans)
+            .def_property_readonly("intermediate_plans", &SearchResult::intermediate_plans,
+                                   "All intermediate plans, rebuilt from the history on each access. "
+                                   "Use history_size() and plan(i) to access them one by one")
+            .def("history_size", [](SearchResult& self) { return self.history.size(); },
+                 "Number of intermediate plans")
             .def("metadata", [](SearchResult& self) { return self.metadata.dump(); })
             .def("plan", [](SearchResult& self, size_t p) -> Plan {
-                return self.intermediate_plans.at(p);
+                if (p >= self.history.size()) {
+                    throw std::out_of_range("No intermediate plan with this index");
+                }
+                return self.history.plan(p);
             })
             .def("plan", [](SearchResult& self, std::string p) -> Plan {
                 if (p == "final") {
@@ -643,26 +723,28 @@ PYBIND11_MODULE(uav_planning, m) {
             .def("sampled_airframe", &DubinsWind::sampled_airframe, py::arg("l_step"));
 
     m.def("replan_vns", (SearchResult(*)(Plan, std::shared_ptr<FireData> fire_data, const std::string&,
-                                         double, std::vector<std::string>)) SAOP::replan_vns,
+                                         double, std::vector<std::string>, shared_ptr<SearchControl>)) SAOP::replan_vns,
           py::arg("plan"), py::arg("fire_data"), py::arg("json_conf"),
-          py::arg("after_time"), py::arg("frozen_trajectories"), py::call_guard<py::gil_scoped_release>());
+          py::arg("after_time"), py::arg("frozen_trajectories"), py::arg("control") = nullptr,
+          py::call_guard<py::gil_scoped_release>());
 
     m.def("replan_vns", (SearchResult(*)(SearchResult, double, DRaster, DRaster, const std::string&)) SAOP::replan_vns,
           py::arg("last_search_result"), py::arg("after_time"), py::arg("ignition_map"), py::arg("elevation_map"),
           py::arg("json_conf"), py::call_guard<py::gil_scoped_release>());
 
-    m.def("plan_vns", (SearchResult(*)(Plan, const std::string&, double, std::vector<std::string>)) SAOP::plan_vns,
+    m.def("plan_vns", (SearchResult(*)(Plan, const std::string&, double, std::vector<std::string>,
+                                       shared_ptr<SearchControl>)) SAOP::plan_vns,
           py::arg("plan"), py::arg("json_conf"), py::arg("after_time"), py::arg("frozen_trajectories"),
-          py::call_guard<py::gil_scoped_release>());
+          py::arg("control") = nullptr, py::call_guard<py::gil_scoped_release>());
 
     m.def("plan_vns", (SearchResult (*)(vector<TrajectoryConfig>, DRaster, DRaster, const std::string&)) SAOP::plan_vns,
           py::arg("trajectory_configs"), py::arg("ignitions"), py::arg("elevation"), py::arg("json_conf"),
           py::call_guard<py::gil_scoped_release>());
 
     m.def("plan_vns", (SearchResult (*)(std::string, vector<TrajectoryConfig>, DRaster, DRaster,
-                                        const std::string&)) SAOP::plan_vns,
+                                        const std::string&, shared_ptr<SearchControl>)) SAOP::plan_vns,
           py::arg("plan_name"), py::arg("trajectory_configs"), py::arg("ignitions"), py::arg("elevation"),
-          py::arg("json_conf"), py::call_guard<py::gil_scoped_release>());
+          py::arg("json_conf"), py::arg("control") = nullptr, py::call_guard<py::gil_scoped_release>());
 }
 
 #endif //PLANNING_CPP_PYTHON_VNS_H
\ No newline at end of file
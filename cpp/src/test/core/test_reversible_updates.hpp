@@ -81,9 +81,32 @@ namespace SAOP {
             return ts;
         }
 
+        void test_copy_on_write() {
+            UAV uav("test", 10., 32. * M_PI / 180, 0.1);
+            vector<TrajectoryConfig> confs{TrajectoryConfig(uav, Waypoint3d(5, 5, 0, 0), Waypoint3d(11, 11, 0, 0), 10),
+                                           TrajectoryConfig(uav, Waypoint3d(5, 5, 0, 0), Waypoint3d(11, 11, 0, 0), 10)};
+            Trajectories base(confs);
+            InsertSegmentUpdate(0, seg(1), 1).apply(base);
+
+            Trajectories copy = base;
+            BOOST_CHECK(copy.shared(0) == base.shared(0));
+            BOOST_CHECK(copy.shared(1) == base.shared(1));
+
+            // only the modified trajectory is duplicated
+            auto rev = InsertSegmentUpdate(0, seg(2), 2).apply(copy);
+            BOOST_CHECK(copy.shared(0) != base.shared(0));
+            BOOST_CHECK(copy.shared(1) == base.shared(1));
+            BOOST_CHECK(copy.num_segments() == base.num_segments() + 1);
+            BOOST_CHECK(base[0].size() == 3);
+
+            rev->apply(copy);
+            BOOST_CHECK(copy[0].segments() == base[0].segments());
+        }
+
         test_suite* reversible_updates_test_suite() {
             test_suite* ts3 = BOOST_TEST_SUITE("reversible_updates_tests");
             ts3->add(BOOST_TEST_CASE(&default_plan));
+            ts3->add(BOOST_TEST_CASE(&test_copy_on_write));
 
             return ts3;
         }
@@ -25,6 +25,7 @@ OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. */
 #include "test_dubinswind.hpp"
 #include "test_position_manipulation.hpp"
 #include "core/test_reversible_updates.hpp"
+#include "test_visibility.hpp"
 #include <boost/test/included/unit_test.hpp>
 
 using namespace boost::unit_test;
@@ -34,11 +35,13 @@ test_suite* init_unit_test_suite(int /*argc*/, char* /*argv*/[]) {
     auto dubins_ts = SAOP::Test::dubins_test_suite();
     auto position_manipulation_ts = SAOP::Test::position_manipulation_test_suite();
     auto reversible_updates_ts = SAOP::Test::reversible_updates_test_suite();
+    auto visibility_ts = SAOP::Test::visibility_test_suite();
 
     framework::master_test_suite().add(dubinswind_ts);
     framework::master_test_suite().add(dubins_ts);
     framework::master_test_suite().add(position_manipulation_ts);
     framework::master_test_suite().add(reversible_updates_ts);
+    framework::master_test_suite().add(visibility_ts);
 
     return nullptr;
 
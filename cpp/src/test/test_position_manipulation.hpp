@@ -22,6 +22,7 @@ CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
 OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. */
 
+#include <algorithm>
 #include <iostream>
 
 #include "../ext/dubins.h"
@@ -86,6 +87,317 @@ namespace SAOP {
             cout << "SUCCESS" << endl;
         }
 
+        void test_parallel_search() {
+            // circular firedata spread
+            DRaster ignitions(100, 100, 0, 0, 1);
+            for (size_t x = 0; x < 100; x++) {
+                for (size_t y = 0; y < 100; y++) {
+                    ignitions.set(x, y, sqrt(pow((double) x - 50, 2) + pow((double) y - 50, 2)));
+                }
+            }
+
+            DRaster elevation(100, 100, 0, 0, 1);
+
+            auto fd = make_shared<FireData>(ignitions, elevation);
+            vector<TrajectoryConfig> confs{TrajectoryConfig(uav, Waypoint3d(5, 5, 0, 0), Waypoint3d(11, 11, 0, 0), 10)};
+            Plan p(confs, fd, TimeWindow{0, 110});
+
+            auto vns = SAOP::build_default();
+            vns->num_searches = 4;
+            vns->exchange_period = 0.1;
+
+            auto res = vns->search(p, 0.5);
+            BOOST_CHECK(res.final().utility() <= p.utility());
+            BOOST_CHECK(res.metadata["searches"].size() == 4);
+            for (const auto& s : res.metadata["searches"]) {
+                const double utility = s["utility"];
+                BOOST_CHECK(res.final().utility() <= utility);
+            }
+        }
+
+        void test_neighborhood_stats() {
+            NeighborhoodStats stats(3);
+            // neighborhoods that never ran come first, in fixed order from the offset
+            BOOST_CHECK(stats.ranking(0.5, 1) == vector<size_t>({1, 2, 0}));
+
+            stats.record(0, 1., 0.);
+            stats.record(1, 1., 10.);
+            stats.record(2, 0.1, 2.);
+            BOOST_CHECK(stats.ranking(0., 0) == vector<size_t>({2, 1, 0}));
+
+            // a neighborhood that rarely ran is favored by exploration
+            for (size_t i = 0; i < 100; ++i) {
+                stats.record(1, 1., 10.);
+                stats.record(2, 0.1, 2.);
+            }
+            BOOST_CHECK(stats.ranking(0., 0).front() == 2);
+            BOOST_CHECK(stats.ranking(1., 0).front() == 0);
+            BOOST_CHECK_EQUAL(stats.runs[1], 101);
+            BOOST_CHECK_SMALL(stats.gain[1] - 1010., 1e-6);
+        }
+
+        void test_adaptive_search() {
+            // circular firedata spread
+            DRaster ignitions(100, 100, 0, 0, 1);
+            for (size_t x = 0; x < 100; x++) {
+                for (size_t y = 0; y < 100; y++) {
+                    ignitions.set(x, y, sqrt(pow((double) x - 50, 2) + pow((double) y - 50, 2)));
+                }
+            }
+
+            DRaster elevation(100, 100, 0, 0, 1);
+
+            auto fd = make_shared<FireData>(ignitions, elevation);
+            vector<TrajectoryConfig> confs{TrajectoryConfig(uav, Waypoint3d(5, 5, 0, 0), Waypoint3d(11, 11, 0, 0), 10)};
+            Plan p(confs, fd, TimeWindow{0, 110});
+
+            auto vns = SAOP::build_default();
+            vns->adaptive = true;
+
+            auto res = vns->search(p, 0.5);
+            BOOST_CHECK(res.final().is_valid());
+            BOOST_CHECK(res.final().utility() <= p.utility());
+            for (const auto& n : res.metadata["neighborhoods"]) {
+                const size_t runs = n["runs"];
+                BOOST_CHECK(runs > 0);
+            }
+        }
+
+        void test_incremental_utility() {
+            // circular firedata spread
+            DRaster ignitions(100, 100, 0, 0, 1);
+            for (size_t x = 0; x < 100; x++) {
+                for (size_t y = 0; y < 100; y++) {
+                    ignitions.set(x, y, sqrt(pow((double) x - 50, 2) + pow((double) y - 50, 2)));
+                }
+            }
+
+            DRaster elevation(100, 100, 0, 0, 1);
+
+            auto fd = make_shared<FireData>(ignitions, elevation);
+            vector<TrajectoryConfig> confs{TrajectoryConfig(uav, Waypoint3d(5, 5, 0, 0), Waypoint3d(11, 11, 0, 0), 10)};
+            Plan p(confs, fd, TimeWindow{0, 110});
+
+            auto vns = SAOP::build_default();
+            auto res = vns->search(p, 0.5);
+
+            // Utility updated along the search must match the one of a plan evaluated from scratch
+            Plan fresh("fresh", res.final().trajectories(), fd, TimeWindow{0, 110}, {},
+                       GenRaster<double>(fd->ignitions, 1.));
+            BOOST_CHECK_SMALL(res.final().utility() - fresh.utility(), 1e-6);
+            BOOST_CHECK(res.final().utility_map().data == fresh.utility_map().data);
+        }
+
+        void test_plan_history() {
+            // circular firedata spread
+            DRaster ignitions(100, 100, 0, 0, 1);
+            for (size_t x = 0; x < 100; x++) {
+                for (size_t y = 0; y < 100; y++) {
+                    ignitions.set(x, y, sqrt(pow((double) x - 50, 2) + pow((double) y - 50, 2)));
+                }
+            }
+
+            DRaster elevation(100, 100, 0, 0, 1);
+
+            auto fd = make_shared<FireData>(ignitions, elevation);
+            vector<TrajectoryConfig> confs{TrajectoryConfig(uav, Waypoint3d(5, 5, 0, 0), Waypoint3d(11, 11, 0, 0), 10),
+                                           TrajectoryConfig(uav, Waypoint3d(95, 95, 0, 0), Waypoint3d(95, 95, 0, 0), 10)};
+            Plan p(confs, fd, TimeWindow{0, 110});
+
+            auto vns = SAOP::build_default();
+            auto res = vns->search(p, 0.5, 0, true);
+            BOOST_CHECK(res.history.size() > 0);
+
+            // every recorded plan is rebuilt with its trajectories and utility
+            auto plans = res.intermediate_plans();
+            BOOST_CHECK_EQUAL(plans.size(), res.history.size());
+            for (size_t i = 0; i < res.history.size(); ++i) {
+                Plan rebuilt = res.history.plan(i);
+                BOOST_CHECK_SMALL(rebuilt.utility() - res.history.utility(i), 1e-6);
+                BOOST_CHECK_SMALL(plans[i].utility() - res.history.utility(i), 1e-6);
+                BOOST_CHECK_EQUAL(rebuilt.num_segments(), plans[i].num_segments());
+                BOOST_CHECK(i == 0 || res.history.time(i - 1) <= res.history.time(i));
+            }
+
+            // the best recorded plan is the final one
+            size_t best = 0;
+            for (size_t i = 1; i < res.history.size(); ++i) {
+                if (res.history.utility(i) < res.history.utility(best)) {
+                    best = i;
+                }
+            }
+            BOOST_CHECK_SMALL(res.history.utility(best) - res.final().utility(), 1e-6);
+            BOOST_CHECK_EQUAL(res.history.plan(best).duration(), res.final().duration());
+        }
+
+        void test_parallel_trials() {
+            // circular firedata spread
+            DRaster ignitions(100, 100, 0, 0, 25);
+            for (size_t x = 0; x < 100; x++) {
+                for (size_t y = 0; y < 100; y++) {
+                    ignitions.set(x, y, 25 * sqrt(pow((double) x - 50, 2) + pow((double) y - 50, 2)));
+                }
+            }
+
+            DRaster elevation(100, 100, 0, 0, 25);
+
+            auto fd = make_shared<FireData>(ignitions, elevation);
+            vector<TrajectoryConfig> confs{TrajectoryConfig(uav, Waypoint3d(100, 100, 0, 0), Waypoint3d(100, 100, 0, 0), 0, 1000)};
+
+            // the same move is selected whatever the number of threads evaluating the trials
+            OneInsertNbhd sequential(50, false, false, 1);
+            OneInsertNbhd parallel(50, false, false, 4);
+            for (unsigned int seed = 0; seed < 5; seed++) {
+                auto p1 = make_shared<Plan>(confs, fd, TimeWindow{0, 2000});
+                auto p2 = make_shared<Plan>(confs, fd, TimeWindow{0, 2000});
+                seed_random(seed);
+                auto m1 = sequential.get_move(p1);
+                seed_random(seed);
+                auto m2 = parallel.get_move(p2);
+                BOOST_CHECK(m1 && m2);
+                if (m1 && m2) {
+                    BOOST_CHECK_EQUAL(m1->utility(), m2->utility());
+                    BOOST_CHECK_EQUAL(m1->duration(), m2->duration());
+                }
+            }
+        }
+
+        void test_cells_ignited_in() {
+            // circular firedata spread, with a few cells that are never ignited
+            DRaster ignitions(100, 100, 0, 0, 25);
+            for (size_t x = 0; x < 100; x++) {
+                for (size_t y = 0; y < 100; y++) {
+                    ignitions.set(x, y, x == y ? numeric_limits<double>::max()
+                                               : 25 * sqrt(pow((double) x - 50, 2) + pow((double) y - 50, 2)));
+                }
+            }
+            FireData fd(ignitions, DRaster(100, 100, 0, 0, 25));
+
+            for (TimeWindow tw : {TimeWindow{0, 2000}, TimeWindow{250, 250}, TimeWindow{300, 310},
+                                  TimeWindow{-10, -1}, TimeWindow{0, numeric_limits<double>::infinity()}}) {
+                vector<Cell> expected;
+                for (size_t x = 0; x < 100; x++) {
+                    for (size_t y = 0; y < 100; y++) {
+                        const double t = ignitions(x, y);
+                        if (fd.eventually_ignited(Cell{x, y}) && tw.start <= t && t <= tw.end) {
+                            expected.emplace_back(x, y);
+                        }
+                    }
+                }
+                auto cells = fd.cells_ignited_in(tw);
+                BOOST_CHECK_EQUAL(cells.size(), expected.size());
+                for (size_t i = 1; i < cells.size(); i++) {
+                    BOOST_CHECK(ignitions(cells[i - 1]) <= ignitions(cells[i]));
+                }
+                for (const Cell& c : expected) {
+                    BOOST_CHECK(std::find(cells.begin(), cells.end(), c) != cells.end());
+                }
+            }
+        }
+
+        void test_random_generator() {
+            // the sequence of random numbers is reproducible from a seed
+            seed_random(42);
+            vector<size_t> ints;
+            vector<double> doubles;
+            for (size_t i = 0; i < 1000; ++i) {
+                ints.push_back(SAOP::rand(3, 10));
+                doubles.push_back(drand(-1., 1.));
+            }
+            for (size_t i = 0; i < 1000; ++i) {
+                BOOST_CHECK(3 <= ints[i] && ints[i] < 10);
+                BOOST_CHECK(-1. <= doubles[i] && doubles[i] < 1.);
+            }
+            BOOST_CHECK(*std::min_element(ints.begin(), ints.end()) == 3);
+            BOOST_CHECK(*std::max_element(ints.begin(), ints.end()) == 9);
+
+            // seeding or drawing in another thread does not affect the generator of this one
+            seed_random(42);
+            std::thread other([]() {
+                seed_random(7);
+                for (size_t i = 0; i < 100; ++i) {
+                    drand(0., 1.);
+                }
+            });
+            other.join();
+            for (size_t i = 0; i < 1000; ++i) {
+                BOOST_CHECK_EQUAL(SAOP::rand(3, 10), ints[i]);
+                BOOST_CHECK_EQUAL(drand(-1., 1.), doubles[i]);
+            }
+        }
+
+        void test_search_control() {
+            // circular firedata spread
+            DRaster ignitions(100, 100, 0, 0, 25);
+            for (size_t x = 0; x < 100; x++) {
+                for (size_t y = 0; y < 100; y++) {
+                    ignitions.set(x, y, 25 * sqrt(pow((double) x - 50, 2) + pow((double) y - 50, 2)));
+                }
+            }
+
+            DRaster elevation(100, 100, 0, 0, 25);
+
+            auto fd = make_shared<FireData>(ignitions, elevation);
+            vector<TrajectoryConfig> confs{
+                    TrajectoryConfig(uav, Waypoint3d(100, 100, 0, 0), Waypoint3d(100, 100, 0, 0), 0, 1000)};
+            Plan p(confs, fd, TimeWindow{0, 2000});
+            auto vns = SAOP::build_default();
+
+            // the deadline stops a search with a much larger time budget
+            auto control = make_shared<SearchControl>();
+            size_t num_reported = 0;
+            double last_reported = std::numeric_limits<double>::infinity();
+            SearchControl* c = control.get();
+            control->on_new_best([&num_reported, &last_reported, c](const Plan& best) {
+                BOOST_CHECK(best.utility() < last_reported);
+                // the callback can query the control without deadlocking
+                BOOST_CHECK(c->best_plan());
+                last_reported = best.utility();
+                num_reported++;
+            });
+            control->set_deadline(0.5);
+            double start = SearchControl::now();
+            auto res = vns->search(p, 600, 0, false, control);
+            BOOST_CHECK(SearchControl::now() - start < 10);
+            BOOST_CHECK(num_reported > 1);
+            BOOST_CHECK(control->best_plan());
+            BOOST_CHECK_EQUAL(control->best_plan()->utility(), res.final().utility());
+
+            // cancellation from another thread
+            auto cancelled = make_shared<SearchControl>();
+            std::thread canceller([cancelled]() {
+                std::this_thread::sleep_for(std::chrono::milliseconds(300));
+                cancelled->cancel();
+            });
+            start = SearchControl::now();
+            vns->search(p, 600, 0, false, cancelled);
+            canceller.join();
+            BOOST_CHECK(cancelled->is_cancelled());
+            BOOST_CHECK(SearchControl::now() - start < 10);
+
+            // the callback can be replaced while a search is running and reporting plans
+            auto replaced = make_shared<SearchControl>();
+            replaced->set_deadline(0.5);
+            std::atomic<bool> done(false);
+            std::atomic<size_t> num_called(0);
+            std::thread searcher([&vns, &p, replaced, &done]() {
+                vns->search(p, 600, 0, false, replaced);
+                done = true;
+            });
+            size_t num_replacements = 0;
+            SearchControl* r = replaced.get();
+            while (!done) {
+                replaced->on_new_best([&num_called, r](const Plan&) {
+                    BOOST_CHECK(r->best_plan());
+                    num_called++;
+                });
+                num_replacements++;
+            }
+            searcher.join();
+            BOOST_CHECK(num_replacements > 1);
+            BOOST_CHECK(num_called > 0);
+        }
+
         void test_many_points_to_observe_with_start_end_positions() {
             Waypoint3d start(5, 5, 0, 0);
             Waypoint3d end(11, 11, 0, 0);
@@ -199,6 +511,33 @@ namespace SAOP {
             }
         }
 
+        void test_batch_projection_on_firefront() {
+            auto dist = [](size_t x, size_t y) {
+                return sqrt(pow((double) x - 50., 2.) + pow((double) y - 50., 2.));
+            };
+            DRaster ignitions(100, 100, 0, 0, 1);
+            for (size_t x = 0; x < 100; x++) {
+                for (size_t y = 0; y < 100; y++) {
+                    ignitions.set(x, y, dist(x, y));
+                }
+            }
+            DRaster elevation(100, 100, 0, 0, 1);
+            FireData fd(ignitions, elevation);
+
+            vector<Cell> cells;
+            vector<double> times;
+            for (size_t i = 0; i < 100; i++) {
+                cells.push_back(Cell{rand(0, 100), rand(0, 100)});
+                times.push_back(drand(0, 60));
+            }
+            vector<Cell> projected = fd.project_closest_to_fire_front(cells, times);
+            BOOST_REQUIRE(projected.size() == cells.size());
+            for (size_t i = 0; i < cells.size(); i++) {
+                BOOST_CHECK(projected[i] == fd.project_closest_to_fire_front(cells[i], times[i]));
+            }
+            BOOST_CHECK(fd.project_closest_to_fire_front(vector<Cell>(), vector<double>()).empty());
+        }
+
         void test_trajectory_as_waypoints() {
             Trajectory traj((TrajectoryConfig(uav)));
             traj.sampled(2);
@@ -263,7 +602,7 @@ namespace SAOP {
 
         test_suite* position_manipulation_test_suite() {
             test_suite* ts2 = BOOST_TEST_SUITE("position_manipulation_tests");
-            srand(time(0));
+            seed_random((uint64_t) time(0));
             ts2->add(BOOST_TEST_CASE(&test_trajectory_slice));
             ts2->add(BOOST_TEST_CASE(&test_time_window_order));
             ts2->add(BOOST_TEST_CASE(&test_time_window));
@@ -271,8 +610,18 @@ namespace SAOP {
             ts2->add(BOOST_TEST_CASE(&test_segment_rotation));
             ts2->add(BOOST_TEST_CASE(&test_single_point_to_observe));
             ts2->add(BOOST_TEST_CASE(&test_many_points_to_observe));
+            ts2->add(BOOST_TEST_CASE(&test_parallel_search));
+            ts2->add(BOOST_TEST_CASE(&test_neighborhood_stats));
+            ts2->add(BOOST_TEST_CASE(&test_adaptive_search));
+            ts2->add(BOOST_TEST_CASE(&test_incremental_utility));
+            ts2->add(BOOST_TEST_CASE(&test_plan_history));
+            ts2->add(BOOST_TEST_CASE(&test_parallel_trials));
+            ts2->add(BOOST_TEST_CASE(&test_cells_ignited_in));
+            ts2->add(BOOST_TEST_CASE(&test_random_generator));
+            ts2->add(BOOST_TEST_CASE(&test_search_control));
             ts2->add(BOOST_TEST_CASE(&test_many_points_to_observe_with_start_end_positions));
             ts2->add(BOOST_TEST_CASE(&test_projection_on_firefront));
+            ts2->add(BOOST_TEST_CASE(&test_batch_projection_on_firefront));
 
             return ts2;
         }
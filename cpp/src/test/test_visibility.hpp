@@ -0,0 +1,93 @@
+/* Copyright (c) 2017, CNRS-LAAS
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+ * Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+
+ * Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. */
+
+#ifndef PROJECT_TEST_VISIBILITY_H
+#define PROJECT_TEST_VISIBILITY_H
+
+#include "../vns/visibility.hpp"
+#include <boost/test/included/unit_test.hpp>
+
+namespace SAOP {
+    namespace Test {
+
+        using namespace boost::unit_test;
+
+        /** Cost of the pending points, computed from scratch */
+        double brute_force_cost(const Visibility& v) {
+            double cost = 0.;
+            for (const auto& p : v.interesting_pending) {
+                double best = 1.;
+                for (const auto& o : v.interesting_visited) {
+                    const double dist = sqrt(pow((double) p.x - o.x, 2.) + pow((double) p.y - o.y, 2.)) * v.cell_width;
+                    best = min(best, min(500., dist) / 500.);
+                }
+                cost += best;
+            }
+            return cost;
+        }
+
+        void test_visibility_updates() {
+            DRaster ignitions(100, 100, 0, 0, 25);
+            for (size_t x = 0; x < 100; x++) {
+                for (size_t y = 0; y < 100; y++) {
+                    ignitions.set(x, y, sqrt(pow((double) x - 50, 2) + pow((double) y - 50, 2)));
+                }
+            }
+            UAV drone("test", 10., 32. * M_PI / 180, 0.1);
+            Visibility v(ignitions, 20, 40);
+            const size_t n_interesting = v.interesting_pending.size();
+            BOOST_CHECK(n_interesting > 0);
+            BOOST_CHECK(v.interesting_visited.empty());
+            BOOST_CHECK_CLOSE(v.cost(), (double) n_interesting, 1e-6);
+
+            const Segment s1(Waypoint(600, 1250, 0), 1000);
+            const Segment s2(Waypoint(1250, 600, M_PI / 2), 1000);
+            v.add_segment(drone, s1);
+            v.add_segment(drone, s2);
+            BOOST_CHECK(!v.interesting_visited.empty());
+            BOOST_CHECK(v.interesting_visited.size() + v.interesting_pending.size() == n_interesting);
+            BOOST_CHECK_CLOSE(v.cost(), brute_force_cost(v), 1e-6);
+            BOOST_CHECK(v.cost() < n_interesting);
+
+            const double cost = v.cost();
+            const double cost_given_removal = v.cost_given_removal(drone, s1);
+            BOOST_CHECK_CLOSE(v.cost(), cost, 1e-6);
+
+            v.remove_segment(drone, s1);
+            BOOST_CHECK_CLOSE(v.cost(), cost_given_removal, 1e-6);
+            BOOST_CHECK_CLOSE(v.cost(), brute_force_cost(v), 1e-6);
+
+            v.remove_segment(drone, s2);
+            BOOST_CHECK(v.interesting_visited.empty());
+            BOOST_CHECK_CLOSE(v.cost(), (double) n_interesting, 1e-6);
+        }
+
+        test_suite* visibility_test_suite() {
+            test_suite* ts = BOOST_TEST_SUITE("visibility_tests");
+            ts->add(BOOST_TEST_CASE(&test_visibility_updates));
+            return ts;
+        }
+    }
+}
+#endif //PROJECT_TEST_VISIBILITY_H
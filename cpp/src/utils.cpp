@@ -23,6 +23,7 @@ OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. */
 
 #include <cmath>
+#include <random>
 #include "utils.hpp"
 
 namespace SAOP {
@@ -45,14 +46,46 @@ namespace SAOP {
     }
 
 
+    void RandomGenerator::seed(uint64_t seed) {
+        // expand the seed with splitmix64, as recommended by the authors of xoshiro
+        for (auto& s : state) {
+            uint64_t z = (seed += 0x9e3779b97f4a7c15);
+            z = (z ^ (z >> 30)) * 0xbf58476d1ce4e5b9;
+            z = (z ^ (z >> 27)) * 0x94d049bb133111eb;
+            s = z ^ (z >> 31);
+        }
+    }
+
+    uint64_t RandomGenerator::next() {
+        auto rotl = [](const uint64_t x, int k) { return (x << k) | (x >> (64 - k)); };
+        const uint64_t result = rotl(state[1] * 5, 7) * 9;
+        const uint64_t t = state[1] << 17;
+        state[2] ^= state[0];
+        state[3] ^= state[1];
+        state[1] ^= state[2];
+        state[0] ^= state[3];
+        state[2] ^= t;
+        state[3] = rotl(state[3], 45);
+        return result;
+    }
+
+    RandomGenerator& random_generator() {
+        static thread_local RandomGenerator generator(
+                (uint64_t) std::random_device()() << 32 | (uint64_t) std::random_device()());
+        return generator;
+    }
+
+    void seed_random(uint64_t seed) {
+        random_generator().seed(seed);
+    }
+
     double drand(double min, double max) {
-        const double base = (double) std::rand() / RAND_MAX;
-        return min + base * (max - min);
+        return min + random_generator().uniform() * (max - min);
     }
 
     size_t rand(size_t min, size_t non_inclusive_max) {
         ASSERT(min < non_inclusive_max);
-        return (std::rand() % (non_inclusive_max - min)) + min;
+        return (size_t) (random_generator().next() % (non_inclusive_max - min)) + min;
     }
 
     double positive_modulo(double left, double right) {
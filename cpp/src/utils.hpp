@@ -34,14 +34,45 @@ OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. */
 #include <wait.h>
 #include <unistd.h>
 #include <cstdlib>
+#include <cstdint>
 #include <cassert>
 
  namespace SAOP {
 
      void print_trace();
 
+     /** xoshiro256** pseudo-random number generator (http://xoshiro.di.unimi.it).
+      *
+      * Fast and of good statistical quality. An instance must not be shared between threads:
+      * each thread has its own one, see random_generator(). */
+     class RandomGenerator {
+     public:
+         explicit RandomGenerator(uint64_t seed) { this->seed(seed); }
+
+         /** Resets the state of the generator from a 64 bits seed */
+         void seed(uint64_t seed);
+
+         /** Next 64 bits random number */
+         uint64_t next();
+
+         /** Uniformly distributed number in [0, 1) */
+         double uniform() { return (double) (next() >> 11) / 9007199254740992.; /* 2^53 */ }
+
+     private:
+         uint64_t state[4];
+     };
+
+     /** Generator used by rand() and drand() in the calling thread.
+      * Unless seeded with seed_random(), it is seeded from a non-deterministic source when first used. */
+     RandomGenerator& random_generator();
+
+     /** Seeds the generator of the calling thread. */
+     void seed_random(uint64_t seed);
+
+     /** Uniformly distributed number in [min, max), from the generator of the calling thread. */
      double drand(double min, double max);
 
+     /** Uniformly distributed integer in [min, non_inclusive_max), from the generator of the calling thread. */
      size_t rand(size_t min, size_t non_inclusive_max);
 
      double positive_modulo(double left, double right);
@@ -58,6 +58,11 @@ namespace SAOP {
 
     shared_ptr<Neighborhood> build_neighborhood(const json& conf) {
         const std::string& name = conf["name"];
+        // Optional number of threads evaluating the trials of the neighborhood
+        size_t threads = 1;
+        if (conf.find("threads") != conf.end()) {
+            threads = conf["threads"];
+        }
 
         if (name == "dubins-opt") {
             check_field_is_present(conf, "max_trials");
@@ -70,7 +75,7 @@ namespace SAOP {
                 generators.push_back(build_dubins_optimization_generator(it));
             }
 
-            return make_shared<DubinsOptimizationNeighborhood>(generators, max_trials);
+            return make_shared<DubinsOptimizationNeighborhood>(generators, max_trials, threads);
         }
         if (name == "one-insert") {
             check_field_is_present(conf, "max_trials");
@@ -80,7 +85,7 @@ namespace SAOP {
             check_field_is_present(conf, "select_arbitrary_position");
             const bool select_arbitrary_position = conf["select_arbitrary_position"];
             return make_shared<OneInsertNbhd>(
-                    max_trials, select_arbitrary_trajectory, select_arbitrary_position
+                    max_trials, select_arbitrary_trajectory, select_arbitrary_position, threads
             );
         }
         if (name == "trajectory-smoothing") {
@@ -102,7 +107,31 @@ namespace SAOP {
             ns.push_back(build_neighborhood(it));
         }
 
-        return make_shared<VariableNeighborhoodSearch>(ns, make_shared<PlanPortionRemover>(0., 1.));
+        auto vns = make_shared<VariableNeighborhoodSearch>(ns, make_shared<PlanPortionRemover>(0., 1.));
+        // Optional parallel searches (island model)
+        if (j.find("searches") != j.end()) {
+            const size_t searches = j["searches"];
+            vns->num_searches = searches;
+        }
+        if (j.find("exchange_period") != j.end()) {
+            const double exchange_period = j["exchange_period"];
+            vns->exchange_period = exchange_period;
+        }
+        // Optional adaptive ordering of the neighborhoods
+        if (j.find("adaptive") != j.end()) {
+            const bool adaptive = j["adaptive"];
+            vns->adaptive = adaptive;
+        }
+        if (j.find("exploration") != j.end()) {
+            const double exploration = j["exploration"];
+            vns->exploration = exploration;
+        }
+        // Optional seed for reproducible searches
+        if (j.find("seed") != j.end()) {
+            const uint64_t seed = j["seed"];
+            vns->seed = seed;
+        }
+        return vns;
     }
 
     std::shared_ptr<VariableNeighborhoodSearch> build_default() {
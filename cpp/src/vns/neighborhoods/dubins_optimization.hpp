@@ -87,9 +87,10 @@ namespace SAOP {
 
         explicit DubinsOptimizationNeighborhood(
                 vector<shared_ptr<OrientationChangeGenerator>> generators = default_generators(),
-                size_t max_trials = 10) :
+                size_t max_trials = 10, size_t num_threads = 1) :
                 generators(generators),
-                max_trials(max_trials) {
+                max_trials(max_trials),
+                evaluator(num_threads) {
             ASSERT(!generators.empty());
         }
 
@@ -97,7 +98,15 @@ namespace SAOP {
             if (plan->num_segments() == 0)
                 return {};
 
-            // Generates local moves until one is improves duration and is valid or the maximum number of trials is reached.
+            // Draw the rotations of all trials, then generates the corresponding local moves until one is valid
+            // or the maximum number of trials is reached. Moves are evaluated in parallel by batches, and the first
+            // valid one in the order of the trials is returned.
+            struct Rotation {
+                size_t traj_id;
+                size_t seg_id;
+                double angle;
+            };
+            vector<Rotation> rotations;
             size_t num_trials = 0;
             while (num_trials++ < max_trials) {
                 // pick a random trajectory in plan.
@@ -126,23 +135,35 @@ namespace SAOP {
                 const double local_duration_cost = traj.replacement_duration_cost(seg_id, replacement_segment);
 
 
-                // if the duration is improving and the utility doesn't get worse then return the move
+                // if the duration is improving, consider the move
                 if (local_duration_cost < -1) {
-                    unique_ptr<LocalMove> move = unique_ptr<SegmentRotation>(new SegmentRotation(plan, traj_id, seg_id, *optAngle));
+                    rotations.push_back(Rotation{traj_id, seg_id, *optAngle});
+                }
+            }
+
+            plan->utility();
+            vector<unique_ptr<LocalMove>> moves = evaluator.evaluate(
+                    rotations.size(), [&plan, &rotations](size_t i) -> unique_ptr<LocalMove> {
+                        const Rotation& r = rotations[i];
+                        return unique_ptr<SegmentRotation>(new SegmentRotation(plan, r.traj_id, r.seg_id, r.angle));
 
 //                    PReversibleTrajectoriesUpdate rotation_update = unique_ptr<ReplaceSegmentUpdate>(
 //                            new ReplaceSegmentUpdate(traj_id, seg_id, replacement_segment));
 //                    unique_ptr<LocalMove> move = unique_ptr<UpdateBasedMove>(
 //                            new UpdateBasedMove(plan, std::move(rotation_update)));
-                    if (move->is_valid())
-                        return move;
-                }
+                    }, true);
+            for (auto& move : moves) {
+                if (move && move->is_valid())
+                    return std::move(move);
             }
             // we did not find any duration improving move
             return {};
         }
 
     private:
+        /* Builds and evaluates the candidate rotations */
+        MoveEvaluator evaluator;
+
         static vector<shared_ptr<OrientationChangeGenerator>> default_generators() {
             return vector<shared_ptr<OrientationChangeGenerator>> {
                     (shared_ptr<OrientationChangeGenerator>) make_shared<RandomOrientationChangeGenerator>(),
@@ -50,21 +50,33 @@ namespace SAOP {
 
         explicit OneInsertNbhd(double max_trials,
                                const bool select_arbitrary_trajectory,
-                               const bool select_arbitrary_position)
+                               const bool select_arbitrary_position,
+                               size_t num_threads = 1)
                 : max_trials(max_trials),
                   select_arbitrary_trajectory(select_arbitrary_trajectory),
-                  select_arbitrary_position(select_arbitrary_position) {
+                  select_arbitrary_position(select_arbitrary_position),
+                  evaluator(num_threads) {
             BOOST_LOG_TRIVIAL(info) << "OneInsertNbhd is inserting waypoints at " << default_height
                                     << " above ground altitude";
         }
 
         unique_ptr<LocalMove> get_move(PlanPtr p) override {
+            // Draw the random part of all trials first, then build and evaluate the candidates,
+            // possibly in parallel. Candidates are copies of the base plan that are brought up to date beforehand.
+            vector<opt<Trial>> trials;
+            for (size_t num_tries = 0; num_tries < max_trials; num_tries++) {
+                trials.push_back(random_trial(p));
+            }
+            p->utility();
+            vector<unique_ptr<LocalMove>> candidates = evaluator.evaluate(
+                    trials.size(), [this, &p, &trials](size_t i) -> unique_ptr<LocalMove> {
+                        return trials[i] ? get_move_for_trial(p, *trials[i]) : nullptr;
+                    });
+
+            // Select the best candidate, in the order of the trials
             UpdateBasedMove no_move(p, unique_ptr<EmptyUpdate>(new EmptyUpdate()));
             unique_ptr<LocalMove> best = {};
-
-            size_t num_tries = 0;
-            while (num_tries++ < max_trials) {
-                unique_ptr<LocalMove> candidate_move = get_move_for_random_possible_observation(p);
+            for (auto& candidate_move : candidates) {
                 if (candidate_move) {
                     // a move was generated
 
@@ -103,18 +115,52 @@ namespace SAOP {
             }
         }
 
-        /** Picks an observation randomly and generates a move that inserts it into the best looking location. */
-        unique_ptr<LocalMove> get_move_for_random_possible_observation(PlanPtr p) {
+        /** Random choices of a trial: the observation to insert, the orientation of its segment, and where to
+         * insert it. */
+        struct Trial {
+            size_t observation;
+            double angle;
+            size_t first_traj;
+            size_t last_traj;
+            /* Random insertion location for each trajectory between first_traj and last_traj,
+             * only used with select_arbitrary_position. */
+            vector<opt<size_t>> insertion_locs;
+        };
+
+        /** Picks an observation, an angle and possibly a trajectory and insertion locations randomly. */
+        opt<Trial> random_trial(const PlanPtr& p) const {
             ASSERT(!p->trajectories().empty());
-            if (p->possible_observations.empty())
+            if (p->possible_observations->empty())
                 return {};
 
+            Trial trial;
             /** Select a random point in the pending list */
-            const size_t index = rand(0, p->possible_observations.size());
-            const PointTimeWindow pt = p->possible_observations[index];
+            trial.observation = rand(0, p->possible_observations->size());
 
             /** Pick an angle randomly */
-            const double random_angle = drand(0, 2 * M_PI);
+            trial.angle = drand(0, 2 * M_PI);
+
+            if (select_arbitrary_trajectory) {
+                const size_t t = rand(0, p->trajectories().size());
+                trial.first_traj = t;
+                trial.last_traj = t;
+            } else {
+                trial.first_traj = 0;
+                trial.last_traj = p->trajectories().size() - 1;
+            }
+
+            if (select_arbitrary_position) {
+                for (size_t i = trial.first_traj; i <= trial.last_traj; i++) {
+                    trial.insertion_locs.push_back(p->trajectories()[i].random_insertion_id());
+                }
+            }
+            return trial;
+        }
+
+        /** Generates a move that inserts the observation of the trial into the best looking location. */
+        unique_ptr<LocalMove> get_move_for_trial(PlanPtr p, const Trial& trial) {
+            const PointTimeWindow pt = (*p->possible_observations)[trial.observation];
+            const double random_angle = trial.angle;
 
             /** Waypoint and segment resulting from the random picks */
 //            const Segment3d random_observation = p->trajectories().uav(0).observation_segment(
@@ -135,18 +181,8 @@ namespace SAOP {
             // the number of steps in "project on_firefront" by a factor ~5
             Segment3d projected_random_observation = random_observation;
 
-            size_t first_traj, last_traj;
-            if (select_arbitrary_trajectory) {
-                const size_t t = rand(0, p->trajectories().size());
-                first_traj = t;
-                last_traj = t;
-            } else {
-                first_traj = 0;
-                last_traj = p->trajectories().size() - 1;
-            }
-
             /** Try best insert for each subtrajectory in the plan */
-            for (size_t i = first_traj; i <= last_traj; i++) {
+            for (size_t i = trial.first_traj; i <= trial.last_traj; i++) {
                 const Trajectory& traj = p->trajectories()[i];
 
                 // FIXME: DO not force a constant altitude
@@ -163,7 +199,7 @@ namespace SAOP {
 
                 size_t first_insertion_loc, last_insertion_loc;
                 if (select_arbitrary_position) {
-                    const opt<size_t> loc = traj.random_insertion_id();
+                    const opt<size_t> loc = trial.insertion_locs[i - trial.first_traj];
                     if (loc) {
                         first_insertion_loc = *loc;
                         last_insertion_loc = *loc;
@@ -226,6 +262,9 @@ namespace SAOP {
             double additional_flight_time;
         };
 
+        /* Builds and evaluates the candidates of the trials */
+        MoveEvaluator evaluator;
+
         double
         default_insertion_angle(const Trajectory& traj, size_t insertion_loc, const Segment3d& segment) const {
             if (traj.size() == 0) {
@@ -151,6 +151,62 @@ namespace SAOP {
         }
     };
 
+/** Builds and evaluates candidate moves of a neighborhood, in parallel when several threads are available.
+ *
+ * Evaluating a move computes its validity and utility, which are cached in the move. Moves are built and evaluated
+ * on copies of the base plan that share its unchanged trajectories, while the base plan itself is only read.
+ * The random choices of the candidates must be drawn beforehand by the caller, so that the candidates and thus the
+ * selected move do not depend on the number of threads nor on the scheduling. */
+    class MoveEvaluator {
+    public:
+        explicit MoveEvaluator(size_t num_threads = 1)
+                : num_threads(std::max(num_threads, (size_t) 1)),
+                  pool(num_threads > 1 ? new ThreadPool(num_threads) : nullptr) {}
+
+        /** Builds the moves make_move(0), ..., make_move(n-1) and evaluates them.
+         * The result is ordered as the indices. Moves are handled in batches of num_threads. If until_first_valid
+         * is set, the moves following the batch containing the first valid one are neither built nor evaluated and
+         * are left empty. */
+        template<typename MakeMove>
+        vector<unique_ptr<LocalMove>> evaluate(size_t n, MakeMove make_move, bool until_first_valid = false) {
+            vector<unique_ptr<LocalMove>> moves(n);
+            auto build_and_evaluate = [&moves, &make_move](size_t i) {
+                unique_ptr<LocalMove> move = make_move(i);
+                if (move && move->is_valid()) {
+                    move->utility();
+                }
+                moves[i] = std::move(move);
+            };
+
+            for (size_t batch_start = 0; batch_start < n; batch_start += num_threads) {
+                const size_t batch_end = std::min(batch_start + num_threads, n);
+                if (pool) {
+                    vector<std::future<void>> evaluations;
+                    for (size_t i = batch_start; i < batch_end; i++) {
+                        evaluations.push_back(pool->enqueue(build_and_evaluate, i));
+                    }
+                    for (auto& evaluation : evaluations) {
+                        evaluation.get();
+                    }
+                } else {
+                    for (size_t i = batch_start; i < batch_end; i++) {
+                        build_and_evaluate(i);
+                    }
+                }
+                if (until_first_valid &&
+                    std::any_of(moves.begin() + batch_start, moves.begin() + batch_end,
+                                [](const unique_ptr<LocalMove>& m) { return m && m->is_valid(); })) {
+                    break;
+                }
+            }
+            return moves;
+        }
+
+    private:
+        const size_t num_threads;
+        unique_ptr<ThreadPool> pool;
+    };
+
 /** Local move that insert a segment at given place in the plan. */
     struct Insert final : public CloneBasedLocalMove {
         /** Index of the trajectory in which to perform the insertion. */
@@ -23,6 +23,7 @@ OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. */
 
 #include "plan.hpp"
+#include <unordered_set>
 
 namespace SAOP {
 
@@ -52,34 +53,28 @@ namespace SAOP {
 
     Plan::Plan(std::string name, Trajectories trajectories, std::shared_ptr<FireData> fire_data, TimeWindow tw,
                    std::vector<PositionTime> observed_previously, GenRaster<double> utility)
-            : time_window(tw), observed_previously(observed_previously), plan_name(name),
-              trajs(trajectories), fire_data(fire_data), u_map(Utility(std::move(utility), fire_data)) {
-        for (auto& t : trajectories) {
+            : time_window(tw), observed_previously(make_shared<const vector<PositionTime>>(observed_previously)),
+              plan_name(name), trajs(trajectories), fire_data(fire_data),
+              u_map(Utility(std::move(utility), fire_data)) {
+        for (const auto& t : this->trajectories()) {
             ASSERT(t.conf().start_time >= time_window.start && t.conf().start_time <= time_window.end);
         }
 
-        std::vector<Cell> obs_prev_cells;
-        obs_prev_cells.reserve(observed_previously.size());
-        std::transform(observed_previously.begin(), observed_previously.end(),
-                       std::back_inserter(obs_prev_cells),
-                       [this](const PositionTime& pt) -> Cell { return this->firedata().ignitions.as_cell(pt.pt); });
-
-        for (size_t x = 0; x < firedata().ignitions.x_width; x++) {
-            for (size_t y = 0; y < firedata().ignitions.y_height; y++) {
-                const double t = firedata().ignitions(x, y);
-                if (time_window.start <= t && t <= time_window.end) {
-                    Cell c{x, y};
-
-                    // If the cell is in the observed_previously list, do not add it to possible_observations
-                    if (std::find(obs_prev_cells.begin(), obs_prev_cells.end(), c)
-                        == obs_prev_cells.end()) {
-                        possible_observations.push_back(
-                                PointTimeWindow{fire_data->ignitions.as_position(c),
-                                                {fire_data->ignitions(c), fire_data->traversal_end(c)}});
-                    }
-                }
+        std::unordered_set<Cell, CellHash> obs_prev_cells;
+        for (const PositionTime& pt : observed_previously) {
+            obs_prev_cells.insert(firedata().ignitions.as_cell(pt.pt));
+        }
+
+        std::vector<PointTimeWindow> possible_obs;
+        for (const Cell& c : firedata().cells_ignited_in(time_window)) {
+            // If the cell is in the observed_previously list, do not add it to possible_observations
+            if (obs_prev_cells.count(c) == 0) {
+                possible_obs.push_back(
+                        PointTimeWindow{fire_data->ignitions.as_position(c),
+                                        {fire_data->ignitions(c), fire_data->traversal_end(c)}});
             }
         }
+        possible_observations = make_shared<const vector<PointTimeWindow>>(std::move(possible_obs));
 
         u_map.reset(trajs);
     }
@@ -91,7 +86,7 @@ namespace SAOP {
         j["utility"] = utility();
         j["num_segments"] = num_segments();
         j["trajectories"] = json::array();
-        for (const Trajectory& t : trajs) {
+        for (const Trajectory& t : trajectories()) {
             j["trajectories"].push_back(t);
         }
         return j;
@@ -109,7 +104,7 @@ namespace SAOP {
     }
 
     vector<PositionTime> Plan::observations(const TimeWindow& tw) const {
-        vector<PositionTime> obs = std::vector<PositionTime>(observed_previously);
+        vector<PositionTime> obs = std::vector<PositionTime>(*observed_previously);
         for (const auto& traj : trajs) {
             UAV drone = traj.conf().uav;
             for (size_t seg_id = 0; seg_id < traj.size(); seg_id++) {
@@ -207,23 +202,26 @@ namespace SAOP {
     }
 
     void Plan::project_on_fire_front() {
-        for (auto& traj : trajs) {
-            size_t seg_id = traj.first_modifiable_maneuver();
-            while (seg_id <= traj.last_modifiable_maneuver()) {
+        // Trajectories are only accessed for modification when they change, to avoid copying shared ones
+        const Trajectories& ctrajs = trajs;
+        for (size_t traj_id = 0; traj_id < ctrajs.size(); ++traj_id) {
+            size_t seg_id = ctrajs[traj_id].first_modifiable_maneuver();
+            while (seg_id <= ctrajs[traj_id].last_modifiable_maneuver()) {
+                const Trajectory& traj = ctrajs[traj_id];
                 const Segment3d& seg = traj[seg_id].maneuver;
                 const double t = traj.start_time(seg_id);
                 opt<Segment3d> projected = fire_data->project_on_firefront(seg, traj.conf().uav, t);
                 if (projected) {
                     if (*projected != seg) {
                         // original is different than projection, replace it
-                        traj.replace_segment(seg_id, *projected);
+                        trajs[traj_id].replace_segment(seg_id, *projected);
                         u_map.reset(trajs);
                     }
                     seg_id++;
                 } else {
                     // segment has no projection, remove it
                     if (traj.can_modify(seg_id)) {
-                        traj.erase_segment(seg_id);
+                        trajs[traj_id].erase_segment(seg_id);
                         u_map.reset(trajs);
                     } else {
                         seg_id++;
@@ -234,9 +232,11 @@ namespace SAOP {
     }
 
     void Plan::smooth_trajectory() {
-        for (auto& traj : trajs) {
-            size_t seg_id = traj.first_modifiable_maneuver();
-            while (seg_id < traj.last_modifiable_maneuver()) {
+        const Trajectories& ctrajs = trajs;
+        for (size_t traj_id = 0; traj_id < ctrajs.size(); ++traj_id) {
+            size_t seg_id = ctrajs[traj_id].first_modifiable_maneuver();
+            while (seg_id < ctrajs[traj_id].last_modifiable_maneuver()) {
+                const Trajectory& traj = ctrajs[traj_id];
                 const Segment3d& current = traj[seg_id].maneuver;
                 const Segment3d& next = traj[seg_id + 1].maneuver;
 
@@ -245,7 +245,7 @@ namespace SAOP {
 
                 if (dubins_dist_to_next / euclidian_dist_to_next > 2.) {
                     // tight loop, erase next and stay on this segment to check for tight loops on the new next.
-                    traj.erase_segment(seg_id + 1);
+                    trajs[traj_id].erase_segment(seg_id + 1);
                     u_map.reset(trajs);
                 } else {
                     // no loop detected, go to next
@@ -265,6 +265,14 @@ namespace SAOP {
         return rev;
     }
 
+    void Plan::share_trajectories(const vector<shared_ptr<const Trajectory>>& trajectories) {
+        ASSERT(trajectories.size() == trajs.size());
+        for (size_t i = 0; i < trajectories.size(); ++i) {
+            trajs.share(i, trajectories[i]);
+        }
+        u_map.reset(trajs);
+    }
+
     void Plan::freeze_before(double time) {
         trajs.freeze_before(time);
     }
@@ -48,8 +48,9 @@ namespace SAOP {
 
     struct Plan {
         TimeWindow time_window; /* Cells outside the range are not considered in possible observations */
-        vector<PointTimeWindow> possible_observations;
-        vector<PositionTime> observed_previously;
+        /* Immutable after construction, shared by all copies of the plan */
+        shared_ptr<const vector<PointTimeWindow>> possible_observations;
+        shared_ptr<const vector<PositionTime>> observed_previously;
 
         Plan(std::vector<TrajectoryConfig> traj_confs, std::shared_ptr<FireData> fire_data, TimeWindow tw,
              std::vector<PositionTime> observed_previously = {});
@@ -157,6 +158,9 @@ namespace SAOP {
 
         PReversibleTrajectoriesUpdate update(PReversibleTrajectoriesUpdate u, bool do_post_processing = false);
 
+        /** Replaces all trajectories of the plan by shared ones, e.g. recorded from another copy of the plan. */
+        void share_trajectories(const vector<shared_ptr<const Trajectory>>& trajectories);
+
         void freeze_before(double time);
 
         void freeze_trajectory(std::string traj);
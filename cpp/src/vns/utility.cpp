@@ -23,42 +23,78 @@ OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. */
 #include "utility.hpp"
 
-double SAOP::Utility::utility() const {
-    if (utility_cache && utility_map_cache) {
-        return *utility_cache;
-    }
-    /* Recompute utility */
-    GenRaster<double> utility = utility_map();
+SAOP::Utility::Utility(GenRaster<double> initial_utility, std::shared_ptr<FireData> firedata)
+        : base_utility(std::make_shared<const GenRaster<double>>(std::move(initial_utility))),
+          fire_data(std::move(firedata)), observed_cells_cache(std::make_shared<ObservedCellsCache>()) {
     auto accumulate_ignoring_nan = [](double a, double b) { return isnan(b) ? a : a + b; };
-    utility_cache = std::accumulate(utility.begin(), utility.end(), 0., accumulate_ignoring_nan);
-    return *utility_cache;
+    base_utility_sum = std::accumulate(base_utility->begin(), base_utility->end(), 0., accumulate_ignoring_nan);
+}
 
+double SAOP::Utility::utility() const {
+    update_traces();
+    return base_utility_sum - covered_utility;
 }
 
 GenRaster<double> SAOP::Utility::utility_map() const {
-    if (utility_map_cache) {
-        return *utility_map_cache;
+    if (!utility_map_cache) {
+        utility_map_cache = std::make_shared<const GenRaster<double>>(utility_impl_trace());
     }
-    utility_map_cache = utility_impl_trace();
     return *utility_map_cache;
 }
 
 GenRaster<double> SAOP::Utility::initial_utility() const {
-    return base_utility;
+    return *base_utility;
 }
 
 void Utility::reset(Trajectories trajs) {
     trajectories = std::move(trajs);
-    utility_cache.reset();
+    traces_up_to_date = false;
     utility_map_cache.reset();
 }
 
 void Utility::reset(std::shared_ptr<FireData> firedata) {
     fire_data = std::move(firedata);
-    utility_cache.reset();
+    // Observed cells depend on the fire, forget everything
+    observed_cells_cache = std::make_shared<ObservedCellsCache>();
+    traces.clear();
+    coverage.clear();
+    covered_utility = 0.;
+    traces_up_to_date = false;
     utility_map_cache.reset();
 }
 
+bool Utility::ObservationPortion::operator<(const ObservationPortion& o) const {
+    return std::make_tuple(start.time, end.time, start.pt.x, start.pt.y, start.pt.z, end.pt.x, end.pt.y, end.pt.z,
+                           view_width, view_depth) <
+           std::make_tuple(o.start.time, o.end.time, o.start.pt.x, o.start.pt.y, o.start.pt.z, o.end.pt.x, o.end.pt.y,
+                           o.end.pt.z, o.view_width, o.view_depth);
+}
+
+bool Utility::ObservationPortion::operator==(const ObservationPortion& o) const {
+    return !(*this < o) && !(o < *this);
+}
+
+std::shared_ptr<const std::vector<Cell>> Utility::ObservedCellsCache::get(const ObservationPortion& portion) const {
+    std::lock_guard<std::mutex> lock(mutex);
+    auto it = cells.find(portion);
+    return it == cells.end() ? nullptr : it->second;
+}
+
+void Utility::ObservedCellsCache::put(const ObservationPortion& portion,
+                                      std::shared_ptr<const std::vector<Cell>> observed) {
+    std::lock_guard<std::mutex> lock(mutex);
+    auto inserted = cells.emplace(portion, std::move(observed));
+    if (!inserted.second) {
+        // already computed, e.g. by another copy of the Utility
+        return;
+    }
+    insertion_order.push_back(portion);
+    if (cells.size() > MAX_SIZE) {
+        cells.erase(insertion_order.front());
+        insertion_order.pop_front();
+    }
+}
+
 std::vector<std::pair<Position3dTime, Position3dTime>> Utility::straight_segments_of(const Trajectory& traj) {
     std::vector<std::pair<Position3dTime, Position3dTime>> segments = {};
 
@@ -97,36 +133,125 @@ std::vector<std::pair<Position3dTime, Position3dTime>> Utility::straight_segment
     return segments;
 }
 
-SAOP::GenRaster<double> SAOP::Utility::utility_impl_trace() const {
-    GenRaster<double> u_map(std::vector<double>(base_utility.data), base_utility.x_width, base_utility.y_height,
-                            base_utility.x_offset, base_utility.y_offset, base_utility.cell_width);
-    if (trajectories) {
-        for (const auto& traj : *trajectories) {
-            /* Identify straight portions of trajectory */
-            auto straight_o = straight_segments_of(traj);
-            for (const auto& o : straight_o) {
-                Segment3d segment = Segment3d(o.first.pt, o.second.pt);
-                TimeWindow segment_tw = TimeWindow(o.first.time, o.second.time);
-
-                /*Search cells observed from the straight paths*/
-                opt<std::vector<Cell>> trace = RasterMapper::segment_trace<GenRaster<double>>(segment,
-                                                                                              traj.conf().uav.view_width(),
-                                                                                              traj.conf().uav.view_depth(),
-                                                                                              u_map);
-                if (trace) {
-
-                    for (const auto& c: *trace) {
-                        TimeWindow fire_tw = TimeWindow(fire_data->ignitions(c), fire_data->traversal_end(c));
-                        /*Extract utility from the observed cells*/
-                        if (segment_tw.intersects(fire_tw) || segment_tw.contains(fire_tw) ||
-                            fire_tw.contains(segment_tw)) {
-                            u_map.set(c, MIN_UTILITY);
-                        }
-                    }
-                }
+std::vector<Cell> Utility::observed_cells(const ObservationPortion& portion) const {
+    std::vector<Cell> observed = {};
+    Segment3d segment = Segment3d(portion.start.pt, portion.end.pt);
+    TimeWindow segment_tw = TimeWindow(portion.start.time, portion.end.time);
+
+    /*Search cells observed from the straight paths*/
+    opt<std::vector<Cell>> trace = RasterMapper::segment_trace<GenRaster<double>>(segment,
+                                                                                  portion.view_width,
+                                                                                  portion.view_depth,
+                                                                                  *base_utility);
+    if (trace) {
+        for (const auto& c: *trace) {
+            TimeWindow fire_tw = TimeWindow(fire_data->ignitions(c), fire_data->traversal_end(c));
+            /*Extract utility from the observed cells*/
+            if (segment_tw.intersects(fire_tw) || segment_tw.contains(fire_tw) ||
+                fire_tw.contains(segment_tw)) {
+                observed.push_back(c);
+            }
+        }
+    }
+    return observed;
+}
+
+void Utility::cover(const std::vector<Cell>& cells, int count) const {
+    for (const auto& c : cells) {
+        const size_t i = c.x + c.y * base_utility->x_width;
+        const double base = base_utility->data[i];
+        const double extracted = (isnan(base) ? 0. : base) - MIN_UTILITY;
+        if (count > 0) {
+            if (coverage[i]++ == 0) {
+                covered_utility += extracted;
             }
+        } else {
+            auto covered = coverage.find(i);
+            ASSERT(covered != coverage.end() && covered->second > 0);
+            if (--covered->second == 0) {
+                coverage.erase(covered);
+                covered_utility -= extracted;
+            }
+        }
+    }
+}
+
+void Utility::update_traces() const {
+    if (traces_up_to_date) {
+        return;
+    }
+    const size_t n_trajs = trajectories ? trajectories->size() : 0;
 
+    // Trajectories that were removed
+    for (size_t i = n_trajs; i < traces.size(); ++i) {
+        for (const auto& portion : traces[i].portions) {
+            cover(*portion.second, -1);
         }
     }
+    traces.resize(n_trajs);
+
+    for (size_t i = 0; i < n_trajs; ++i) {
+        const std::shared_ptr<const Trajectory> shared_traj = trajectories->shared(i);
+        const Trajectory& traj = *shared_traj;
+        TrajectoryTrace& trace = traces[i];
+        if (trace.trajectory == shared_traj) {
+            // same trajectory object, that is never modified once shared
+            continue;
+        }
+        if (trace.trajectory && trace.trajectory->segments() == traj.segments() &&
+            trace.trajectory->start_times() == traj.start_times()) {
+            // a copy of the traced trajectory, e.g. after a reverted update
+            trace.trajectory = shared_traj;
+            continue;
+        }
+
+        std::vector<std::pair<ObservationPortion, std::shared_ptr<const std::vector<Cell>>>> new_portions;
+        for (const auto& o : straight_segments_of(traj)) {
+            new_portions.emplace_back(ObservationPortion{o.first, o.second, traj.conf().uav.view_width(),
+                                                         traj.conf().uav.view_depth()}, nullptr);
+        }
+
+        // Portions in both the old and the new trace do not change the coverage.
+        // Both lists are ordered by time, so they are matched in a single pass.
+        std::vector<bool> kept(trace.portions.size(), false);
+        size_t j = 0;
+        for (auto& portion : new_portions) {
+            while (j < trace.portions.size() && trace.portions[j].first < portion.first) {
+                ++j;
+            }
+            if (j < trace.portions.size() && trace.portions[j].first == portion.first) {
+                portion.second = trace.portions[j].second;
+                kept[j] = true;
+                ++j;
+            }
+        }
+        for (size_t k = 0; k < trace.portions.size(); ++k) {
+            if (!kept[k]) {
+                cover(*trace.portions[k].second, -1);
+            }
+        }
+        for (auto& portion : new_portions) {
+            if (!portion.second) {
+                portion.second = observed_cells_cache->get(portion.first);
+                if (!portion.second) {
+                    portion.second = std::make_shared<const std::vector<Cell>>(observed_cells(portion.first));
+                    observed_cells_cache->put(portion.first, portion.second);
+                }
+                cover(*portion.second, 1);
+            }
+        }
+
+        trace.trajectory = shared_traj;
+        trace.portions = std::move(new_portions);
+    }
+    traces_up_to_date = true;
+}
+
+SAOP::GenRaster<double> SAOP::Utility::utility_impl_trace() const {
+    update_traces();
+    GenRaster<double> u_map(*base_utility);
+    for (const auto& covered : coverage) {
+        u_map.data[covered.first] = MIN_UTILITY;
+    }
     return u_map;
-}
\ No newline at end of file
+}
@@ -24,6 +24,10 @@ OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. */
 #ifndef PLANNING_CPP_UTILITY_HPP
 #define PLANNING_CPP_UTILITY_HPP
 
+#include <deque>
+#include <map>
+#include <mutex>
+#include <unordered_map>
 #include <utility>
 #include <vector>
 
@@ -36,8 +40,7 @@ namespace SAOP {
     class Utility {
 
     public:
-        Utility(GenRaster<double> initial_utility, std::shared_ptr<FireData> firedata)
-                : base_utility(std::move(initial_utility)), fire_data(std::move(firedata)) {}
+        Utility(GenRaster<double> initial_utility, std::shared_ptr<FireData> firedata);
 
         double utility() const;
 
@@ -52,8 +55,44 @@ namespace SAOP {
 
 
     private:
-        /* Initial utility map from which observations extract utility */
-        GenRaster<double> base_utility;
+        /* Straight portion of a trajectory, from which pictures are taken by a camera of the given footprint */
+        struct ObservationPortion {
+            Position3dTime start;
+            Position3dTime end;
+            double view_width;
+            double view_depth;
+
+            bool operator<(const ObservationPortion& o) const;
+
+            bool operator==(const ObservationPortion& o) const;
+        };
+
+        /* Cells whose utility is extracted by each observation portion.
+         * Shared by the copies of a Utility, as the cells only depend on the portion and the fire data.
+         * When full, the oldest portions are evicted first. */
+        class ObservedCellsCache {
+        public:
+            std::shared_ptr<const std::vector<Cell>> get(const ObservationPortion& portion) const;
+
+            void put(const ObservationPortion& portion, std::shared_ptr<const std::vector<Cell>> cells);
+
+        private:
+            static constexpr size_t MAX_SIZE = 4096;
+            mutable std::mutex mutex;
+            std::map<ObservationPortion, std::shared_ptr<const std::vector<Cell>>> cells;
+            /* Portions in the cache, by order of insertion */
+            std::deque<ObservationPortion> insertion_order;
+        };
+
+        /* Observation portions of a trajectory, and the cells they observe */
+        struct TrajectoryTrace {
+            /* Traced trajectory, shared with the plan as long as it is not modified */
+            std::shared_ptr<const Trajectory> trajectory;
+            std::vector<std::pair<ObservationPortion, std::shared_ptr<const std::vector<Cell>>>> portions;
+        };
+
+        /* Initial utility map from which observations extract utility. Never modified, shared by all copies. */
+        std::shared_ptr<const GenRaster<double>> base_utility;
 
         /* Firedata used to rectrict observation scope */
         std::shared_ptr<FireData> fire_data;
@@ -62,13 +101,35 @@ namespace SAOP {
         static constexpr double MAX_UTILITY = 1.;
         static constexpr double MIN_UTILITY = 0.;
 
+        /* Sum of the base utility, ignoring NaN */
+        double base_utility_sum = 0.;
+
         /* As utility computation is lazy, mutable cache variables are needed because of const members*/
-        mutable opt<double> utility_cache = {};
-        mutable opt<GenRaster<double>> utility_map_cache = {};
+        mutable std::shared_ptr<const GenRaster<double>> utility_map_cache = {};
+
+        /* Incremental bookkeeping of the observed cells.
+         * 'coverage' counts the observation portions extracting the utility of each cell, so that changing a
+         * trajectory only updates the cells of the portions that appeared or disappeared.
+         * Only covered cells are stored, so that copying a Utility does not copy a whole raster. */
+        mutable bool traces_up_to_date = false;
+        mutable std::vector<TrajectoryTrace> traces = {};
+        mutable std::unordered_map<size_t, unsigned int> coverage = {};
+        mutable double covered_utility = 0.;
+        std::shared_ptr<ObservedCellsCache> observed_cells_cache;
 
         opt<Trajectories> trajectories = {};
 
         static std::vector<std::pair<Position3dTime, Position3dTime>> straight_segments_of(const Trajectory& traj);
+
+        /* Cells from which a straight portion of a trajectory extracts utility */
+        std::vector<Cell> observed_cells(const ObservationPortion& portion) const;
+
+        /* Add (count = 1) or remove (count = -1) the utility extracted by some cells */
+        void cover(const std::vector<Cell>& cells, int count) const;
+
+        /* Update the traces of the trajectories that changed since the last call */
+        void update_traces() const;
+
         /** Utility map of the plan.
          * Extract the utility from observation trace rectangles.
          **/
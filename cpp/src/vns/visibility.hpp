@@ -25,6 +25,7 @@ OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. */
 #ifndef PLANNING_CPP_VISIBILITY_H
 #define PLANNING_CPP_VISIBILITY_H
 
+#include <unordered_map>
 #include "../core/raster.hpp"
 #include "../core/trajectory.hpp"
 #include "../core/fire_data.hpp"
@@ -34,9 +35,66 @@ using namespace SAOP;
 
 namespace SAOP {
 
+    /** Cells bucketed on a regular grid of square buckets, to retrieve the cells close to a given one
+     * without going through all of them. */
+    class CellGrid {
+    public:
+        CellGrid() : CellGrid(0, 0, 1) {}
+
+        CellGrid(size_t x_width, size_t y_height, size_t bucket_size)
+                : bucket_size(max(bucket_size, (size_t) 1)),
+                  x_buckets(x_width / this->bucket_size + 1),
+                  y_buckets(y_height / this->bucket_size + 1),
+                  buckets(x_buckets * y_buckets) {}
+
+        void insert(const Cell& c) {
+            bucket_of(c).push_back(c);
+        }
+
+        void erase(const Cell& c) {
+            vector<Cell>& bucket = bucket_of(c);
+            auto it = find(bucket.begin(), bucket.end(), c);
+            ASSERT(it != bucket.end());  // Cell is not in the grid
+            *it = bucket.back();
+            bucket.pop_back();
+        }
+
+        void clear() {
+            for (auto& bucket : buckets) {
+                bucket.clear();
+            }
+        }
+
+        /** Apply f on all cells in the bucket of c and in the adjacent ones.
+         * This includes all cells closer than bucket_size to c. */
+        template<typename F>
+        void for_each_near(const Cell& c, F f) const {
+            const size_t bx = c.x / bucket_size;
+            const size_t by = c.y / bucket_size;
+            for (size_t x = bx > 0 ? bx - 1 : 0; x <= min(bx + 1, x_buckets - 1); x++) {
+                for (size_t y = by > 0 ? by - 1 : 0; y <= min(by + 1, y_buckets - 1); y++) {
+                    for (const Cell& near : buckets[x + y * x_buckets]) {
+                        f(near);
+                    }
+                }
+            }
+        }
+
+    private:
+        size_t bucket_size;
+        size_t x_buckets;
+        size_t y_buckets;
+        vector<vector<Cell>> buckets;
+
+        vector<Cell>& bucket_of(const Cell& c) {
+            ASSERT(c.x / bucket_size < x_buckets && c.y / bucket_size < y_buckets);
+            return buckets[c.x / bucket_size + c.y / bucket_size * x_buckets];
+        }
+    };
+
     class Visibility {
     public:
-        const FireData fire;
+        const DRaster ignitions;
         const double cell_width;
         LRaster visibility;
         LRaster interest;
@@ -46,12 +104,17 @@ namespace SAOP {
         vector<double> pending_costs;
 
         Visibility(const DRaster& ignitions, double time_window_min, double time_window_max)
-                : fire(ignitions),
+                : ignitions(ignitions),
                   cell_width(ignitions.cell_width),
                   visibility(LRaster(ignitions.x_width, ignitions.y_height, ignitions.x_offset, ignitions.y_offset,
                                      ignitions.cell_width)),
                   interest(LRaster(ignitions.x_width, ignitions.y_height, ignitions.x_offset, ignitions.y_offset,
                                    ignitions.cell_width)) {
+            // A visited point only lowers the cost of the pending points within MAX_INFORMATIVE_DISTANCE,
+            // which are all in its bucket or in an adjacent one.
+            const auto bucket_size = (size_t) ceil(MAX_INFORMATIVE_DISTANCE / cell_width);
+            visited_grid = CellGrid(ignitions.x_width, ignitions.y_height, bucket_size);
+            pending_grid = CellGrid(ignitions.x_width, ignitions.y_height, bucket_size);
             set_time_window_of_interest(time_window_min, time_window_max);
         }
 
@@ -62,9 +125,9 @@ namespace SAOP {
         void set_time_window_of_interest(double min, double max) {
             reset();
 
-            for (size_t x = 0; x < fire.ignitions.x_width; x++) {
-                for (size_t y = 0; y < fire.ignitions.y_height; y++) {
-                    const double t = fire.ignitions(x, y);
+            for (size_t x = 0; x < ignitions.x_width; x++) {
+                for (size_t y = 0; y < ignitions.y_height; y++) {
+                    const double t = ignitions(x, y);
                     if (min <= t && t <= max) {
                         Cell c{x, y};
                         interest.set(x, y, 1);
@@ -139,6 +202,14 @@ namespace SAOP {
         const double MAX_INFORMATIVE_DISTANCE = 500.;
         const double MAX_INDIVIDUAL_COST = 1.;
 
+        /** Spatial index of the visited and pending points */
+        CellGrid visited_grid;
+        CellGrid pending_grid;
+
+        /** Position of each visited and pending point in interesting_visited and interesting_pending */
+        unordered_map<Cell, size_t, CellHash> visited_index;
+        unordered_map<Cell, size_t, CellHash> pending_index;
+
         inline double cost_by_dist(const Cell pt1, const Cell pt2) const {
             const double dist = sqrt(pow((double) pt1.x - pt2.x, 2.) + pow((double) pt1.y - pt2.y, 2.)) * cell_width;
             const double cost = min(MAX_INFORMATIVE_DISTANCE, dist) / MAX_INFORMATIVE_DISTANCE * MAX_INDIVIDUAL_COST;
@@ -146,75 +217,91 @@ namespace SAOP {
             return cost;
         }
 
+        /** Lowest cost of a point given the visited points around it */
+        double best_cost(const Cell pt) const {
+            double best_cost = MAX_INDIVIDUAL_COST;
+            visited_grid.for_each_near(pt, [&](const Cell& visited) {
+                best_cost = min(best_cost, cost_by_dist(pt, visited));
+            });
+            return best_cost;
+        }
+
         void reset() {
             interest.reset();
             interesting_pending.clear();
             interesting_visited.clear();
+            pending_costs.clear();
+            visited_grid.clear();
+            pending_grid.clear();
+            visited_index.clear();
+            pending_index.clear();
         }
 
         void add_visited(Cell pt) {
             assert(visibility(pt.x, pt.y) == 1 && is_of_interest(pt.x, pt.y));
+            visited_index[pt] = interesting_visited.size();
             interesting_visited.push_back(pt);
+            visited_grid.insert(pt);
 
-            // update costs of pending points if this new visited provides a better utility
-            for (size_t i = 0; i < interesting_pending.size(); i++) {
-                const double cost_with_new = cost_by_dist(pt, interesting_pending[i]);
+            // update costs of nearby pending points if this new visited provides a better utility
+            pending_grid.for_each_near(pt, [&](const Cell& pending) {
+                const size_t i = pending_index.at(pending);
+                const double cost_with_new = cost_by_dist(pt, pending);
                 if (cost_with_new < pending_costs[i])
                     pending_costs[i] = cost_with_new;
-            }
+            });
         }
 
         void remove_visited(Cell pt) {
             assert(visibility(pt.x, pt.y) == 0 || !is_of_interest(pt.x, pt.y));
 
-            // delete visited
-            size_t index = 0;
-            while (interesting_visited[index] != pt) {
-                index++;
-                assert(index < interesting_visited.size());  // Cell is not in the visited list
+            // delete visited, moving the last one in its place
+            auto removed = visited_index.find(pt);
+            assert(removed != visited_index.end());  // Cell is not in the visited list
+            const size_t index = removed->second;
+            visited_index.erase(removed);
+            if (index != interesting_visited.size() - 1) {
+                interesting_visited[index] = interesting_visited.back();
+                visited_index[interesting_visited[index]] = index;
             }
-            interesting_visited.erase(interesting_visited.begin() + index);
+            interesting_visited.pop_back();
+            visited_grid.erase(pt);
 
-            // update the utility of any pending whose utility was based on the presence of pt.
-            for (size_t i = 0; i < interesting_pending.size(); i++) {
-                if (abs(pending_costs[i] - cost_by_dist(pt, interesting_pending[i])) < 0.0001) {
+            // update the utility of any nearby pending whose utility was based on the presence of pt.
+            pending_grid.for_each_near(pt, [&](const Cell& pending) {
+                const size_t i = pending_index.at(pending);
+                if (abs(pending_costs[i] - cost_by_dist(pt, pending)) < 0.0001) {
                     // recompute utility of pending
-                    double best_cost = MAX_INDIVIDUAL_COST;
-                    for (auto it = interesting_visited.begin(); it != interesting_visited.end(); it++) {
-                        const double cost = cost_by_dist(interesting_pending[i], *it);
-                        if (best_cost > cost) {
-                            best_cost = cost;
-                        }
-                    }
-                    pending_costs[i] = best_cost;
+                    pending_costs[i] = best_cost(pending);
                 }
-            }
+            });
         }
 
         void add_pending(Cell pt) {
             assert(visibility(pt.x, pt.y) == 0 && is_of_interest(pt.x, pt.y));
+            pending_index[pt] = interesting_pending.size();
             interesting_pending.push_back(pt);
+            pending_grid.insert(pt);
 
             // compute the utility of this point and store it
-            double best_cost = MAX_INDIVIDUAL_COST;
-            for (auto it = interesting_visited.begin(); it != interesting_visited.end(); it++) {
-                const double cost = cost_by_dist(pt, *it);
-                if (best_cost > cost)
-                    best_cost = cost;
-            }
-            pending_costs.push_back(best_cost);
+            pending_costs.push_back(best_cost(pt));
             assert(pending_costs.size() == interesting_pending.size());
         }
 
         void remove_pending(Cell pt) {
             ASSERT(visibility(pt.x, pt.y) == 1 || !is_of_interest(pt.x, pt.y));
-            size_t index = 0;
-            while (interesting_pending[index] != pt) {
-                index++;
-                ASSERT(index < interesting_pending.size());  // Cell is not in the pending list
+            auto removed = pending_index.find(pt);
+            ASSERT(removed != pending_index.end());  // Cell is not in the pending list
+            const size_t index = removed->second;
+            pending_index.erase(removed);
+            if (index != interesting_pending.size() - 1) {
+                interesting_pending[index] = interesting_pending.back();
+                pending_costs[index] = pending_costs.back();
+                pending_index[interesting_pending[index]] = index;
             }
-            interesting_pending.erase(interesting_pending.begin() + index);
-            pending_costs.erase(pending_costs.begin() + index);
+            interesting_pending.pop_back();
+            pending_costs.pop_back();
+            pending_grid.erase(pt);
         }
 
         void update_visibility(const UAV& uav, const Segment segment, const int increment) {
@@ -240,25 +327,25 @@ namespace SAOP {
 
             // limits of the area in which to search for visible points
             // this is a subset of the raster that strictly contains the visibility rectangle
-            const double min_x = max(min(min(ax, bx), min(cx, dx)) - cell_width, fire.ignitions.x_offset);
+            const double min_x = max(min(min(ax, bx), min(cx, dx)) - cell_width, ignitions.x_offset);
             const double max_x = min(max(max(ax, bx), max(cx, dx)) + cell_width,
-                                     fire.ignitions.x_offset + fire.ignitions.x_width * cell_width -
-                                     fire.ignitions.cell_width / 2);
-            const double min_y = max(min(min(ay, by), min(cy, dy)) - cell_width, fire.ignitions.y_offset);
+                                     ignitions.x_offset + ignitions.x_width * cell_width -
+                                     ignitions.cell_width / 2);
+            const double min_y = max(min(min(ay, by), min(cy, dy)) - cell_width, ignitions.y_offset);
             const double max_y = min(max(max(ay, by), max(cy, dy)) + cell_width,
-                                     fire.ignitions.y_offset + fire.ignitions.y_height * cell_width -
-                                     fire.ignitions.cell_width / 2);
+                                     ignitions.y_offset + ignitions.y_height * cell_width -
+                                     ignitions.cell_width / 2);
 
             // coordinates of where to start the search, centered on a cell
-            const double start_x = fire.ignitions.x_coords(fire.ignitions.x_index(min_x));
-            const double start_y = fire.ignitions.y_coords(fire.ignitions.y_index(min_y));
+            const double start_x = ignitions.x_coords(ignitions.x_index(min_x));
+            const double start_y = ignitions.y_coords(ignitions.y_index(min_y));
 
             // for each point possibly in the rectangle check if it is in the visible area and mark it as pending/visible when necessary
             for (double ix = start_x; ix <= max_x; ix += cell_width) {
                 for (double iy = start_y; iy <= max_y; iy += cell_width) {
                     if (in_rectangle(ix, iy, ax, ay, bx, by, cx, cy)) {
                         // corresponding point in matrix coordinates
-                        const Cell pt{fire.ignitions.x_index(ix), fire.ignitions.y_index(iy)};
+                        const Cell pt{ignitions.x_index(ix), ignitions.y_index(iy)};
 
                         visibility.set(pt.x, pt.y, visibility(pt.x, pt.y) + increment);
                         if (is_of_interest(pt.x, pt.y)) {
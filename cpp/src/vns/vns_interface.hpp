@@ -25,11 +25,20 @@ OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. */
 #ifndef PLANNING_CPP_VNS_INTERFACE_H
 #define PLANNING_CPP_VNS_INTERFACE_H
 
+#include <algorithm>
+#include <atomic>
+#include <chrono>
+#include <cmath>
 #include <ctime>
+#include <functional>
+#include <future>
+#include <limits>
 #include <memory>
+#include <mutex>
 #include "plan.hpp"
 
 #include "../ext/json.hpp"
+#include "../ext/ThreadPool.hpp"
 
 #include <boost/log/trivial.hpp>
 
@@ -103,13 +112,98 @@ namespace SAOP {
     };
 
 
+    /** Compact record of successive plans of a search.
+     *
+     * Each entry only keeps the trajectories that changed since the previous entry. Trajectories are shared with the
+     * plans of the search (copy-on-write), so that recording a plan copies neither the plan nor its trajectories.
+     * Recorded plans are rebuilt on demand from the initial plan. */
+    class PlanHistory {
+    public:
+        explicit PlanHistory(const Plan& initial_plan) : initial_plan(make_shared<const Plan>(initial_plan)) {
+            for (size_t i = 0; i < initial_plan.trajectories().size(); ++i) {
+                initial_trajectories.push_back(initial_plan.trajectories().shared(i));
+            }
+            last_trajectories = initial_trajectories;
+        }
+
+        /** Records a plan derived from the initial one, found 'time' seconds after the start of the search. */
+        void record(const Plan& p, double time) {
+            ASSERT(p.trajectories().size() == last_trajectories.size());
+            Entry entry{time, p.utility(), {}};
+            for (size_t i = 0; i < last_trajectories.size(); ++i) {
+                auto traj = p.trajectories().shared(i);
+                if (traj != last_trajectories[i]) {
+                    entry.changes.emplace_back(i, traj);
+                    last_trajectories[i] = std::move(traj);
+                }
+            }
+            entries.push_back(std::move(entry));
+        }
+
+        size_t size() const { return entries.size(); }
+
+        /** Time of the i-th record, in seconds since the start of the search. */
+        double time(size_t i) const { return entries.at(i).time; }
+
+        /** Utility of the i-th recorded plan. */
+        double utility(size_t i) const { return entries.at(i).utility; }
+
+        /** Rebuilds the i-th recorded plan by replaying all changes up to it. */
+        Plan plan(size_t i) const {
+            ASSERT(i < entries.size());
+            auto trajectories = initial_trajectories;
+            for (size_t j = 0; j <= i; ++j) {
+                apply(entries[j], trajectories);
+            }
+            Plan p(*initial_plan);
+            p.share_trajectories(trajectories);
+            return p;
+        }
+
+        /** Rebuilds all recorded plans. */
+        vector<Plan> plans() const {
+            vector<Plan> result;
+            auto trajectories = initial_trajectories;
+            for (const Entry& entry : entries) {
+                apply(entry, trajectories);
+                result.push_back(*initial_plan);
+                result.back().share_trajectories(trajectories);
+            }
+            return result;
+        }
+
+    private:
+        struct Entry {
+            double time;
+            double utility;
+            /* Trajectories that changed since the previous entry, with their index in the plan */
+            vector<std::pair<size_t, shared_ptr<const Trajectory>>> changes;
+        };
+
+        static void apply(const Entry& entry, vector<shared_ptr<const Trajectory>>& trajectories) {
+            for (const auto& change : entry.changes) {
+                trajectories[change.first] = change.second;
+            }
+        }
+
+        shared_ptr<const Plan> initial_plan;
+        vector<shared_ptr<const Trajectory>> initial_trajectories;
+        vector<shared_ptr<const Trajectory>> last_trajectories;
+        vector<Entry> entries;
+    };
+
     struct SearchResult {
-        vector<Plan> intermediate_plans;
+        /** Plans saved along the search (snapshots and improvements). */
+        PlanHistory history;
 
         SearchResult(Plan& init_plan)
-                : init_plan(make_shared<Plan>(init_plan)),
+                : history(init_plan),
+                  init_plan(make_shared<Plan>(init_plan)),
                   final_plan(shared_ptr<Plan>()) {}
 
+        /** Plans saved along the search, rebuilt from the history. */
+        vector<Plan> intermediate_plans() const { return history.plans(); }
+
         void set_final_plan(Plan& p) {
             ASSERT(!final_plan);
             final_plan.reset(new Plan(p));
@@ -127,12 +221,200 @@ namespace SAOP {
         shared_ptr<Plan> final_plan;
     };
 
+    /** Shares the best plan between searches running in parallel (island model). */
+    class PlanExchange {
+    public:
+        explicit PlanExchange(double period) : period(period) {}
+
+        /** Seconds between two exchanges of a search. */
+        const double period;
+
+        /** Publishes the best plan of a search.
+         * Returns a copy of the best plan published so far if it is better than the given one, nullptr otherwise. */
+        PlanPtr exchange(const Plan& plan) {
+            std::lock_guard<std::mutex> lock(mutex);
+            if (!best || plan.utility() < best->utility()) {
+                best = make_shared<Plan>(plan);
+                return PlanPtr();
+            }
+            if (best->utility() < plan.utility()) {
+                return make_shared<Plan>(*best);
+            }
+            return PlanPtr();
+        }
+
+    private:
+        std::mutex mutex;
+        PlanPtr best;
+    };
+
+    /** Controls searches from another thread.
+     *
+     * A search using a control stops at its wall-clock deadline or as soon as it is cancelled, and reports each new
+     * best plan it finds. */
+    class SearchControl {
+    public:
+        SearchControl() = default;
+
+        /** Stops the searches using this control at their next iteration. */
+        void cancel() { cancelled = true; }
+
+        bool is_cancelled() const { return cancelled; }
+
+        /** Makes the searches stop 'secs' seconds from now, whatever their own time budget. */
+        void set_deadline(double secs) {
+            deadline = now() + secs;
+        }
+
+        /** True if the searches must stop now. */
+        bool should_stop() const {
+            return cancelled || now() >= deadline;
+        }
+
+        /** Function called with each new best plan found by the searches.
+         * It is called from the search threads, one call at a time and without holding any lock of this control,
+         * so it may call best_plan(). A plan superseded before the callback could run is not passed to it. */
+        void on_new_best(std::function<void(const Plan&)> callback) {
+            shared_ptr<const std::function<void(const Plan&)>> replaced;
+            if (callback) {
+                replaced = make_shared<const std::function<void(const Plan&)>>(std::move(callback));
+            }
+            {
+                std::lock_guard<std::mutex> lock(mutex);
+                std::swap(new_best_callback, replaced);
+            }
+            // the previous callback is released here, outside of the lock
+        }
+
+        /** Best plan reported so far, if any. */
+        opt<Plan> best_plan() const {
+            std::lock_guard<std::mutex> lock(mutex);
+            return best ? opt<Plan>(*best) : opt<Plan>();
+        }
+
+        /** Reports a plan found by a search.
+         * Plans that are not better than the best one reported so far (e.g. by another search) are ignored. */
+        void report(const Plan& plan) {
+            PlanPtr reported;
+            // Only the pointer is copied under the lock: copying or releasing the function itself may need other
+            // locks (e.g. Python's GIL)
+            shared_ptr<const std::function<void(const Plan&)>> callback;
+            {
+                std::lock_guard<std::mutex> lock(mutex);
+                if (best && best->utility() <= plan.utility()) {
+                    return;
+                }
+                best = make_shared<Plan>(plan);
+                reported = best;
+                callback = new_best_callback;
+            }
+            if (callback) {
+                // The callback may need other locks (e.g. Python's GIL): it must not run while holding 'mutex'
+                std::lock_guard<std::mutex> callback_lock(callback_mutex);
+                {
+                    std::lock_guard<std::mutex> lock(mutex);
+                    if (best != reported) {
+                        return;
+                    }
+                }
+                (*callback)(*reported);
+            }
+        }
+
+        /** Wall-clock time in seconds, from an arbitrary origin */
+        static double now() {
+            return std::chrono::duration<double>(std::chrono::steady_clock::now().time_since_epoch()).count();
+        }
+
+    private:
+        std::atomic<bool> cancelled = {false};
+        std::atomic<double> deadline = {std::numeric_limits<double>::infinity()};
+        mutable std::mutex mutex;
+        /* Serializes the calls to new_best_callback */
+        std::mutex callback_mutex;
+        shared_ptr<const std::function<void(const Plan&)>> new_best_callback;
+        PlanPtr best;
+    };
+
+    /** Runtime and improvements of each neighborhood along a search, used to order the neighborhoods adaptively.
+     *
+     * Neighborhoods are ranked by their improvement rate (utility gained per second spent in the neighborhood), relative
+     * to the best one, plus an UCB1 exploration bonus so that neighborhoods that rarely run are still tried. */
+    class NeighborhoodStats {
+    public:
+        vector<double> runtime;
+        vector<size_t> runs;
+        vector<double> gain;
+
+        explicit NeighborhoodStats(size_t num_neighborhoods)
+                : runtime(num_neighborhoods, 0.), runs(num_neighborhoods, 0), gain(num_neighborhoods, 0.) {}
+
+        /** Records a run of neighborhood 'nbhd' that took 'duration' seconds and reduced the utility by 'utility_gain'. */
+        void record(size_t nbhd, double duration, double utility_gain) {
+            ASSERT(nbhd < runs.size());
+            runtime[nbhd] += duration;
+            runs[nbhd] += 1;
+            gain[nbhd] += std::max(utility_gain, 0.);
+        }
+
+        /** Neighborhoods by decreasing score. Neighborhoods that never ran come first.
+         * Ties are broken by the fixed order, starting from neighborhood 'offset'. */
+        vector<size_t> ranking(double exploration, size_t offset = 0) const {
+            const size_t n = runs.size();
+            size_t total_runs = 0;
+            double max_rate = 0.;
+            for (size_t i = 0; i < n; ++i) {
+                total_runs += runs[i];
+                max_rate = std::max(max_rate, rate(i));
+            }
+            vector<double> scores(n);
+            for (size_t i = 0; i < n; ++i) {
+                if (runs[i] == 0) {
+                    scores[i] = std::numeric_limits<double>::infinity();
+                } else {
+                    scores[i] = (max_rate > 0 ? rate(i) / max_rate : 0.)
+                                + exploration * std::sqrt(2 * std::log((double) total_runs) / runs[i]);
+                }
+            }
+            vector<size_t> order;
+            for (size_t i = 0; i < n; ++i) {
+                order.push_back((i + offset) % n);
+            }
+            std::stable_sort(order.begin(), order.end(), [&scores](size_t a, size_t b) {
+                return scores[a] > scores[b];
+            });
+            return order;
+        }
+
+    private:
+        double rate(size_t nbhd) const {
+            return runtime[nbhd] > 0 ? gain[nbhd] / runtime[nbhd] : 0.;
+        }
+    };
+
     struct VariableNeighborhoodSearch {
         /** Sequence of neighborhoods to be considered by VNS. */
         vector<shared_ptr<Neighborhood>> neighborhoods;
 
         shared_ptr<Shuffler> shuffler;
 
+        /** Number of independent searches run in parallel by search(). */
+        size_t num_searches = 1;
+
+        /** If >0, parallel searches exchange their best plan every 'exchange_period' seconds. */
+        double exchange_period = 0.;
+
+        /** If set, random generators are seeded from it at the start of search(), which makes the sequence of
+         * moves reproducible. Otherwise, the generator of the calling thread is used as is. */
+        opt<uint64_t> seed = {};
+
+        /** If set, neighborhoods are not considered in a fixed order: each time the search goes back to the first
+         * neighborhood, they are ordered by their improvement rate so far (see NeighborhoodStats). */
+        bool adaptive = false;
+
+        /** Weight of the exploration bonus in the adaptive ordering of neighborhoods. */
+        double exploration = 0.5;
+
         explicit VariableNeighborhoodSearch(vector<shared_ptr<Neighborhood>>& neighborhoods,
                                             shared_ptr<Shuffler> shuffler)
                 :
@@ -141,22 +423,105 @@ namespace SAOP {
         }
 
         /** Refines an initial plan with Variable Neighborhood Search.
+         *
+         * If num_searches > 1, that many searches are run on a thread pool and the best result is returned.
+         * Each search has a budget of max_time_secs of wall-clock time.
+         * Parallel searches use their own random generator, seeded from the one of the calling thread.
          *
          * @param p: Initial plan.
          * @param max_restarts: Number of allowed restarts (currently only 0 is supported).
          * @param save_every: If >0, the Search result will contain snapshots of the search every N iterations.
-         *                    Warning: this is very heavy on memory usage.
          * @param save_improvements: If set, the Search result will contain snapshots of every improvement in the plan.
-         *                    Warning: this is very heavy on memory usage.
+         *                    Snapshots are recorded in the history of the result as changes of trajectories.
+         * @param control: If set, the search can also be stopped by a deadline or a cancellation, and reports
+         *                 its new best plans to this control while running.
          * @return
          */
-        SearchResult search(Plan p, double max_time_secs, size_t save_every = 0, bool save_improvements = false) {
-            const clock_t search_start = clock();
-            auto seconds_since_start = [search_start]() { return (double(clock() - search_start)) / CLOCKS_PER_SEC; };
+        SearchResult search(Plan p, double max_time_secs, size_t save_every = 0, bool save_improvements = false,
+                            shared_ptr<SearchControl> control = nullptr) {
+            if (seed) {
+                seed_random(*seed);
+            }
+            if (num_searches <= 1) {
+                return single_search(p, max_time_secs, save_every, save_improvements, 0, nullptr, control.get());
+            }
+            return parallel_search(p, max_time_secs, save_every, save_improvements, control.get());
+        }
+
+    private:
+        SearchResult parallel_search(Plan p, double max_time_secs, size_t save_every, bool save_improvements,
+                                     SearchControl* control) {
+            PlanExchange exchange(exchange_period);
+            // Copy the initial plan before starting, so that searches do not share lazily computed caches
+            vector<Plan> initial_plans(num_searches, p);
+            // Seeds are drawn before starting, so that they do not depend on the scheduling of the threads
+            vector<uint64_t> seeds;
+            for (size_t i = 0; i < num_searches; ++i) {
+                seeds.push_back(random_generator().next());
+            }
+            vector<std::future<SearchResult>> futures;
+            {
+                ThreadPool pool(num_searches);
+                for (size_t i = 0; i < num_searches; ++i) {
+                    futures.push_back(pool.enqueue(
+                            [this, &initial_plans, &seeds, &exchange, i, max_time_secs, save_every,
+                                    save_improvements, control]() {
+                                seed_random(seeds[i]);
+                                return single_search(initial_plans[i], max_time_secs, save_every,
+                                                     save_improvements, i,
+                                                     exchange_period > 0 ? &exchange : nullptr, control);
+                            }));
+                }
+            }
+
+            vector<SearchResult> results;
+            for (auto& f : futures) {
+                results.push_back(f.get());
+            }
+            size_t best = 0;
+            for (size_t i = 1; i < results.size(); ++i) {
+                if (results[i].final().utility() < results[best].final().utility()) {
+                    best = i;
+                }
+            }
+            BOOST_LOG_TRIVIAL(info) << "Plan \"" << p.name() << "\" best of " << num_searches
+                                    << " parallel searches found by search " << best;
+
+            SearchResult result = results[best];
+            result.metadata["searches"] = json::array();
+            for (size_t i = 0; i < results.size(); ++i) {
+                json j;
+                j["utility"] = results[i].final().utility();
+                j["neighborhood_offset"] = i;
+                j["neighborhoods"] = results[i].metadata["neighborhoods"];
+                result.metadata["searches"].push_back(j);
+            }
+            result.metadata["best_search"] = best;
+            result.metadata["exchange_period"] = exchange_period;
+            return result;
+        }
+
+        /** Search loop.
+         *
+         * @param neighborhood_offset: The neighborhoods are considered starting from this index, to diversify
+         *                             parallel searches.
+         * @param exchange: If not null, the best plan is exchanged with other searches between restarts.
+         * @param control: If not null, checked for deadline and cancellation, and notified of the best plans.
+         */
+        SearchResult single_search(Plan p, double max_time_secs, size_t save_every, bool save_improvements,
+                                   size_t neighborhood_offset, PlanExchange* exchange, SearchControl* control) {
+            const double search_start = SearchControl::now();
+            auto seconds_since_start = [search_start]() { return SearchControl::now() - search_start; };
+            auto should_continue = [&seconds_since_start, max_time_secs, control]() {
+                return seconds_since_start() < max_time_secs && !(control && control->should_stop());
+            };
 
             SearchResult result(p);
 
             shared_ptr<Plan> best_plan = make_shared<Plan>(p);
+            if (control) {
+                control->report(*best_plan);
+            }
             shared_ptr<Plan> best_plan_for_restart = make_shared<Plan>(p);
 
             // a list of tuples (t, u) where 't' is a time in seconds reliative to the start of search and 'u' is the value
@@ -167,34 +532,55 @@ namespace SAOP {
 
             size_t current_iter = 0;
             size_t num_restarts = 0;
+            double last_exchange = 0.;
 
-            vector<double> runtime_per_neighborhood(neighborhoods.size(), 0.0);
-            vector<double> runs_per_neighborhood(neighborhoods.size(), 0);
+            NeighborhoodStats stats(neighborhoods.size());
+            // order in which neighborhoods are considered, until going back to the first one
+            vector<size_t> order;
+            for (size_t i = 0; i < neighborhoods.size(); ++i) {
+                order.push_back((i + neighborhood_offset) % neighborhoods.size());
+            }
 
             bool saved = false; /* True if an improvement was saved so save_every do not take an snapshot again */
 
-            while (seconds_since_start() < max_time_secs) {
+            while (should_continue()) {
                 // choose first neighborhood
                 size_t current_neighborhood = 0;
                 if (num_restarts > 0) {
+                    if (exchange && seconds_since_start() - last_exchange >= exchange->period) {
+                        PlanPtr better = exchange->exchange(*best_plan);
+                        if (better) {
+                            BOOST_LOG_TRIVIAL(debug) << "Plan \"" << best_plan->name()
+                                                     << "\" adopted from another search";
+                            best_plan = better;
+                            utility_history.emplace_back(
+                                    std::pair<double, double>(seconds_since_start(), best_plan->utility()));
+                            if (control) {
+                                control->report(*best_plan);
+                            }
+                        }
+                        last_exchange = seconds_since_start();
+                    }
                     BOOST_LOG_TRIVIAL(debug) << "Plan \"" << best_plan_for_restart->name() << "\" shuffle no. "
                                              << num_restarts;
                     best_plan_for_restart = std::make_shared<Plan>(*best_plan);
                     shuffler->shuffle(best_plan_for_restart);
                     if (save_improvements) {
                         // save plan even though its is probably not an improvement
-                        result.intermediate_plans.push_back(*best_plan_for_restart);
+                        result.history.record(*best_plan_for_restart, seconds_since_start());
                     }
                 }
 
-                while (seconds_since_start() < max_time_secs && current_neighborhood < neighborhoods.size()) {
+                while (should_continue() && current_neighborhood < neighborhoods.size()) {
+                    if (adaptive && current_neighborhood == 0) {
+                        order = stats.ranking(exploration, neighborhood_offset);
+                    }
+                    const size_t nbhd_id = order[current_neighborhood];
                     // get move for current neighborhood
-                    const clock_t start = clock();
-                    const unique_ptr<LocalMove> move = neighborhoods[current_neighborhood]->get_move(
-                            best_plan_for_restart);
-                    const clock_t end = clock();
-                    runtime_per_neighborhood[current_neighborhood] += double(end - start) / CLOCKS_PER_SEC;
-                    runs_per_neighborhood[current_neighborhood] += 1;
+                    const double utility_before = best_plan_for_restart->utility();
+                    const double start = SearchControl::now();
+                    const unique_ptr<LocalMove> move = neighborhoods[nbhd_id]->get_move(best_plan_for_restart);
+                    const double end = SearchControl::now();
 
                     if (move) {
                         // neighborhood generate a move, apply it
@@ -202,23 +588,27 @@ namespace SAOP {
 
                         // apply the move on best_plan_for_restart
                         move->apply();
+                        stats.record(nbhd_id, end - start, utility_before - best_plan_for_restart->utility());
 
                         if (best_plan_for_restart->utility() < best_plan->utility()) {
                             best_plan = make_shared<Plan>(*best_plan_for_restart);
                             utility_history.emplace_back(
                                     std::pair<double, double>(seconds_since_start(), best_plan_for_restart->utility()));
+                            if (control) {
+                                control->report(*best_plan);
+                            }
                         }
 
                         BOOST_LOG_TRIVIAL(debug) << "Plan \"" << best_plan_for_restart->name()
                                                  << "\" improvement (nbhd "
-                                                 << static_cast<int> (current_neighborhood)
+                                                 << static_cast<int> (nbhd_id)
                                                  << " ): { utility: "
                                                  << std::fixed << std::setw(11) << std::setprecision(6)
                                                  << best_plan_for_restart->utility()
                                                  << ", duration: " << best_plan_for_restart->duration() << " }";
 
                         if (save_improvements) {
-                            result.intermediate_plans.push_back(*best_plan_for_restart);
+                            result.history.record(*best_plan_for_restart, seconds_since_start());
                             saved = true;
                         }
 
@@ -226,10 +616,11 @@ namespace SAOP {
                         current_neighborhood = 0;
                     } else {
                         // no move
+                        stats.record(nbhd_id, end - start, 0.);
                         current_neighborhood += 1;
                     }
                     if (!saved && save_every != 0 && (current_iter % save_every) == 0) {
-                        result.intermediate_plans.push_back(*best_plan_for_restart);
+                        result.history.record(*best_plan_for_restart, seconds_since_start());
                     }
                     saved = false;
                     current_iter += 1;
@@ -239,6 +630,9 @@ namespace SAOP {
                     best_plan = make_shared<Plan>(*best_plan_for_restart);
                     utility_history.emplace_back(
                             std::pair<double, double>(seconds_since_start(), best_plan_for_restart->utility()));
+                    if (control) {
+                        control->report(*best_plan);
+                    }
                 }
 
                 // no neighborhood provides improvements, restart or exit.
@@ -252,8 +646,9 @@ namespace SAOP {
                 json j;
                 auto& n = *neighborhoods[i];
                 j["name"] = std::to_string(i) + "-" + n.name();
-                j["runtime"] = runtime_per_neighborhood[i];
-                j["runs"] = runs_per_neighborhood[i];
+                j["runtime"] = stats.runtime[i];
+                j["runs"] = stats.runs[i];
+                j["gain"] = stats.gain[i];
                 result.metadata["neighborhoods"].push_back(j);
             }
             result.metadata["utility_history"] = json::array();
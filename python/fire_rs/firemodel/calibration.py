@@ -0,0 +1,223 @@
+# Copyright (c) 2017, CNRS-LAAS
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+#  * Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Calibration of the fire spread model to observed ignition times.
+
+The wind factor, moisture scenario and rate of spread scaling of an Environment are searched so
+that the arrival times of a fast propagation match the observations. The fast propagation is
+restricted to the observed region, computes the spread times of each distinct combination of
+fuel, wind and slope only once and runs Dijkstra on a sparse graph with scipy."""
+
+import functools
+import itertools
+import logging
+import typing as ty
+
+from collections import namedtuple
+
+import joblib
+import numpy as np
+import scipy.sparse
+import scipy.sparse.csgraph
+
+import fire_rs.firemodel.environment as env
+import fire_rs.firemodel.fireshapes as fireshapes
+import fire_rs.firemodel.rothermel as rothermel
+import fire_rs.geodata.wildfire
+
+from fire_rs.firemodel.propagation import Environment, neighborhood
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MOISTURES = ('D1L1', 'D2L2', 'D3L3', 'D4L4')
+DEFAULT_WIND_FACTORS = (0.5, 0.75, 1., 1.25, 1.5)
+DEFAULT_ROS_SCALES = (0.25, 0.35, 0.5, 0.7, 1., 1.4, 2., 2.8, 4.)
+
+_NEIGHBORHOOD = np.array(neighborhood)
+_NEIGHBOR_DISTANCES = np.hypot(_NEIGHBORHOOD[:, 0], _NEIGHBORHOOD[:, 1])
+_NEIGHBOR_ANGLES = np.arctan2(_NEIGHBORHOOD[:, 1], _NEIGHBORHOOD[:, 0])
+
+
+class Calibration(namedtuple('Calibration', ['wind_factor', 'moisture', 'ros_scale', 'error'])):
+    """Fire spread parameters and RMS error [s] of the arrival time at the observed cells"""
+
+    def apply(self, environment: Environment):
+        environment.wind_factor = self.wind_factor
+        environment.ros_scale = self.ros_scale
+        environment.update_area_moisture(self.moisture)
+
+
+@functools.lru_cache(maxsize=2 ** 16)
+def _ros(fuel_type: str, moisture: str, wind: float, slope: float) -> ty.Tuple[float, float]:
+    summary = rothermel.ros(fuel_type, moisture, wind, slope)
+    return summary.ros, summary.equivalent_slope
+
+
+def spread_times(layers: np.ndarray, moisture: str, cell_size: float,
+                 wind_factor: float = 1.) -> np.ndarray:
+    """Time for the fire to go from each cell to each of its neighbors.
+
+    Cells sharing the same fuel, wind and slope (rounded to 0.1 km/h, 0.1 % and 0.01 rad) share
+    their fire shape, which is computed once.
+
+    :param layers: structured array with the 'fuel', 'slope', 'raise_dir', 'wind_velocity' and
+        'wind_angle' layers of an Environment raster
+    :param moisture: moisture scenario name (e.g. 'D1L1')
+    :param cell_size: size of the cells [m]
+    :param wind_factor: factor applied to the wind velocity
+    :return: array of shape layers.shape + (len(neighborhood),), inf where the fire does not spread
+    """
+    keys = np.stack((layers['fuel'],
+                     np.round(layers['wind_velocity'] * wind_factor, 1),
+                     np.round(layers['wind_angle'], 2),
+                     np.round(layers['slope'], 1),
+                     np.round(layers['raise_dir'], 2)), axis=-1).reshape((-1, 5))
+    unique_keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+
+    unique_times = np.full((len(unique_keys), len(neighborhood)), np.inf)
+    for i, (fuel, wind_speed, wind_dir, slope_percent, slope_dir) in enumerate(unique_keys):
+        fuel_type = env.get_fuel_model_name(int(fuel))
+        if fuel_type[:2] == "NB":
+            continue
+        # Same as Environment.get_spread_parameters and get_propagation_shape
+        ros, slope_equivalent = _ros(fuel_type, moisture, wind_speed, slope_percent)
+        x_w_eff = wind_speed * np.cos(wind_dir) + slope_equivalent * np.cos(slope_dir)
+        y_w_eff = wind_speed * np.sin(wind_dir) + slope_equivalent * np.sin(slope_dir)
+        shape = fireshapes.get_fire_shape(np.sqrt(x_w_eff ** 2 + y_w_eff ** 2),
+                                          np.arctan2(y_w_eff, x_w_eff), ros)
+        speeds = np.array([shape.speed(angle) for angle in _NEIGHBOR_ANGLES])
+        with np.errstate(divide='ignore'):
+            unique_times[i] = _NEIGHBOR_DISTANCES * cell_size / speeds
+
+    return unique_times[inverse.ravel()].reshape(layers.shape + (len(neighborhood),))
+
+
+def _spread_graph(times: np.ndarray) -> scipy.sparse.csr_matrix:
+    """Directed graph between the cells with the spread times as weights.
+
+    An extra node (the last one) is left for the ignitions."""
+    nx, ny = times.shape[:2]
+    index = np.arange(nx * ny).reshape((nx, ny))
+    rows, cols, weights = [], [], []
+    for k, (dx, dy) in enumerate(neighborhood):
+        src = (slice(max(0, -dx), nx - max(0, dx)), slice(max(0, -dy), ny - max(0, dy)))
+        dst = (slice(max(0, dx), nx + min(0, dx)), slice(max(0, dy), ny + min(0, dy)))
+        w = times[src + (k,)].ravel()
+        spreads = np.isfinite(w)
+        rows.append(index[src].ravel()[spreads])
+        cols.append(index[dst].ravel()[spreads])
+        weights.append(w[spreads])
+    n = nx * ny + 1
+    return scipy.sparse.csr_matrix(
+        (np.concatenate(weights), (np.concatenate(rows), np.concatenate(cols))), shape=(n, n))
+
+
+def _arrival_times(graph: scipy.sparse.csr_matrix, shape: ty.Tuple[int, int],
+                   ignitions: ty.Tuple[np.ndarray, np.ndarray, np.ndarray]) -> np.ndarray:
+    """Ignition time of every cell of a graph built by _spread_graph"""
+    xs, ys, ts = ignitions
+    n = shape[0] * shape[1]
+    # Keep the earliest ignition of each cell, the sparse matrix would sum duplicates
+    start = np.full(n, np.inf)
+    np.minimum.at(start, np.ravel_multi_index((xs, ys), shape), ts)
+    cells = np.flatnonzero(np.isfinite(start))
+    t0 = start[cells].min()
+    # Edges from the ignition node are offset by 1 because explicit zeros are not edges
+    source = scipy.sparse.csr_matrix(
+        (start[cells] - t0 + 1., (np.full(len(cells), n), cells)), shape=graph.shape)
+    dist = scipy.sparse.csgraph.dijkstra(graph + source, directed=True, indices=n)
+    return (dist[:n] - 1. + t0).reshape(shape)
+
+
+def _evaluate(layers: np.ndarray, cell_size: float, moisture: str, wind_factor: float,
+              ros_scales: ty.Sequence[float],
+              ignitions: ty.Tuple[np.ndarray, np.ndarray, np.ndarray],
+              observations: ty.Tuple[np.ndarray, np.ndarray, np.ndarray]) -> Calibration:
+    """Best ros scale for some moisture and wind factor"""
+    graph = _spread_graph(spread_times(layers, moisture, cell_size, wind_factor=wind_factor))
+    obs_x, obs_y, obs_t = observations
+    t0 = ignitions[2].min()
+    best = None
+    for ros_scale in ros_scales:
+        arrival = _arrival_times(graph / ros_scale, layers.shape, ignitions)[obs_x, obs_y]
+        # Cells that are never reached count as if they were predicted at the first ignition
+        arrival[~np.isfinite(arrival)] = t0
+        error = float(np.sqrt(np.mean((arrival - obs_t) ** 2)))
+        if best is None or error < best.error:
+            best = Calibration(wind_factor, moisture, ros_scale, error)
+    return best
+
+
+def calibrate(environment: Environment, observations: ty.Mapping[ty.Tuple[int, int], float],
+              ignitions: ty.Optional[ty.Mapping[ty.Tuple[int, int], float]] = None,
+              moistures: ty.Sequence[str] = DEFAULT_MOISTURES,
+              wind_factors: ty.Sequence[float] = DEFAULT_WIND_FACTORS,
+              ros_scales: ty.Sequence[float] = DEFAULT_ROS_SCALES,
+              margin: int = 20, n_jobs: int = 1) -> ty.Optional[Calibration]:
+    """Find the spread parameters minimizing the arrival time error at the observed cells.
+
+    :param environment: environment whose wind, fuel and slope are used. It is not modified,
+        see Calibration.apply
+    :param observations: {(x, y): time} observed ignition times
+    :param ignitions: {(x, y): time} ignitions of the propagation. By default, the first quarter
+        of the observations (by time) are the ignitions and the others are fitted
+    :param moistures: candidate moisture scenarios
+    :param wind_factors: candidate factors of the environment wind velocity
+    :param ros_scales: candidate factors of the rate of spread
+    :param margin: number of cells around the observations included in the propagation
+    :param n_jobs: number of candidates evaluated in parallel (joblib semantics)
+    :return: the best Calibration, or None if there is nothing to fit
+    """
+    observations = fire_rs.geodata.wildfire.CellTimes.from_mapping(observations)
+    obs_x, obs_y, obs_t = observations.xs, observations.ys, observations.times
+    if ignitions is None:
+        first = obs_t <= np.percentile(obs_t, 25) if len(obs_t) else np.zeros(0, dtype=bool)
+        ign_x, ign_y, ign_t = obs_x[first], obs_y[first], obs_t[first]
+        obs_x, obs_y, obs_t = obs_x[~first], obs_y[~first], obs_t[~first]
+    else:
+        ignitions = fire_rs.geodata.wildfire.CellTimes.from_mapping(ignitions)
+        ign_x, ign_y, ign_t = ignitions.xs, ignitions.ys, ignitions.times
+    if len(ign_t) == 0 or len(obs_t) == 0:
+        logger.info("Not enough observations to calibrate the fire spread")
+        return None
+
+    # Restrict the propagation to the observed region
+    raster = environment.raster
+    all_x = np.concatenate((ign_x, obs_x))
+    all_y = np.concatenate((ign_y, obs_y))
+    x_min, x_max = max(all_x.min() - margin, 0), min(all_x.max() + margin + 1, raster.data.shape[0])
+    y_min, y_max = max(all_y.min() - margin, 0), min(all_y.max() + margin + 1, raster.data.shape[1])
+    layers = raster.data[x_min:x_max, y_min:y_max][
+        ['fuel', 'slope', 'raise_dir', 'wind_velocity', 'wind_angle']].copy()
+    ignitions = (ign_x - x_min, ign_y - y_min, ign_t)
+    observations = (obs_x - x_min, obs_y - y_min, obs_t)
+
+    results = joblib.Parallel(n_jobs=n_jobs)(
+        joblib.delayed(_evaluate)(layers, raster.cell_width, moisture, wind_factor, ros_scales,
+                                  ignitions, observations)
+        for moisture, wind_factor in itertools.product(moistures, wind_factors))
+    best = min(results, key=lambda c: c.error)
+    logger.info("Fire spread calibrated on %d observations: %s", len(obs_t), str(best))
+    return best
@@ -29,7 +29,7 @@
 import heapq
 import logging
 
-from typing import List, Tuple, Union
+from typing import Iterator, List, Optional, Tuple, Union
 
 from collections.abc import Sequence
 
@@ -74,6 +74,9 @@ class Environment:
         # type: GeoData
         self.raster = slope.combine(wind).combine(moisture).combine(fuel).combine(elevation)
         self._clustering = None
+        # Calibration of the fire spread to the observations, see fire_rs.firemodel.calibration
+        self.wind_factor = 1.  # type: float
+        self.ros_scale = 1.  # type: float
 
     @property
     def area(self) -> Tuple[Tuple[float, float], Tuple[float, float]]:
@@ -99,6 +102,12 @@ class Environment:
         new_wind = self._world.get_wind(self._area, domain_average=(wind_speed, wind_dir))
         self.raster.data['wind_velocity'] = new_wind['wind_velocity']
         self.raster.data['wind_angle'] = new_wind['wind_angle']
+        self._wind_speed = wind_speed
+        self._wind_dir = wind_dir
+
+    def update_area_moisture(self, moisture_scenario: str):
+        """Set the moisture scenario (e.g. 'D1L3') of the whole area"""
+        self.raster.data['moisture'] = env.get_moisture_scenario_id(moisture_scenario)
 
     def get_fuel_type(self, x, y):
         """Returns the fuel type (e.g. 'SH5') in (x,y)"""
@@ -107,7 +116,7 @@ class Environment:
     def get_wind(self, x, y):
         """Returns a tuple (wind_speed [km/h], wind_angle [rad]) in (x,y)"""
         tmp = self.raster.data[x, y]
-        wind_vel = tmp['wind_velocity']
+        wind_vel = tmp['wind_velocity'] * self.wind_factor
         wind_angle = tmp['wind_angle']
         return wind_vel, wind_angle
 
@@ -130,7 +139,7 @@ class Environment:
         slope_percent, slope_dir = self.get_slope(x, y)
         wind_speed, wind_dir = self.get_wind(x, y)
         summary = rothermel.ros(fuel_type, moisture, wind_speed, slope_percent)
-        ros = summary.ros
+        ros = summary.ros * self.ros_scale
         if np.isnan(ros):
             logger.warning(
                 "RoS is NaN from fuel_type:%s moisture:%s slope:%s wind_speed:%s wind_dir:%s",
@@ -224,7 +233,7 @@ class FirePropagation:
         # Assert the ignition point can burn
         t, (x, y) = self._pick_from_propagation_queue()
         igni_point_fuel_type = self.environment.get_fuel_type(x, y)
-        if igni_point_fuel_type[:2] == "NB":
+        if (x, y) in self._ignition_cells and igni_point_fuel_type[:2] == "NB":
             logger.warning(
                 "Ignition point %s is set in a nonburnable cell (%s). Fire won't propagate.",
                 str((x, y)), str(igni_point_fuel_type))
@@ -257,6 +266,33 @@ class FirePropagation:
                     d[x + dx, y + dy][2] = y
                     self._push_to_propagation_queue(x + dx, y + dy, t + dt)
 
+    def propagate_by_steps(self, until: float, step: float,
+                           start: Optional[float] = None) -> Iterator[Tuple[float, GeoData]]:
+        """Propagate until some time, yielding the partial ignition map at regular milestones.
+
+        The cells ignited before each milestone are final, so consumers can use the near-term
+        front while the rest of the propagation is computed.
+
+        :param until: Absolute time at which the propagation stops.
+        :param step: Time between two milestones.
+        :param start: The first milestone is one step after this time (typically now).
+            Defaults to the earliest ignition.
+        :return: iterator of (milestone, ignition map up to the milestone). The last milestone
+            is until, or the time at which the fire stopped propagating. If start is after until,
+            until is the only milestone.
+        """
+        assert step > 0
+        milestone = self.from_time if start is None else max(self.from_time, start)
+        while not self.propagation_finished:
+            milestone = min(milestone + step, until)
+            self.propagate(milestone)
+            partial = self.ignitions()
+            partial.data[self._ignition_layer][
+                partial.data[self._ignition_layer] >= milestone] = np.inf
+            yield milestone, partial
+            if milestone >= until:
+                break
+
     @deprecated
     def information_matrix(self):
         d = self.prop_data.clone(fill_value=0,
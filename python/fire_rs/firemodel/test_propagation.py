@@ -23,6 +23,9 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import unittest
+
+import numpy as np
+
 import fire_rs.firemodel.propagation as propagation
 from fire_rs.geodata.geo_data import TimedPoint
 
@@ -42,3 +45,42 @@ class TestPropagation(unittest.TestCase):
         env = propagation.Environment(self.test_area, wind_speed=4.11, wind_dir=0)
         prop = propagation.propagate_from_points(env, [self.ignition_point])
         # prop.plot(blocking=True)
+
+    def test_update_area_wind(self):
+        env = propagation.Environment(self.test_area, wind_speed=4.11, wind_dir=0)
+        self.assertEqual(env.area_wind, (4.11, 0))
+        env.update_area_wind(10., np.pi / 2)
+        # The area wind reflects the last update, not the initial wind
+        self.assertEqual(env.area_wind, (10., np.pi / 2))
+
+    def test_propagate_by_steps(self):
+        env = propagation.Environment(self.test_area, wind_speed=4.11, wind_dir=0)
+        full = propagation.propagate_from_points(env, [self.ignition_point], until=3 * 3600)
+        prop = propagation.FirePropagation(env)
+        prop.set_ignition_point(self.ignition_point)
+        milestones = []
+        for milestone, partial in prop.propagate_by_steps(3 * 3600, 1800):
+            milestones.append(milestone)
+            ignition = full.ignitions().data['ignition']
+            before = ignition < milestone
+            np.testing.assert_array_equal(partial.data['ignition'][before], ignition[before])
+            self.assertTrue(np.all(np.isinf(partial.data['ignition'][~before])))
+        self.assertEqual(milestones, [1800 * i for i in range(1, 7)])
+
+    def test_propagate_by_steps_from_start(self):
+        env = propagation.Environment(self.test_area, wind_speed=4.11, wind_dir=0)
+        prop = propagation.FirePropagation(env)
+        prop.set_ignition_point(self.ignition_point)
+        milestones = [milestone for milestone, _ in prop.propagate_by_steps(3 * 3600, 1800,
+                                                                            start=3600)]
+        self.assertEqual(milestones, [3600 + 1800 * i for i in range(1, 5)])
+
+    def test_propagate_by_steps_start_after_until(self):
+        env = propagation.Environment(self.test_area, wind_speed=4.11, wind_dir=0)
+        full = propagation.propagate_from_points(env, [self.ignition_point], until=3600)
+        prop = propagation.FirePropagation(env)
+        prop.set_ignition_point(self.ignition_point)
+        steps = list(prop.propagate_by_steps(3600, 1800, start=2 * 3600))
+        self.assertEqual([milestone for milestone, _ in steps], [3600])
+        np.testing.assert_array_equal(prop.ignitions().data['ignition'],
+                                      full.ignitions().data['ignition'])
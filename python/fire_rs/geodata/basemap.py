@@ -22,15 +22,18 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
-import functools
+import json
 import logging
+import os
+import tempfile
+import typing as ty
 from collections.abc import Sequence
 
 import numpy as np
 from affine import Affine
 from osgeo import gdal
 
-from fire_rs.geodata.geo_data import GeoData, join_structured_arrays
+from fire_rs.geodata.geo_data import GeoData, Point, join_structured_arrays
 
 logger = logging.getLogger(__name__)
 
@@ -48,13 +51,16 @@ class DigitalMap:
     def __init__(self, tiles):
         """Initialise DigitalMap. Tiles should entirely cover a rectangular area."""
         self._tiles = [[]]  # a 2D-array of tiles, covering a rectangular area
-        for tile in tiles:
-            self.add_tile(tile)
+        self.add_tiles(tiles)
 
     def add_tile(self, tile):
         """Add a tile to the map."""
+        self.add_tiles([tile])
+
+    def add_tiles(self, tiles):
+        """Add several tiles to the map, arranging them only once."""
         # gather all tiles and sort them by increasing (x, y)
-        all_tiles = [t for ts in self._tiles for t in ts] + [tile]
+        all_tiles = [t for ts in self._tiles for t in ts] + list(tiles)
         self._tiles = DigitalMap._arrange_tiles(all_tiles)
 
     @staticmethod
@@ -101,24 +107,24 @@ class DigitalMap:
         x_min, y_min = local_tilemap[0][0].nearest_projected_point((x_min, y_min))
         x_max, y_max = local_tilemap[-1][-1].nearest_projected_point((x_max, y_max))
 
+        # allocate the output once, each tile then fills its own window
+        first_tile = local_tilemap[0][0]
+        shape = (int(round((x_max - x_min) / first_tile.x_delta)) + 1,
+                 int(round((y_max - y_min) / abs(first_tile.y_delta))) + 1)
+        result = GeoData.empty(shape, np.dtype(first_tile.bands_names_types), x_min, y_min,
+                               first_tile.x_delta, abs(first_tile.y_delta),
+                               projection=first_tile.geoprojection)
+
         current_y = y_min
-        tables = []
-        # load in tables one table for each tile involved
         for yi in range(0, len(local_tilemap[0])):
-            tables.append([])  # add new line
             current_x = x_min
             for xi in range(0, len(local_tilemap)):
                 tile = local_tilemap[xi][yi]
                 next_x = min(x_max, tile.x_max)
                 next_y = min(y_max, tile.y_max)
-                table = tile.get_values(((current_x, next_x), (current_y, next_y)))
-                tables[-1].append(table)  # append table to last line
+                tile.get_values(((current_x, next_x), (current_y, next_y)), out=result)
                 current_x = next_x + abs(tile.x_delta)
             current_y = next_y + abs(tile.y_delta)
-
-        # concatenates tables on the x-axis and then the resulting tables on the y-axis
-        combined_xs = [functools.reduce(GeoData.append_right, ts) for ts in tables]
-        result = functools.reduce(GeoData.append_bottom, combined_xs)
         return result
 
     def __getitem__(self, key):
@@ -144,13 +150,15 @@ class DigitalMap:
 
 class RasterTile:
 
-    def __init__(self, filenames, bands_names_types, nodata_fill=None):
+    def __init__(self, filenames, bands_names_types, nodata_fill=None, metadata=None):
         """Initialise RasterTile.
 
         It stores the metadata during the initilization. Data loading is lazy.
 
         :param filenames: One or more file names corresponding to the same tile.
         :param nodata_fill: Array of of size equal to the total number of bands
+        :param metadata: (Optional) Metadata of each file, as returned by RasterTile.read_metadata.
+            If not given, it is read from the files.
         """
         if isinstance(filenames, str):
             filenames = [filenames]
@@ -160,6 +168,12 @@ class RasterTile:
         else:
             raise TypeError("filenames must be a string or sequence of strings")
 
+        if metadata is None:
+            metadata = [RasterTile.read_metadata(f) for f in filenames]
+        elif isinstance(metadata, dict):
+            metadata = [metadata]
+        assert len(metadata) == len(filenames), "Metadata must be given for every file"
+
         self.filenames = filenames
         self.nodata_fill = nodata_fill
         self.bands_names_types = bands_names_types
@@ -168,15 +182,14 @@ class RasterTile:
         nodata_values = []
 
         # First file
-        handle = gdal.Open(filenames[0])
-        self.geoprojection = handle.GetProjection()
-        self.raster_size = np.array([handle.RasterXSize, handle.RasterYSize])
+        self.geoprojection = metadata[0]['projection']
+        self.raster_size = np.array(metadata[0]['raster_size'])
         self.raster_offset = np.array([0, 0])
         self.raster_bounds = [self.raster_offset, self.raster_size + self.raster_offset]
 
         # geotransform: coefficients for transforming between pixel/line (P,L) raster space,
         # and projection coordinates (Xp,Yp) space
-        self.geotransform = handle.GetGeoTransform()
+        self.geotransform = tuple(metadata[0]['geotransform'])
         self.direct_transform = Affine.from_gdal(*self.geotransform)
         # delta between two cell centers (can be negative)
         self.x_delta = self.geotransform[1]
@@ -198,18 +211,15 @@ class RasterTile:
         self.x_max, self.y_max = self.nearest_projected_point((bottomright_projection_corner[0] - 1,
                                                                topleft_projection_corner[1] - 1))
 
-        n_bands += handle.RasterCount
-        for i in range(handle.RasterCount):  # Bands start at 1
-            nodata_values.append(handle.GetRasterBand(i + 1).GetNoDataValue())
+        n_bands += len(metadata[0]['nodata_values'])
+        nodata_values.extend(metadata[0]['nodata_values'])
 
         # Process the rest of files
-        for f in self.filenames[1:]:
-            handle = gdal.Open(f)
-            if handle.GetProjection() == self.geoprojection and \
-                    handle.GetGeoTransform() == self.geotransform:
-                n_bands += handle.RasterCount
-                for i in range(handle.RasterCount):  # Bands start at 1
-                    nodata_values.append(handle.GetRasterBand(i + 1).GetNoDataValue())
+        for m in metadata[1:]:
+            if m['projection'] == self.geoprojection and \
+                    tuple(m['geotransform']) == self.geotransform:
+                n_bands += len(m['nodata_values'])
+                nodata_values.extend(m['nodata_values'])
             else:
                 raise ValueError("Only bands with the same projection can be added.")
 
@@ -222,6 +232,16 @@ class RasterTile:
         self._loaded = False
         self.nodata_values = np.array(nodata_values)
 
+    @staticmethod
+    def read_metadata(filename: str) -> ty.Dict[str, ty.Any]:
+        """Read the metadata of a raster file required to create a tile, without its data."""
+        handle = gdal.Open(filename)
+        return {'projection': handle.GetProjection(),
+                'raster_size': [handle.RasterXSize, handle.RasterYSize],
+                'geotransform': list(handle.GetGeoTransform()),
+                'nodata_values': [handle.GetRasterBand(i + 1).GetNoDataValue()
+                                  for i in range(handle.RasterCount)]}  # Bands start at 1
+
     def _load_data(self):
         """Load data from files."""
         curr_layer = 0  # tracks the layer we are currently looking at
@@ -290,11 +310,13 @@ class RasterTile:
     def as_geo_data(self):
         return self.get_values(((self.x_min, self.x_max), (self.y_min, self.y_max)))
 
-    def get_values(self, rectangle):
+    def get_values(self, rectangle, out: 'ty.Optional[GeoData]' = None):
         """Return an array covering the given rectangle.
 
         Increasing x/y array indexes correspond to increasing value in the projected space.
         Cell size is the one of the tile.
+        If out is given, the values are written in the corresponding window of this GeoData
+        (that must be on the grid of the tile) and out is returned.
         """
         assert self.x_delta > 0
         ((x_min, x_max), (y_min, y_max)) = rectangle
@@ -302,18 +324,24 @@ class RasterTile:
             # get indexes of sub-array
             xi_min, yi_min = self.projected_to_raster((x_min, y_min))
             xi_max, yi_max = self.projected_to_raster((x_max, y_max))
-            # returns the subarray
+            # the subarray
             subarray = self.data[xi_min:xi_max + 1, yi_min:yi_max + 1]
-            return GeoData(subarray, *self.raster_to_projected((xi_min, yi_min)),
-                           self.x_delta, self.y_delta, projection=self.geoprojection)
+            origin = self.raster_to_projected((xi_min, yi_min))
         else:  # our internal data structure is inversed on y-axis
             # get indexes of sub-array
             xi_min, yi_min = self.projected_to_raster((x_min, y_max))
             xi_max, yi_max = self.projected_to_raster((x_max, y_min))
-            # returns the sub-array, inversed on the y-axis
+            # the sub-array, inversed on the y-axis
             subarray = self.data[xi_min:xi_max + 1, yi_min:yi_max + 1][..., ::-1]
-            return GeoData(subarray, *self.raster_to_projected((xi_min, yi_max)),
-                           self.x_delta, -self.y_delta, projection=self.geoprojection)
+            origin = self.raster_to_projected((xi_min, yi_max))
+
+        if out is None:
+            return GeoData(subarray, *origin, self.x_delta, abs(self.y_delta),
+                           projection=self.geoprojection)
+        assert out.cell_width == self.x_delta and out.cell_height == abs(self.y_delta)
+        (xi, yi) = out.array_index(Point(*origin))
+        out.data[xi:xi + subarray.shape[0], yi:yi + subarray.shape[1]] = subarray
+        return out
 
     def raster_to_projected(self, loc):
         """Return the projected location of a pixel point in this tile."""
@@ -338,3 +366,84 @@ class RasterTile:
     def nearest_projected_point(self, loc):
         """Return the (projected) coordinates of the cell center nearest to loc."""
         return self.raster_to_projected(self.projected_to_raster(loc))
+
+
+class TileIndex:
+    """Persistent index of the metadata of the raster files of a folder.
+
+    Reading the metadata of a file requires to open it with GDAL, which is slow for folders with
+    many tiles. The metadata is stored in a file of the folder and only the files that were
+    added or modified since the last scan are opened.
+    """
+
+    INDEX_FILE_NAME = ".fire_rs_tile_index.json"
+    _VERSION = 1
+
+    def __init__(self, folder: str):
+        self.folder = os.path.abspath(folder)
+        self.index_path = os.path.join(self.folder, TileIndex.INDEX_FILE_NAME)
+        self._entries = {}  # type: ty.Dict[str, ty.Dict[str, ty.Any]]
+        try:
+            with open(self.index_path) as index_file:
+                index = json.load(index_file)
+            if index.get('version') == TileIndex._VERSION:
+                self._entries = index['files']
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError):
+            logger.warning("Ignoring unreadable tile index %s", self.index_path)
+
+    def update(self) -> bool:
+        """Refresh the index with the content of the folder.
+
+        :return: True if the index changed
+        """
+        changed = False
+        entries = {}
+        for f in os.scandir(self.folder):
+            if not f.is_file() or f.name.endswith(".aux.xml") or \
+                    f.name.startswith(TileIndex.INDEX_FILE_NAME):
+                continue
+            stat = f.stat()
+            entry = self._entries.get(f.name)
+            if entry is None or entry['mtime'] != stat.st_mtime or entry['size'] != stat.st_size:
+                entry = {'mtime': stat.st_mtime, 'size': stat.st_size}
+                try:
+                    entry['metadata'] = RasterTile.read_metadata(f.path)
+                except (RuntimeError, AttributeError):
+                    logger.exception("Error while reading raster metadata from %s", f.path)
+                    entry['metadata'] = None  # Not a raster, do not try again until it changes
+                changed = True
+            entries[f.name] = entry
+        changed = changed or entries.keys() != self._entries.keys()
+        self._entries = entries
+        return changed
+
+    def save(self):
+        """Write the index to the folder, if it is writable."""
+        tmp_path = None
+        try:
+            # Each writer has its own temporary file, the last one to be renamed wins
+            fd, tmp_path = tempfile.mkstemp(prefix=TileIndex.INDEX_FILE_NAME, suffix=".tmp",
+                                            dir=self.folder)
+            with open(fd, 'w') as index_file:
+                json.dump({'version': TileIndex._VERSION, 'files': self._entries}, index_file)
+            os.replace(tmp_path, self.index_path)
+        except OSError:
+            logger.warning("Unable to save tile index %s", self.index_path)
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def tiles_metadata(self) -> ty.Iterator[ty.Tuple[str, ty.Dict[str, ty.Any]]]:
+        """Iterate over the (path, metadata) of the raster files of the folder."""
+        for name, entry in sorted(self._entries.items()):
+            if entry['metadata'] is not None:
+                yield os.path.join(self.folder, name), entry['metadata']
+
+    @classmethod
+    def load(cls, folder: str) -> 'TileIndex':
+        """Get an up-to-date index of a folder, saving it if it changed."""
+        index = cls(folder)
+        if index.update():
+            index.save()
+        return index
@@ -35,9 +35,9 @@ class ElevationMap(DigitalMap):
 
 class ElevationTile(RasterTile):
 
-    def __init__(self, filename, nodata_fill=None):
+    def __init__(self, filename, nodata_fill=None, metadata=None):
         """Initialise ElevationTile."""
-        super().__init__(filename, [('elevation', 'float64')], nodata_fill)
+        super().__init__(filename, [('elevation', 'float64')], nodata_fill, metadata)
 
     def get_elevation(self, location):
         """Get height of projected location."""
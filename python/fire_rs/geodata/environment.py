@@ -29,6 +29,7 @@ import numpy as np
 
 import fire_rs.firemodel.environment as fire_env
 
+from fire_rs.geodata.basemap import TileIndex
 from fire_rs.geodata.elevation import ElevationMap, ElevationTile
 from fire_rs.geodata.landcover import LandCoverMap, LandCoverTile
 from fire_rs.geodata.wind import WindMap, WindNinjaCLI
@@ -167,30 +168,16 @@ class World:
         self._windninja_domain = domain_scenario
 
     def _load_elevation_tiles(self):
-        for f in os.scandir(self._elevation_path):
-            if f.is_file():
-                if f.name.endswith(".aux.xml"):
-                    continue
-                try:
-                    tile = ElevationTile(f.path)
-                    self._elevation_map.add_tile(tile)
-                except RuntimeError as e:
-                    logger.exception("RuntimeError while loading elevation tile from %s", f.path)
-                except AttributeError as e:
-                    logger.exception("AttributeError while loading elevation tile from %s", f.path)
+        # Files that are not rasters have already been reported and left out by the index
+        index = TileIndex.load(self._elevation_path)
+        self._elevation_map.add_tiles(
+            [ElevationTile(path, metadata=metadata) for path, metadata in index.tiles_metadata()])
 
     def _load_landcover_tiles(self):
-        for f in os.scandir(self._landcover_path):
-            if f.is_file():
-                if f.name.endswith(".aux.xml"):
-                    continue
-                try:
-                    tile = LandCoverTile(f.path)
-                    self._landcover_map.add_tile(tile)
-                except RuntimeError as e:
-                    logger.exception("RuntimeError while loading landcover tile from %s", f.path)
-                except AttributeError as e:
-                    logger.exception("AttributeError while loading landcover tile from %s", f.path)
+        # Files that are not rasters have already been reported and left out by the index
+        index = TileIndex.load(self._landcover_path)
+        self._landcover_map.add_tiles(
+            [LandCoverTile(path, metadata=metadata) for path, metadata in index.tiles_metadata()])
 
     def get_fuel_type(self, position, remap=None) -> 'GeoData':
         """Retrieves the fuel type of a given point/area of the map.
@@ -22,8 +22,9 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import json
+import threading
 from collections import namedtuple
-from functools import reduce
 
 import typing as ty
 import gdal
@@ -110,6 +111,77 @@ class GeoData:
                      projection=projection)
         return gd
 
+    @classmethod
+    def empty(cls, shape, dtype, x_offset, y_offset, cell_width, cell_height,
+              projection: Union[int, str, osr.SpatialReference] = EPSG_RGF93_LAMBERT93,
+              filename: ty.Optional[str] = None) -> 'GeoData':
+        """Create a GeoData whose array is allocated but not initialized.
+
+        If a filename is given, the array is memory-mapped to this file (in numpy .npy format)
+        instead of being held in memory. Its geo-referencing is saved next to it, in
+        filename + '.json', so that it can be reopened with GeoData.open_memmap.
+        """
+        if filename is None:
+            return cls(np.empty(shape, dtype=dtype), x_offset, y_offset, cell_width, cell_height,
+                       projection=projection)
+        array = np.lib.format.open_memmap(filename, mode='w+', dtype=np.dtype(dtype),
+                                          shape=tuple(shape))
+        gd = cls(array, x_offset, y_offset, cell_width, cell_height, projection=projection)
+        with open(filename + '.json', 'w') as header_file:
+            json.dump({'x_offset': float(gd.x_offset), 'y_offset': float(gd.y_offset),
+                       'cell_width': float(gd.cell_width), 'cell_height': float(gd.cell_height),
+                       'projection': gd.projection.ExportToWkt()}, header_file)
+        return gd
+
+    @classmethod
+    def open_memmap(cls, filename: str, mode: str = 'r') -> 'GeoData':
+        """Open a memory-mapped GeoData created by GeoData.empty or GeoData.to_memmap.
+
+        Nothing is loaded in memory: cells are read from the file when they are accessed.
+        """
+        with open(filename + '.json') as header_file:
+            header = json.load(header_file)
+        array = np.load(filename, mmap_mode=mode)
+        return cls(array, header['x_offset'], header['y_offset'], header['cell_width'],
+                   header['cell_height'], projection=header['projection'])
+
+    def to_memmap(self, filename: str) -> 'GeoData':
+        """Copy this GeoData into a memory-mapped file and return the file-backed GeoData."""
+        gd = GeoData.empty(self.data.shape, self.data.dtype, self.x_offset, self.y_offset,
+                           self.cell_width, self.cell_height, projection=self.projection,
+                           filename=filename)
+        gd.data[...] = self.data
+        gd.data.flush()
+        return gd
+
+    @classmethod
+    def mosaic(cls, parts: ty.Sequence['GeoData'], filename: ty.Optional[str] = None) -> 'GeoData':
+        """Assemble GeoData that are windows of the same grid into a single GeoData.
+
+        The parts should cover their bounding box entirely. The result is allocated once
+        (memory-mapped to filename if provided) and each part is copied to its window.
+        Cell sizes may be negative (e.g. north-up rasters), the offset of the result is then the
+        corner of the bounding box with the largest coordinate on this axis.
+        """
+        assert len(parts) > 0
+        first = parts[0]
+        assert all(p.cell_width == first.cell_width and p.cell_height == first.cell_height
+                   for p in parts), "Parts are not on the same grid"
+        # Coordinates of the first and last cells of each part along each axis
+        xs = [x for p in parts
+              for x in (p.x_offset, p.x_offset + (p.data.shape[0] - 1) * p.cell_width)]
+        ys = [y for p in parts
+              for y in (p.y_offset, p.y_offset + (p.data.shape[1] - 1) * p.cell_height)]
+        shape = (int(round((max(xs) - min(xs)) / abs(first.cell_width))) + 1,
+                 int(round((max(ys) - min(ys)) / abs(first.cell_height))) + 1)
+        x_offset = min(xs) if first.cell_width > 0 else max(xs)
+        y_offset = min(ys) if first.cell_height > 0 else max(ys)
+        result = cls.empty(shape, first.data.dtype, x_offset, y_offset, first.cell_width,
+                           first.cell_height, projection=first.projection, filename=filename)
+        for p in parts:
+            result.paste(p)
+        return result
+
     @classmethod
     def zeros_like(cls, other: 'GeoData'):
         return cls(np.zeros_like(other.data), other.x_offset, other.y_offset,
@@ -152,19 +224,20 @@ class GeoData:
         """Data array in display form."""
         return self.data.T[::-1, ...]
 
-    def slice(self, layers: 'Union[List, str]') -> 'GeoData':
-        """Builds a new GeoData with a subset of the layers"""
+    def slice(self, layers: 'Union[List, str]', filename: ty.Optional[str] = None) -> 'GeoData':
+        """Builds a new GeoData with a subset of the layers
+
+        If a filename is given, the new GeoData is memory-mapped to this file."""
         assert len(layers) >= 1
         if isinstance(layers, str):
             layers = [layers]
 
-        if len(layers) == 1:
-            layer = layers[0]
-            t = self.data.dtype.fields[layer][0]  # type of layer
-            return self.clone(data_array=self.data[layer], dtype=[(layer, t)])
-        else:
-            unary_slices = [self.slice([l]) for l in layers]
-            return reduce(lambda x, y: x.combine(y), unary_slices[1:], unary_slices[0])
+        dtype = [(layer, self.data.dtype.fields[layer][0]) for layer in layers]
+        res = GeoData.empty(self.data.shape, dtype, self.x_offset, self.y_offset, self.cell_width,
+                            self.cell_height, projection=self.projection, filename=filename)
+        for layer in layers:
+            res.data[layer] = self.data[layer]
+        return res
 
     def subset(self, area: Area) -> 'GeoData':
         # FIXME: This function does not crop correctly some geodata.
@@ -207,14 +280,52 @@ class GeoData:
         return GeoData(combined_array, self.x_offset, self.y_offset,
                        self.cell_width, self.cell_height, projection=self.projection)
 
-    def combine(self, other: 'GeoData') -> 'GeoData':
+    def combine(self, other: 'GeoData', filename: ty.Optional[str] = None) -> 'GeoData':
+        """Builds a new GeoData with the layers of self and other.
+
+        If a filename is given, the new GeoData is memory-mapped to this file."""
         assert self.data.shape == other.data.shape
         assert self.cell_width == other.cell_width and self.cell_height == other.cell_height
-        combined_array = join_structured_arrays([self.data, other.data])
-        return GeoData(combined_array, self.x_offset, self.y_offset,
-                       self.cell_width, self.cell_height, projection=self.projection)
+        if filename is None:
+            combined_array = join_structured_arrays([self.data, other.data])
+            return GeoData(combined_array, self.x_offset, self.y_offset,
+                           self.cell_width, self.cell_height, projection=self.projection)
+        res = GeoData.empty(self.data.shape, self.data.dtype.descr + other.data.dtype.descr,
+                            self.x_offset, self.y_offset, self.cell_width, self.cell_height,
+                            projection=self.projection, filename=filename)
+        for gd in (self, other):
+            for layer in gd.layers:
+                res.data[layer] = gd.data[layer]
+        return res
+
+    def paste(self, other: 'GeoData'):
+        """Copy the cells of other into the corresponding window of this GeoData.
+
+        other must be on the same grid and entirely contained in this GeoData."""
+        assert self.cell_width == other.cell_width and self.cell_height == other.cell_height
+        (xi, yi) = self.array_index(Point(other.x_offset, other.y_offset))
+        assert 0 <= xi and xi + other.data.shape[0] <= self.data.shape[0]
+        assert 0 <= yi and yi + other.data.shape[1] <= self.data.shape[1]
+        window = self.data[xi:xi + other.data.shape[0], yi:yi + other.data.shape[1]]
+        if other.data.dtype == self.data.dtype:
+            window[...] = other.data
+        else:
+            for layer in other.layers:
+                window[layer] = other.data[layer]
+
+    def iter_windows(self, width: int, height: int) -> ty.Iterator['GeoData']:
+        """Iterate over windows of at most width x height cells covering this GeoData.
+
+        Windows are views on the underlying array: nothing is copied nor loaded in advance, even
+        when the GeoData is memory-mapped."""
+        for xi in range(0, self.data.shape[0], width):
+            for yi in range(0, self.data.shape[1], height):
+                yield GeoData(self.data[xi:xi + width, yi:yi + height],
+                              *self.coordinates(Cell(xi, yi)), self.cell_width, self.cell_height,
+                              projection=self.projection)
 
     def split(self, x_splits: int, y_splits: int) -> List['GeoData']:
+        """Split in x_splits * y_splits GeoData that are views on the array of this one."""
         if x_splits == 1:
             splet = np.split(self.data, y_splits, axis=1)
             curr_y_offset = self.y_offset
@@ -310,23 +421,18 @@ class GeoData:
             plt.show(block=blocking)
         return ax
 
-    def write_to_separate_files(self, parameterized_filename: str):
+    def write_to_separate_files(self, parameterized_filename: str, **kwargs):
         """Writes each layer to a distinct GeoTiff file.
 
-         The filename should contain %s which will replaced by name of each layer."""
+         The filename should contain %s which will replaced by name of each layer.
+         Keyword arguments are passed to write_to_file."""
         assert '%s' in parameterized_filename, 'File name should contain %s which will be replaced by the layer name'
         for layer in self.data.dtype.names:
             file = parameterized_filename % layer
-            self.write_to_file(file, layer)
-
-    def write_to_file(self, filename: str, layer_name: ty.Optional[str] = None,
-                      nodata: ty.Optional[float] = None):
-        """Writes to GeoTiff file.
-
-        If a layer_name is provided, then only the corresponding layer will be written,
-        otherwise the GeoTiff file will contain all layers."""
-        layers = self.data.dtype.names if layer_name is None else [layer_name]
+            self.write_to_file(file, layer, **kwargs)
 
+    def _image_layout(self) -> ty.Tuple[np.ndarray, ty.Tuple[float, ...]]:
+        """Data array and GDAL geotransform of this GeoData in "image" convention."""
         if self.cell_height < 0:
             data = self.data.transpose()  # in "image" files, rows and columns are inverted
             cell_height = self.cell_height
@@ -338,49 +444,96 @@ class GeoData:
             data = self.data.transpose()[::-1, ...]
             cell_height = - self.cell_height
             origin_y = self.y_offset + self.data.shape[1] * self.cell_height - self.cell_height / 2
+        origin_x = self.x_offset - self.cell_width / 2
+        return data, (origin_x, self.cell_width, 0, origin_y, 0, cell_height)
+
+    def write_to_file(self, filename: str, layer_name: ty.Optional[str] = None,
+                      nodata: ty.Optional[float] = None, dtype=np.float64, tiled: bool = False,
+                      block_size: int = 256, compress: ty.Optional[str] = None,
+                      predictor: ty.Optional[int] = None, overviews: ty.Sequence[int] = (),
+                      overview_resampling: str = 'NEAREST', cog: bool = False):
+        """Writes to GeoTiff file.
 
+        If a layer_name is provided, then only the corresponding layer will be written,
+        otherwise the GeoTiff file will contain all layers.
+
+        :param nodata: (Optional) NODATA value of the bands
+        :param dtype: data type of the bands. All the bands of a GeoTiff share the same type, if
+            None the smallest type able to represent all the written layers is used.
+        :param tiled: Store the raster in internal tiles of block_size x block_size pixels
+            instead of strips.
+        :param block_size: Width and height of the tiles (multiple of 16)
+        :param compress: (Optional) Compression algorithm, e.g. 'DEFLATE', 'ZSTD' or 'LZW'
+        :param predictor: Compression predictor. By default, horizontal differencing (2) for
+            integer bands and floating point prediction (3) for real bands.
+        :param overviews: Decimation factors of the overviews to build, e.g. (2, 4, 8)
+        :param overview_resampling: GDAL resampling method used to build the overviews
+        :param cog: Write a Cloud-Optimized GeoTiff: tiled, with overviews (if any) stored before
+            the full resolution data so that windowed reads only fetch the blocks they need.
+        """
+        layers = self.data.dtype.names if layer_name is None else [layer_name]
+        if dtype is None:
+            dtype = np.result_type(*[self.data.dtype.fields[l][0] for l in layers])
+        gdal_type = _gdal_data_type(dtype)
+
+        data, geotransform = self._image_layout()
         cols = data.shape[1]
         rows = data.shape[0]
-        origin_x = self.x_offset - self.cell_width / 2
 
-        driver = gdal.GetDriverByName('GTiff')
-        out_raster = driver.Create(filename, cols, rows, len(layers), gdal.GDT_Float64)
-        out_raster.SetGeoTransform((origin_x, self.cell_width, 0, origin_y, 0, cell_height))
-        # out_raster.SetMetadata({'COMPRESSION': 'LZW', 'INTERLEAVE': 'BAND'}, 'IMAGE_STRUCTURE')
+        options = []
+        if tiled or cog:
+            assert block_size % 16 == 0, "GeoTiff tile size must be a multiple of 16"
+            options += ['TILED=YES', 'BLOCKXSIZE={}'.format(block_size),
+                        'BLOCKYSIZE={}'.format(block_size)]
+        if compress is not None:
+            options.append('COMPRESS={}'.format(compress.upper()))
+            if predictor is None:
+                predictor = 3 if np.issubdtype(dtype, np.floating) else 2
+            options.append('PREDICTOR={}'.format(predictor))
+        if len(layers) > 1:
+            options.append('INTERLEAVE=BAND')
+
+        if cog:
+            # Overviews must be written before the data: build everything in memory and then
+            # let the GeoTiff driver lay out the file.
+            out_raster = gdal.GetDriverByName('MEM').Create('', cols, rows, len(layers), gdal_type)
+        else:
+            out_raster = gdal.GetDriverByName('GTiff').Create(filename, cols, rows, len(layers),
+                                                              gdal_type, options)
+        out_raster.SetGeoTransform(geotransform)
+        out_raster.SetProjection(self.projection.ExportToWkt())
         for i, layer in enumerate(layers):
             outband = out_raster.GetRasterBand(i + 1)
             if nodata is not None:
                 outband.SetNoDataValue(nodata)
-            outband.WriteArray(data[layer])
+            outband.WriteArray(data[layer].astype(_NUMPY_DATA_TYPES[gdal_type], copy=False))
             outband.SetDescription(
                 layer)  # apparently not visible in QGIS, maybe there is a better alternative
-            outband.FlushCache()
-        out_raster.SetProjection(self.projection.ExportToWkt())
+        if overviews:
+            out_raster.BuildOverviews(overview_resampling, list(overviews))
+
+        if cog:
+            cog_raster = gdal.GetDriverByName('GTiff').CreateCopy(
+                filename, out_raster, False, options + ['COPY_SRC_OVERVIEWS=YES'])
+            cog_raster.FlushCache()
+            del cog_raster
+        else:
+            out_raster.FlushCache()
+        del out_raster
 
     def write_to_image_file(self, filename: str, layer_name):
         """Writes to PNG file."""
 
         layers = self.data.dtype.names if layer_name is None else [layer_name]
 
-        if self.cell_height < 0:
-            data = self.data.transpose()  # in "image" files, rows and columns are inverted
-            cell_height = self.cell_height
-            origin_y = self.y_offset - self.cell_height / 2  # + array.shape[1] * pixelHeight
-        else:
-            # workaround a wind ninja bug that does not work with non-negative cell height
-            # hence, we invert our matrix on the y axis to have a negative cell_height
-            data = self.data.transpose()[::-1, ...]
-            cell_height = - self.cell_height
-            origin_y = self.y_offset + self.data.shape[1] * self.cell_height - self.cell_height / 2
-
+        data, geotransform = self._image_layout()
         cols = data.shape[1]
         rows = data.shape[0]
-        origin_x = self.x_offset - self.cell_width / 2
 
         driver_mem = gdal.GetDriverByName('MEM')
 
         mem_raster = driver_mem.Create(filename, cols, rows, len(layers), gdal.GDT_UInt16)
-        mem_raster.SetGeoTransform((origin_x, self.cell_width, 0, origin_y, 0, cell_height))
+        mem_raster.SetGeoTransform(geotransform)
         for i, layer in enumerate(layers):
             outband = mem_raster.GetRasterBand(i + 1)
             outband.WriteArray(data[layer])
@@ -393,29 +546,50 @@ class GeoData:
         driver_png.CreateCopy(filename, mem_raster, True, ["WORLDFILE=YES"])
 
     @classmethod
-    def load_from_file(cls, filename: str):
+    def load_from_file(cls, filename: str, area: ty.Optional[Area] = None,
+                       layers: ty.Optional[ty.Sequence[str]] = None, dtype=np.float64):
+        """Load a GeoData from a raster file.
+
+        :param area: (Optional) Only read the cells of the file whose center is in this area.
+            On tiled files, only the blocks intersecting it are decoded.
+        :param layers: (Optional) Names of the bands to be read. All the bands by default.
+        :param dtype: data type of the loaded layers. If None, the type of each band is kept.
+        """
         handle = gdal.Open(filename)
 
         proj_wkt = handle.GetProjection()
         proj = osr.SpatialReference(wkt=proj_wkt)
 
         geotransform = handle.GetGeoTransform()
+        x_off, y_off = 0, 0
+        x_size, y_size = handle.RasterXSize, handle.RasterYSize
+        if area is not None:
+            x_off, y_off, x_size, y_size = _raster_window(geotransform, x_size, y_size, area)
+            geotransform = (geotransform[0] + x_off * geotransform[1], geotransform[1],
+                            geotransform[2], geotransform[3] + y_off * geotransform[5],
+                            geotransform[4], geotransform[5])
+
         x_delta = geotransform[1]
         y_delta = geotransform[5]
 
         x_orig = geotransform[0] + x_delta / 2
         y_orig = geotransform[3] + y_delta / 2
 
-        layers = []
+        bands = []
         for i in range(handle.RasterCount):
             raster_band = handle.GetRasterBand(i + 1)  # Band indices start at 1
             band_name = raster_band.GetDescription()
             if not band_name:
                 band_name = "band {}".format(i + 1)
-            layer = np.array(raster_band.ReadAsArray(), dtype=[(band_name, np.float64)])
-            layers.append(layer)
+            if layers is None or band_name in layers:
+                band_type = dtype if dtype is not None else _NUMPY_DATA_TYPES[raster_band.DataType]
+                layer = np.array(raster_band.ReadAsArray(x_off, y_off, x_size, y_size),
+                                 dtype=[(band_name, band_type)])
+                bands.append(layer)
+        if not bands:
+            raise ValueError("None of the layers {} is in {}".format(layers, filename))
 
-        array = join_structured_arrays(layers)
+        array = join_structured_arrays(bands)
 
         if y_delta > 0:
             array = array.transpose()  # in "image" files, rows and columns are inverted
@@ -423,7 +597,7 @@ class GeoData:
             # workaround a wind ninja bug that does not work with non-negative cell height
             # hence, we invert our matrix on the y axis to have a negative cell_height
 
-            y_orig = geotransform[3] + handle.RasterYSize * y_delta - y_delta / 2
+            y_orig = geotransform[3] + y_size * y_delta - y_delta / 2
             y_delta = -y_delta
             array = array[..., ::-1].transpose()
 
@@ -431,16 +605,88 @@ class GeoData:
 
 
 class CoordinateTransformation:
-    def __init__(self, from_epsg: int, to_epsg: int):
-        self._s_srs = osr.SpatialReference()
-        self._s_srs.ImportFromEPSG(from_epsg)
-        self._t_srs = osr.SpatialReference()
-        self._t_srs.ImportFromEPSG(to_epsg)
+    """Transformation of coordinates from one coordinate system to another, given by EPSG codes.
+
+    OSR transformation objects are cached by EPSG pair (and by thread, as they cannot be shared
+    among threads), creating several CoordinateTransformation for the same pair is cheap.
+    """
+    _cache = threading.local()
 
-        self._transform = osr.CreateCoordinateTransformation(self._s_srs, self._t_srs)
+    def __init__(self, from_epsg: int, to_epsg: int):
+        self._s_srs, self._t_srs, self._transform = \
+            CoordinateTransformation._cached_transformation(from_epsg, to_epsg)
 
-    def transform(self, x: float, y: float) -> Tuple[float, float]:
-        return self._transform.TransformPoint(x, y)
+    @classmethod
+    def _cached_transformation(cls, from_epsg: int, to_epsg: int):
+        if not hasattr(cls._cache, 'transformations'):
+            cls._cache.transformations = {}
+        if (from_epsg, to_epsg) not in cls._cache.transformations:
+            s_srs = osr.SpatialReference()
+            s_srs.ImportFromEPSG(from_epsg)
+            t_srs = osr.SpatialReference()
+            t_srs.ImportFromEPSG(to_epsg)
+            cls._cache.transformations[from_epsg, to_epsg] = \
+                (s_srs, t_srs, osr.CreateCoordinateTransformation(s_srs, t_srs))
+        return cls._cache.transformations[from_epsg, to_epsg]
+
+    def transform(self, x: float, y: float, z: float = 0.) -> Tuple[float, float, float]:
+        return self._transform.TransformPoint(x, y, z)
+
+    def transform_points(self, x, y, z=None) -> np.ndarray:
+        """Transform a batch of points in a single call.
+
+        :param x: array of x coordinates
+        :param y: array of y coordinates, of the same size
+        :param z: (Optional) array of z coordinates, of the same size
+        :return: (n, 3) array with the transformed x, y and z coordinates
+        """
+        x = np.asarray(x, dtype=np.float64).ravel()
+        y = np.asarray(y, dtype=np.float64).ravel()
+        assert x.shape == y.shape
+        if z is None:
+            points = np.column_stack((x, y))
+        else:
+            points = np.column_stack((x, y, np.asarray(z, dtype=np.float64).ravel()))
+        if len(points) == 0:
+            return np.empty((0, 3))
+        return np.array(self._transform.TransformPoints(points.tolist()), dtype=np.float64)
+
+
+# Raster data types of GDAL and their numpy equivalent
+_NUMPY_DATA_TYPES = {gdal.GDT_Byte: np.uint8, gdal.GDT_UInt16: np.uint16,
+                     gdal.GDT_Int16: np.int16, gdal.GDT_UInt32: np.uint32,
+                     gdal.GDT_Int32: np.int32, gdal.GDT_Float32: np.float32,
+                     gdal.GDT_Float64: np.float64}
+if hasattr(gdal, 'GDT_Int64'):
+    # 64-bit integers are supported since GDAL 3.5
+    _NUMPY_DATA_TYPES.update({gdal.GDT_Int64: np.int64, gdal.GDT_UInt64: np.uint64})
+
+
+def _gdal_data_type(dtype) -> int:
+    """GDAL raster data type corresponding to a numpy type."""
+    dtype = np.dtype(dtype)
+    if dtype == np.bool_:
+        return gdal.GDT_Byte
+    if dtype == np.int8:
+        # There is no signed byte in GDAL
+        return gdal.GDT_Int16
+    for gdal_type, np_type in _NUMPY_DATA_TYPES.items():
+        if dtype == np_type:
+            return gdal_type
+    raise ValueError("Data type {} cannot be written to a raster file".format(dtype))
+
+
+def _raster_window(geotransform, x_size: int, y_size: int, area: Area) -> ty.Tuple[int, int, int, int]:
+    """Pixel window (x_off, y_off, x_size, y_size) of a raster covering the given area."""
+    cols = sorted(((area.xmin - geotransform[0]) / geotransform[1],
+                   (area.xmax - geotransform[0]) / geotransform[1]))
+    rows = sorted(((area.ymin - geotransform[3]) / geotransform[5],
+                   (area.ymax - geotransform[3]) / geotransform[5]))
+    col_min, col_max = max(int(np.floor(cols[0])), 0), min(int(np.floor(cols[1])), x_size - 1)
+    row_min, row_max = max(int(np.floor(rows[0])), 0), min(int(np.floor(rows[1])), y_size - 1)
+    if col_max < col_min or row_max < row_min:
+        raise ValueError("Area {} does not intersect the raster".format(area))
+    return col_min, row_min, col_max - col_min + 1, row_max - row_min + 1
 
 
 def join_structured_arrays(arrays):
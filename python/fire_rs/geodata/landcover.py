@@ -35,9 +35,9 @@ class LandCoverMap(DigitalMap):
 
 class LandCoverTile(RasterTile):
 
-    def __init__(self, filename, nodata_fill=None):
+    def __init__(self, filename, nodata_fill=None, metadata=None):
         """Initialise LandCoverTile."""
-        super().__init__(filename, [('landcover', 'uint8')], nodata_fill)
+        super().__init__(filename, [('landcover', 'uint8')], nodata_fill, metadata)
 
     def get_class(self, location):
         """Get the land cover class of projected location."""
@@ -22,12 +22,16 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import os
+import tempfile
 import unittest
 
 import gdal
 import numpy as np
 
-from fire_rs.geodata.geo_data import GeoData, Area
+from fire_rs.geodata.basemap import RasterTile, TileIndex
+from fire_rs.geodata.geo_data import GeoData, Area, CoordinateTransformation, EPSG_RGF93, \
+    EPSG_RGF93_LAMBERT93
 
 
 class WorldTest(unittest.TestCase):
@@ -68,6 +72,125 @@ class WorldTest(unittest.TestCase):
         res = self.gd.subset(Area(1, 1, 0, 1))
         self.assertEqual(res.data.shape, (1, 2))
 
+    def test_mosaic(self):
+        parts = self.gd.split(2, 2)
+        res = GeoData.mosaic(parts[::-1])
+        np.testing.assert_array_equal(self.gd.data, res.data)
+        self.assertEqual((res.x_offset, res.y_offset), (self.gd.x_offset, self.gd.y_offset))
+
+    def test_iter_windows(self):
+        gd = GeoData(np.arange(5 * 3).reshape((5, 3)), 0, 0, 1, 1)
+        windows = list(gd.iter_windows(2, 2))
+        self.assertEqual(len(windows), 3 * 2)
+        self.assertEqual(sum(w.data.size for w in windows), gd.data.size)
+        np.testing.assert_array_equal(GeoData.mosaic(windows).data, gd.data)
+
+    def test_mosaic_negative_cell_height(self):
+        # north-up raster: y decreases with the row index
+        gd = GeoData(np.arange(5 * 4).reshape((5, 4)), 10, 100, 2, -3)
+        res = GeoData.mosaic(list(gd.iter_windows(2, 3))[::-1])
+        np.testing.assert_array_equal(res.data, gd.data)
+        self.assertEqual((res.x_offset, res.y_offset), (gd.x_offset, gd.y_offset))
+        self.assertEqual((res.cell_width, res.cell_height), (gd.cell_width, gd.cell_height))
+
+
+class RasterFileTest(unittest.TestCase):
+
+    def setUp(self):
+        array = np.zeros((40, 30), dtype=[('elevation', 'float64'), ('fuel', 'uint8')])
+        array['elevation'] = np.arange(40 * 30).reshape((40, 30))
+        array['fuel'] = np.arange(40 * 30).reshape((40, 30)) % 7
+        self.gd = GeoData(array, 100.5, 200.5, 1, 1)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_compressed_round_trip(self):
+        filename = os.path.join(self.tmp_dir.name, "compressed.tif")
+        self.gd.write_to_file(filename, tiled=True, block_size=16, compress='DEFLATE',
+                              overviews=(2, 4), dtype=None)
+        res = GeoData.load_from_file(filename, dtype=None)
+        self.assertEqual(res.data.shape, self.gd.data.shape)
+        self.assertEqual((res.x_offset, res.y_offset), (self.gd.x_offset, self.gd.y_offset))
+        np.testing.assert_array_equal(res.data['elevation'], self.gd.data['elevation'])
+        np.testing.assert_array_equal(res.data['fuel'], self.gd.data['fuel'])
+
+    def test_cog_layer_dtype(self):
+        filename = os.path.join(self.tmp_dir.name, "fuel.tif")
+        self.gd.write_to_file(filename, 'fuel', dtype=None, cog=True, compress='DEFLATE',
+                              overviews=(2,))
+        res = GeoData.load_from_file(filename, dtype=None)
+        self.assertEqual(res.data.dtype['fuel'], np.uint8)
+        np.testing.assert_array_equal(res.data['fuel'], self.gd.data['fuel'])
+
+    def test_int64_round_trip(self):
+        filename = os.path.join(self.tmp_dir.name, "ids.tif")
+        gd = GeoData(np.array(np.arange(40 * 30).reshape((40, 30)) + 2 ** 53 + 1,
+                              dtype=[('id', 'int64')]), 100.5, 200.5, 1, 1)
+        if not hasattr(gdal, 'GDT_Int64'):
+            # Written as floats, the values would be silently rounded
+            with self.assertRaises(ValueError):
+                gd.write_to_file(filename, dtype=None)
+            return
+        gd.write_to_file(filename, dtype=None)
+        res = GeoData.load_from_file(filename, dtype=None)
+        self.assertEqual(res.data.dtype['id'], np.int64)
+        np.testing.assert_array_equal(res.data['id'], gd.data['id'])
+
+    def test_windowed_read(self):
+        filename = os.path.join(self.tmp_dir.name, "window.tif")
+        self.gd.write_to_file(filename, tiled=True, block_size=16)
+        area = Area(110.5, 120.5, 205.5, 215.5)
+        res = GeoData.load_from_file(filename, area=area, layers=['elevation'])
+        self.assertEqual(res.layers, ('elevation',))
+        np.testing.assert_array_equal(res.data['elevation'], self.gd.subset(area).data['elevation'])
+        self.assertEqual((res.x_offset, res.y_offset), (110.5, 205.5))
+
+    def test_memmap(self):
+        filename = os.path.join(self.tmp_dir.name, "raster.npy")
+        self.gd.to_memmap(filename)
+        res = GeoData.open_memmap(filename)
+        self.assertIsInstance(res.data, np.memmap)
+        self.assertEqual((res.x_offset, res.y_offset), (self.gd.x_offset, self.gd.y_offset))
+        np.testing.assert_array_equal(res.slice('fuel').data['fuel'], self.gd.data['fuel'])
+        sub = res.subset(Area(110.5, 120.5, 205.5, 215.5))
+        np.testing.assert_array_equal(sub.data, self.gd.subset(Area(110.5, 120.5, 205.5, 215.5)).data)
+
+    def test_tile_index(self):
+        self.gd.write_to_file(os.path.join(self.tmp_dir.name, "tile.tif"))
+        with open(os.path.join(self.tmp_dir.name, "readme.txt"), 'w') as f:
+            f.write("not a raster")
+        index = TileIndex(self.tmp_dir.name)
+        self.assertTrue(index.update())
+        index.save()
+        tiles = list(index.tiles_metadata())
+        self.assertEqual(len(tiles), 1)
+        self.assertEqual(tiles[0][1], RasterTile.read_metadata(tiles[0][0]))
+        self.assertIn(TileIndex.INDEX_FILE_NAME, os.listdir(self.tmp_dir.name))
+        self.assertFalse([f for f in os.listdir(self.tmp_dir.name) if f.endswith(".tmp")])
+
+        # A new index is loaded from the saved file and does not need to open the rasters again
+        reloaded = TileIndex(self.tmp_dir.name)
+        self.assertFalse(reloaded.update())
+        self.assertEqual(list(reloaded.tiles_metadata()), tiles)
+        tile = RasterTile(tiles[0][0], [('elevation', 'float64'), ('fuel', 'float64')],
+                          metadata=tiles[0][1])
+        self.assertEqual(tile.raster_size.tolist(), [40, 30])
+
+
+class CoordinateTransformationTest(unittest.TestCase):
+
+    def test_batch_transformation(self):
+        tr = CoordinateTransformation(EPSG_RGF93_LAMBERT93, EPSG_RGF93)
+        xs = np.array([480060., 485060., 490060.])
+        ys = np.array([6210074., 6215074., 6220074.])
+        res = tr.transform_points(xs, ys)
+        self.assertEqual(res.shape, (3, 3))
+        for i in range(len(xs)):
+            np.testing.assert_allclose(res[i], tr.transform(xs[i], ys[i]))
+        self.assertEqual(tr.transform_points([], []).shape, (0, 3))
+
 
 if __name__ == '__main__':
     gdal.UseExceptions()
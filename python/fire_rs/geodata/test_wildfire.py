@@ -0,0 +1,208 @@
+# Copyright (c) 2017, CNRS-LAAS
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+#  * Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import unittest
+
+import numpy as np
+
+import fire_rs.rbf
+from fire_rs.geodata.geo_data import GeoData
+from fire_rs.geodata.wildfire import CellTimes, FiremapWarping, Perimeter, WildfireGraph, \
+    interpolate, project_on_fire_front
+
+
+def _neighbor_or(fire_array, x, y, dx, dy, default):
+    if 0 <= x + dx < fire_array.shape[0] and 0 <= y + dy < fire_array.shape[1] and \
+            fire_array[x + dx, y + dy] < np.inf:
+        return fire_array[x + dx, y + dy]
+    return default
+
+
+class WildfireGraphTest(unittest.TestCase):
+    """Compare the vectorized computations with a cell by cell version of the C++ ones."""
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        xs, ys = np.meshgrid(np.arange(20), np.arange(15), indexing='ij')
+        self.fire_array = np.hypot(xs - 7, ys - 4) * 60 + rng.uniform(0, 30, size=xs.shape)
+        self.fire_array[rng.uniform(size=xs.shape) < 0.1] = np.inf
+
+    def test_traversal_end(self):
+        end = WildfireGraph._compute_traversal_end(self.fire_array)
+        for (x, y), ign in np.ndenumerate(self.fire_array):
+            if ign < np.inf:
+                max_neighbor = max(_neighbor_or(self.fire_array, x, y, dx, dy, 0)
+                                   for dx in (-1, 0, 1) for dy in (-1, 0, 1))
+                expected = ign + 180 if max_neighbor <= ign else max_neighbor
+            else:
+                expected = ign
+            self.assertEqual(end[x, y], expected)
+
+    def test_propagation_direction(self):
+        _, _, prop_dir = WildfireGraph._compute_propagation_direction(self.fire_array)
+        for (x, y), ign in np.ndenumerate(self.fire_array):
+            if ign < np.inf:
+                def i(dx, dy):
+                    return _neighbor_or(self.fire_array, x, y, dx, dy, ign)
+
+                delta_x = i(1, -1) + 2 * i(1, 0) + i(1, 1) - i(-1, -1) - 2 * i(-1, 0) - i(-1, 1)
+                delta_y = i(1, 1) + 2 * i(0, 1) + i(-1, 1) - i(1, -1) - 2 * i(0, -1) - i(-1, -1)
+                self.assertAlmostEqual(prop_dir[x, y], np.arctan2(delta_y, delta_x))
+            else:
+                self.assertEqual(prop_dir[x, y], 0.)
+
+    def test_project_on_fire_front(self):
+        xs, ys = np.meshgrid(np.arange(30), np.arange(20), indexing='ij')
+        radius = np.hypot(xs - 12, ys - 9)
+        firemap = GeoData(np.array(radius * 60, dtype=[('ignition', 'float64')]), 0, 0, 1, 1)
+        graph = WildfireGraph(firemap)
+        ignition = graph.geodata.data['ignition']
+        end = graph.geodata.data['ignition_end']
+
+        time = 300.5
+        cells = np.argwhere(radius >= 2)
+        projected = project_on_fire_front(firemap, cells, np.full(len(cells), time))
+        self.assertEqual(np.shape(projected), cells.shape)
+        for cell, cpp_cell in zip(cells, projected):
+            py_cell = graph.find_parent_or_child_of_time(tuple(cell), time)
+            for x, y in (py_cell, cpp_cell):
+                self.assertTrue(ignition[x, y] <= time <= end[x, y])
+            # The Python traversal end is exclusive and the C++ one inclusive
+            if ignition[tuple(cell)] <= time < end[tuple(cell)]:
+                self.assertEqual(tuple(py_cell), tuple(cell))
+                self.assertEqual(tuple(cpp_cell), tuple(cell))
+
+
+class PerimeterTest(unittest.TestCase):
+
+    def test_perimeter(self):
+        xs, ys = np.meshgrid(np.arange(30), np.arange(20), indexing='ij')
+        firemap = GeoData(np.array(np.hypot(xs - 12, ys - 9) * 60, dtype=[('ignition', 'float64')]),
+                          0, 0, 1, 1)
+        perimeter = Perimeter(firemap, 300)
+        self.assertEqual(perimeter.count, 1)
+        self.assertEqual(len(perimeter.cells), np.isfinite(perimeter.array).sum())
+        for (x, y), t in perimeter.cells.items():
+            self.assertEqual(t, firemap.data['ignition'][x, y])
+            self.assertEqual(perimeter.array[x, y], t)
+        np.testing.assert_array_equal(perimeter.cell_times,
+                                      firemap.data['ignition'][perimeter.cell_indices])
+        self.assertTrue(perimeter.area_array[12, 9])
+        self.assertFalse(perimeter.area_array[0, 0])
+
+    def test_area_of_several_fires(self):
+        xs, ys = np.meshgrid(np.arange(40), np.arange(20), indexing='ij')
+        ignition = np.minimum(np.hypot(xs - 8, ys - 9), np.hypot(xs - 30, ys - 9)) * 60
+        firemap = GeoData(np.array(ignition, dtype=[('ignition', 'float64')]), 0, 0, 1, 1)
+        perimeter = Perimeter(firemap, 300)
+        self.assertEqual(perimeter.count, 2)
+        # Cells clearly inside or outside the perimeters
+        np.testing.assert_array_equal(perimeter.area_array[ignition < 240], True)
+        np.testing.assert_array_equal(perimeter.area_array[ignition > 360], False)
+
+    def test_area_with_nan_hole(self):
+        xs, ys = np.meshgrid(np.arange(30), np.arange(20), indexing='ij')
+        ignition = np.hypot(xs - 12, ys - 9) * 60
+        far = ignition > 360
+        ignition[11:14, 8:11] = np.nan
+        firemap = GeoData(np.array(ignition, dtype=[('ignition', 'float64')]), 0, 0, 1, 1)
+        perimeter = Perimeter(firemap, 300)
+        # No garbage polygon from NaN vertices
+        np.testing.assert_array_equal(perimeter.area_array[far], False)
+        self.assertTrue(perimeter.area_array[12, 5])
+
+
+class CellTimesTest(unittest.TestCase):
+
+    def test_from_mapping(self):
+        cells = {(3, 4): 10., (5, 1): 20.}
+        cell_times = CellTimes.from_mapping(cells)
+        self.assertEqual(dict(cell_times), cells)
+        np.testing.assert_array_equal(cell_times.xs, [3, 5])
+        np.testing.assert_array_equal(cell_times.times, [10., 20.])
+        self.assertIs(CellTimes.from_mapping(cell_times), cell_times)
+        self.assertEqual(len(CellTimes.from_mapping({})), 0)
+
+
+class InterpolationTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(1)
+        self.x = rng.uniform(0, 29, size=60)
+        self.y = rng.uniform(0, 19, size=60)
+        self.z = np.hypot(self.x - 10, self.y - 5)
+
+    def test_chunked_is_exact(self):
+        ref = interpolate(self.x, self.y, self.z, (30, 20), chunk_size=30 * 20)
+        res = interpolate(self.x, self.y, self.z, (30, 20), chunk_size=16)
+        np.testing.assert_allclose(res, ref)
+
+    def test_chunked_rbf(self):
+        ref = fire_rs.rbf.Rbf(self.x, self.y, self.z, function='thin_plate', chunk_size=10 ** 6)
+        chunked = fire_rs.rbf.Rbf(self.x, self.y, self.z, function='thin_plate', chunk_size=7,
+                                  n_jobs=3)
+        xi, yi = np.meshgrid(np.arange(30.), np.arange(20.), indexing='ij')
+        np.testing.assert_allclose(chunked(xi, yi), ref(xi, yi))
+
+    def test_scalable_modes(self):
+        res = interpolate(self.x, self.y, self.z, (30, 20), max_centers=20, neighbors=10,
+                          max_distance=3)
+        self.assertEqual(res.shape, (30, 20))
+        observed = np.isfinite(res)
+        self.assertTrue(observed.any())
+        self.assertTrue(np.all(np.abs(res[observed]) < 100))
+
+    def test_max_distance(self):
+        xi, yi = np.meshgrid(np.arange(30), np.arange(20), indexing='ij')
+        dist = np.hypot(xi[..., np.newaxis] - self.x, yi[..., np.newaxis] - self.y).min(axis=-1)
+        self.assertTrue((dist > 3).any())
+        res = interpolate(self.x, self.y, self.z, (30, 20), neighbors=10, max_distance=3)
+        np.testing.assert_array_equal(np.isinf(res), dist > 3)
+        np.testing.assert_array_equal(np.isfinite(res), dist <= 3)
+
+
+class FiremapWarpingTest(unittest.TestCase):
+
+    def test_incremental_warp(self):
+        xs, ys = np.meshgrid(np.arange(80), np.arange(60), indexing='ij')
+        firemap = GeoData(np.array(np.hypot(xs - 40, ys - 30) * 60, dtype=[('ignition', 'float64')]),
+                          0, 0, 1, 1)
+        orig = [(40, 40), (50, 30), (40, 20), (30, 30)]
+        dest = [(40, 42), (52, 30), (40, 19), (29, 30)]
+
+        warping = FiremapWarping(firemap, tile_size=16)
+        first = warping.warp(orig[:3], dest[:3])
+        np.testing.assert_array_equal(warping.warp(orig[:3], dest[:3]).data['ignition'],
+                                      first.data['ignition'])
+        incremental = warping.warp(orig, dest).data['ignition']
+        full = FiremapWarping(firemap, tile_size=16).warp(orig, dest).data['ignition']
+
+        finite = np.isfinite(incremental) & np.isfinite(full)
+        self.assertGreater(finite.sum(), 0.9 * full.size)
+        # Tiles that were not warped again moved less than 'tolerance' pixels
+        np.testing.assert_allclose(incremental[finite], full[finite], atol=60 * 2 * warping.tolerance)
+
+
+if __name__ == '__main__':
+    unittest.main()
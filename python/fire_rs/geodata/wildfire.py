@@ -22,10 +22,12 @@
 #  OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 #  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import collections.abc
 import typing as ty
 
 import cv2
 import numpy as np
+import scipy.spatial
 import skimage.draw
 import skimage.measure
 
@@ -33,6 +35,44 @@ import fire_rs.geodata.geo_data
 import fire_rs.rbf
 
 
+class CellTimes(collections.abc.Mapping):
+    """Read-only {(x, y): time} mapping over arrays of cell indices and times.
+
+    The dict is only built when a cell is looked up."""
+
+    def __init__(self, xs: np.ndarray, ys: np.ndarray, times: np.ndarray):
+        self.xs = xs
+        self.ys = ys
+        self.times = times
+        self._dict = None
+
+    def _as_dict(self) -> ty.Dict[ty.Tuple[int, int], float]:
+        if self._dict is None:
+            self._dict = dict(zip(zip(self.xs.tolist(), self.ys.tolist()), self.times.tolist()))
+        return self._dict
+
+    def __getitem__(self, cell):
+        return self._as_dict()[cell]
+
+    def __iter__(self):
+        return iter(self._as_dict())
+
+    def __len__(self):
+        return len(self.xs)
+
+    def copy(self) -> ty.Dict[ty.Tuple[int, int], float]:
+        return dict(self._as_dict())
+
+    @staticmethod
+    def from_mapping(cells: ty.Mapping[ty.Tuple[int, int], float]) -> 'CellTimes':
+        """View any {(x, y): time} mapping as CellTimes"""
+        if isinstance(cells, CellTimes):
+            return cells
+        indices = np.array(list(cells.keys()), dtype=np.int64).reshape((-1, 2))
+        return CellTimes(indices[:, 0], indices[:, 1],
+                         np.array(list(cells.values()), dtype=np.float64))
+
+
 class Perimeter:
 
     def __init__(self, wildfire: fire_rs.geodata.geo_data.GeoData, threshold: float,
@@ -45,10 +85,6 @@ class Perimeter:
         self._perimeter_array, self._cells, self._contour = _compute_perimeter(
             self._wildfire, self._threshold, layer=self._layer, empty_val=self._empty_val)
 
-        if self._contour:
-            for cont in self._contour:
-                skimage.measure.grid_points_in_poly(self._wildfire.data.shape, cont)
-
         self._perimeter_geodata = None
         self._area_array = None
 
@@ -57,9 +93,19 @@ class Perimeter:
         return self._perimeter_array
 
     @property
-    def cells(self) -> ty.MutableMapping[ty.Tuple[int, int], np.float64]:
+    def cells(self) -> ty.Mapping[ty.Tuple[int, int], float]:
         return self._cells
 
+    @property
+    def cell_indices(self) -> ty.Tuple[np.ndarray, np.ndarray]:
+        """Arrays of the x and y indices of the perimeter cells"""
+        return self._cells.xs, self._cells.ys
+
+    @property
+    def cell_times(self) -> np.ndarray:
+        """Array of the ignition times of the perimeter cells"""
+        return self._cells.times
+
     @property
     def count(self) -> int:
         """Number of indepedent perimeters"""
@@ -74,77 +120,139 @@ class Perimeter:
 
     @property
     def area_array(self):
-        """Mask of cells inside the perimeter"""
-        if self._area_array is None:
-            if self._contour:
-                self._area_array = skimage.measure.grid_points_in_poly(self._wildfire.data.shape,
-                                                                       self._contour[0])
-                if len(self._contour) > 1:
-                    for cont in self._contour[1:]:
-                        self._area_array += skimage.measure.grid_points_in_poly(
-                            self._wildfire.data.shape, cont)
+        """Mask of cells inside the perimeter
+
+        All contours are rasterized at once, areas enclosed by an inner contour (e.g. unburnt
+        islands) are not part of the mask."""
+        if self._area_array is None and self._contour:
+            # Sub-pixel contour coordinates as fixed point numbers, in (column, row) opencv order
+            # Contours running along NaN cells have NaN vertices that cannot be rasterized
+            shift = 8
+            polygons = [np.round(cont[:, ::-1] * (1 << shift)).astype(np.int32)
+                        for cont in self._contour if not np.isnan(cont).any()]
+            mask = np.zeros(self._wildfire.data.shape, dtype=np.uint8)
+            cv2.fillPoly(mask, polygons, 1, lineType=cv2.LINE_8, shift=shift)
+            self._area_array = mask.astype(bool)
         return self._area_array
 
 
-_compute_perimeter_output_type = ty.Tuple[
-    np.ndarray, ty.MutableMapping[ty.Tuple[int, int], np.float64], ty.List[np.ndarray]]
+_compute_perimeter_output_type = ty.Tuple[np.ndarray, CellTimes, ty.List[np.ndarray]]
 
 
 def _compute_perimeter(wildfire: fire_rs.geodata.geo_data.GeoData, threshold: float,
                        layer: str = 'ignition', empty_val=np.inf) -> _compute_perimeter_output_type:
     """Extract the perimeter given by threshold from a fire map."""
 
-    array = np.ones(wildfire.data.shape, dtype=np.float64) * empty_val
-    cells = {}
+    array = np.full(wildfire.data.shape, empty_val, dtype=np.float64)
 
     contours = skimage.measure.find_contours(wildfire.data[layer], threshold)
 
+    rrs, ccs = [], []
     for contour in contours:
         try:
             rr, cc = skimage.draw.polygon_perimeter(contour[..., 0], contour[..., 1],
                                                     shape=wildfire.data.shape, clip=True)
-            # Set perimeter in array format
-            array[rr, cc] = wildfire.data[layer][rr, cc]
-            # Set perimeter in dict format
-            for r, c in zip(rr, cc):
-                cells[r, c] = wildfire.data[layer][r, c]
+            rrs.append(rr)
+            ccs.append(cc)
         except IndexError as e:
             pass # Ignore contour if it contains NaN (polygon_perimeter throws IndexError)
 
-
-    # for contour in contours:
-    #     prev_edge = contour[0]
-    #     for edge in contour[1:]:
-    #         if np.isnan(prev_edge).any() or np.isnan(edge).any():
-    #             continue
-    #         rr, cc = skimage.draw.line(*np.asarray(prev_edge, dtype=int),
-    #                                    *np.asarray(edge, dtype=int))
-    #         # Set perimeter in array format
-    #         array[rr, cc] = wildfire.data[layer][rr, cc]
-    #         # Set perimeter in dict format
-    #         for r, c in zip(rr, cc):
-    #             cells[r, c] = wildfire.data[layer][r, c]
-    #
-    #         prev_edge = edge
-
-    return array, cells, contours
-
-
-def interpolate(x, y, z, shape, function='thin_plate') -> np.ndarray:
-    """RBF interpolation"""
+    if rrs:
+        # Cells shared by several contours are only kept once
+        linear = np.unique(np.ravel_multi_index((np.concatenate(rrs), np.concatenate(ccs)),
+                                                wildfire.data.shape))
+        rr, cc = np.unravel_index(linear, wildfire.data.shape)
+    else:
+        rr, cc = np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    times = wildfire.data[layer][rr, cc]
+    # Set perimeter in array format
+    array[rr, cc] = times
+
+    return array, CellTimes(rr, cc, times), contours
+
+
+def interpolate(x, y, z, shape, function='thin_plate', max_centers: ty.Optional[int] = None,
+                neighbors: ty.Optional[int] = None, max_distance: ty.Optional[float] = None,
+                chunk_size: int = 4096) -> np.ndarray:
+    """RBF interpolation
+
+    By default, a single RBF going through all the (x, y, z) points is evaluated on every cell.
+    The grid is evaluated by blocks of about chunk_size cells, bounding the memory used by the
+    kernel matrices.
+
+    :param max_centers: (Optional) if there are more points, merge the points falling in the same
+        block of a regular grid so that at most max_centers of them remain as RBF centers.
+    :param neighbors: (Optional) local interpolation: each block of cells is interpolated by an RBF
+        built on the 'neighbors' points closest to its center.
+    :param max_distance: (Optional) only interpolate cells closer than max_distance (in cells) to
+        a point. Other cells are set to np.inf.
+    :param chunk_size: Number of cells evaluated at once.
+    """
     # Wildland fire modeling with an Eulerian level set method and automated calibration
     # might give a clue of which kind of kernel function to use
-
-    # default smooth=0 for interpolation
-    interpolator = fire_rs.rbf.Rbf(x, y, z, function=function, smooth=0, cond=10 ** -5)
-
-    xi = np.linspace(0, shape[0] - 1, shape[0])
-    yi = np.linspace(0, shape[1] - 1, shape[1])
-    meshgrid = np.meshgrid(xi, yi, indexing="ij")
-
-    dense_array = interpolator(*[x.flatten() for x in meshgrid])
-
-    return dense_array.reshape(shape[0], shape[1])
+    x = np.asarray(x, dtype=np.float64).ravel()
+    y = np.asarray(y, dtype=np.float64).ravel()
+    z = np.asarray(z, dtype=np.float64).ravel()
+    if max_centers is not None:
+        x, y, z = _thin_points(x, y, z, max_centers)
+
+    xi, yi = np.meshgrid(np.arange(shape[0], dtype=np.float64),
+                         np.arange(shape[1], dtype=np.float64), indexing="ij")
+
+    tree = None
+    if neighbors is not None or max_distance is not None:
+        tree = scipy.spatial.cKDTree(np.column_stack((x, y)))
+    if max_distance is not None:
+        dist, _ = tree.query(np.column_stack((xi.ravel(), yi.ravel())),
+                             distance_upper_bound=max_distance)
+        mask = np.isfinite(dist).reshape(shape[0], shape[1])
+    else:
+        mask = np.ones((shape[0], shape[1]), dtype=bool)
+
+    interpolator = None
+    if neighbors is None:
+        # default smooth=0 for interpolation
+        interpolator = fire_rs.rbf.Rbf(x, y, z, function=function, smooth=0, cond=10 ** -5)
+
+    dense_array = np.full((shape[0], shape[1]), np.inf)
+    block = max(int(np.sqrt(chunk_size)), 1)
+    for bx in range(0, shape[0], block):
+        for by in range(0, shape[1], block):
+            window = (slice(bx, bx + block), slice(by, by + block))
+            m = mask[window]
+            if not m.any():
+                continue
+            if neighbors is not None:
+                center = ((bx + min(bx + block, shape[0]) - 1) / 2,
+                          (by + min(by + block, shape[1]) - 1) / 2)
+                _, idx = tree.query(center, k=min(neighbors, len(z)))
+                idx = np.atleast_1d(idx)
+                interpolator = fire_rs.rbf.Rbf(x[idx], y[idx], z[idx], function=function,
+                                               smooth=0, cond=10 ** -5)
+            dense_block = dense_array[window]
+            dense_block[m] = interpolator(xi[window][m], yi[window][m])
+
+    return dense_array
+
+
+def _thin_points(x: np.ndarray, y: np.ndarray, z: np.ndarray,
+                 max_points: int) -> ty.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Merge the points of each block of a regular grid into their mean.
+
+    The smallest block size leaving at most max_points is used."""
+    if len(z) <= max_points:
+        return x, y, z
+    block = max(x.max() - x.min(), y.max() - y.min(), 1.) / np.sqrt(max_points)
+    while True:
+        bx = np.floor((x - x.min()) / block).astype(np.int64)
+        by = np.floor((y - y.min()) / block).astype(np.int64)
+        _, inverse = np.unique(bx * (by.max() + 1) + by, return_inverse=True)
+        if inverse.max() + 1 <= max_points:
+            break
+        block *= 1.25
+    counts = np.bincount(inverse)
+    return (np.bincount(inverse, x) / counts, np.bincount(inverse, y) / counts,
+            np.bincount(inverse, z) / counts)
 
 
 def rate_of_spread_map(firemap: fire_rs.geodata.geo_data.GeoData, layer="ignition",
@@ -187,65 +295,57 @@ class WildfireGraph:
             self.geodata.data[ignition_layer])
 
     @staticmethod
-    def _compute_propagation_direction(fire_array: np.array):
-        def default_ignition(x, y, dx, dy):
-            if x == 0 and dx < 0:
-                return fire_array[x, y]
-            if x + dx >= fire_array.shape[0]:
-                return fire_array[x, y]
-            if y == 0 and dy < 0:
-                return fire_array[x, y]
-            if y + dy >= fire_array.shape[1]:
-                return fire_array[x, y]
-            if fire_array[x + dx, y + dy] < np.inf:
-                return fire_array[x + dx, y + dy]
-            else:
-                return fire_array[x, y]
-
-        prop_delta_x = np.zeros_like(fire_array, np.int)
-        prop_delta_y = np.zeros_like(fire_array, np.int)
-        prop_dir = np.zeros_like(fire_array)
-
-        for x in range(0, fire_array.shape[0]):
-            for y in range(0, fire_array.shape[1]):
-                if fire_array[x, y] < np.inf:
-                    ign = lambda dx, dy: default_ignition(x, y, dx, dy)
-                    prop_delta_x[x, y] = ign(1, -1) + 2 * ign(1, 0) + ign(1, 1) - ign(-1,
-                                                                                      -1) - 2 * ign(
-                        -1, 0) - ign(-1, 1)
-                    prop_delta_y[x, y] = ign(1, 1) + 2 * ign(0, 1) + ign(-1, 1) - ign(1,
-                                                                                      -1) - 2 * ign(
-                        0, -1) - ign(-1, -1)
-                    prop_dir = np.arctan2(prop_delta_y[x, y], prop_delta_x[x, y])
+    def _neighbors(array: np.ndarray, fill_value: float) -> ty.Iterator[ty.Tuple[int, int, np.ndarray]]:
+        """Iterate over the 8 shifted views (dx, dy, array[x + dx, y + dy]) of an array.
+
+        Neighbors out of the array take the fill_value."""
+        padded = np.full((array.shape[0] + 2, array.shape[1] + 2), fill_value, dtype=array.dtype)
+        padded[1:-1, 1:-1] = array
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                if dx == 0 and dy == 0:
+                    continue
+                yield dx, dy, padded[1 + dx:1 + dx + array.shape[0], 1 + dy:1 + dy + array.shape[1]]
 
+    @staticmethod
+    def _compute_propagation_direction(fire_array: np.array):
+        """Compute the local fire propagation direction of each cell.
+
+        Same as the C++ FireData::compute_propagation_direction: the direction of a Sobel
+        filter on the ignition times, where neighbors that are out of the map or never
+        ignited take the ignition time of the cell. Non-ignited cells have a null direction."""
+        ignited = fire_array < np.inf
+        default = np.where(ignited, fire_array, 0.)
+        kernel_x = {(1, -1): 1, (1, 0): 2, (1, 1): 1, (-1, -1): -1, (-1, 0): -2, (-1, 1): -1}
+        kernel_y = {(1, 1): 1, (0, 1): 2, (-1, 1): 1, (1, -1): -1, (0, -1): -2, (-1, -1): -1}
+
+        prop_delta_x = np.zeros_like(fire_array, dtype=np.float64)
+        prop_delta_y = np.zeros_like(fire_array, dtype=np.float64)
+        for dx, dy, neighbor in WildfireGraph._neighbors(fire_array, np.inf):
+            neighbor = np.where(neighbor < np.inf, neighbor, default)
+            prop_delta_x += kernel_x.get((dx, dy), 0) * neighbor
+            prop_delta_y += kernel_y.get((dx, dy), 0) * neighbor
+
+        prop_delta_x[~ignited] = 0.
+        prop_delta_y[~ignited] = 0.
+        prop_dir = np.arctan2(prop_delta_y, prop_delta_x)
         return prop_delta_x, prop_delta_y, prop_dir
 
     @staticmethod
     def _compute_traversal_end(fire_array: np.ndarray):
         """Compute the ignition end time for each cell.
 
-        The ignition end time is the latest ignition time among all neighbor cells."""
-        end = np.zeros_like(fire_array) * np.inf
-
-        for x in range(0, fire_array.shape[0]):
-            for y in range(0, fire_array.shape[1]):
-                if fire_array[x, y] < np.inf:
-                    max_neighbor = 0.0
-                    for dx in [-1, 0, 1]:
-                        for dy in [-1, 0, 1]:
-                            if (dx == 0 and dy == 0) or (x == 0 and dx < 0) or (
-                                    x + dx >= fire_array.shape[0]) or (y == 0 and dy < 0) or (
-                                    y + dy >= fire_array.shape[1]):
-                                continue
-                            if fire_array[x + dx, y + dy] < np.inf:
-                                max_neighbor = max(max_neighbor, fire_array[x + dx, y + dy])
-                    if max_neighbor <= fire_array[x, y]:
-                        # propagation_border
-                        end[x, y] = fire_array[x, y] + 180  # assume 3 minutes
-                    else:
-                        end[x, y] = max_neighbor
-                else:
-                    end[x, y] = fire_array[x, y]
+        The ignition end time is the latest ignition time among all neighbor cells.
+        Same as the C++ FireData::compute_traversal_ends."""
+        ignited = fire_array < np.inf
+        max_neighbor = np.zeros_like(fire_array, dtype=np.float64)
+        # neighbors out of the map or never ignited are ignored
+        for _, _, neighbor in WildfireGraph._neighbors(np.where(ignited, fire_array, 0.), 0.):
+            np.maximum(max_neighbor, neighbor, out=max_neighbor)
+
+        # propagation border, assume 3 minutes
+        end = np.where(max_neighbor <= fire_array, fire_array + 180, max_neighbor)
+        end[~ignited] = fire_array[~ignited]
         return end
 
     def find_parent_or_child_of_time(self, start_cell: fire_rs.geodata.geo_data.Cell, time: float):
@@ -290,6 +390,25 @@ class WildfireGraph:
         return coord
 
 
+def project_on_fire_front(firemap: fire_rs.geodata.geo_data.GeoData, cells, times,
+                          layer: str = 'ignition') -> np.ndarray:
+    """Find for each cells[i] the closest cell of the fire front at times[i]
+
+    Batch alternative to WildfireGraph.find_parent_or_child_of_time that goes up or down the
+    propagation direction in a single call to the C++ FireData::project_closest_to_fire_front.
+
+    :param cells: array of shape (n, 2) with the cells to be projected
+    :param times: array of shape (n,) with the time of the fire front of each cell
+    :return: array of shape (n, 2) with the projected cells
+    """
+    import fire_rs.uav_planning as up
+    cells = np.asarray(cells, dtype=np.int64).reshape((-1, 2))
+    times = np.asarray(times, dtype=np.float64).ravel()
+    elevation = firemap.clone(fill_value=0., dtype=[('elevation', 'float64')])
+    fire_data = up.FireData(firemap.as_cpp_raster(layer), elevation.as_cpp_raster())
+    return fire_data.project_closest_to_fire_front(cells, times)
+
+
 def warp_firemap(gd: fire_rs.geodata.geo_data.GeoData, orig: ty.Sequence[ty.Tuple[int, int]],
                  dest: ty.Sequence[ty.Tuple[int, int]],
                  layer: str = "ignition"):
@@ -318,3 +437,95 @@ def _warp_image(array: np.ndarray, orig: ty.Sequence[ty.Tuple[int, int]],
     warped = warped * (newarray_max - newarray_min) + newarray_min
     warped = warped.T
     return warped
+
+
+class FiremapWarping:
+    """Incremental thin-plate spline warping of a firemap.
+
+    The correspondences and the pixel mapping of the last warp are kept. When correspondences
+    are added, the new transformation is compared to the previous one on a coarse grid and only
+    the tiles where the mapping moved by more than 'tolerance' pixels are warped again.
+    """
+
+    def __init__(self, firemap: fire_rs.geodata.geo_data.GeoData, layer: str = "ignition",
+                 tile_size: int = 32, tolerance: float = 0.1):
+        self.firemap = firemap
+        self.layer = layer
+        self.tile_size = tile_size
+        self.tolerance = tolerance
+
+        image = firemap[layer].T  # opencv convention on columns and rows is inverted
+        self._image_min = image.min()
+        self._image_max = image.max()
+        self._image = (image - self._image_min) / (self._image_max - self._image_min)
+
+        self._correspondences = []  # type: ty.List[ty.Tuple[ty.Tuple[int, int], ty.Tuple[int, int]]]
+        self._map = None  # type: ty.Optional[np.ndarray]
+        self._warped = None  # type: ty.Optional[np.ndarray]
+
+    def warp(self, orig: ty.Sequence[ty.Tuple[int, int]],
+             dest: ty.Sequence[ty.Tuple[int, int]]) -> fire_rs.geodata.geo_data.GeoData:
+        """Warp the firemap so that the cells in orig are moved to dest.
+
+        If the correspondences extend the ones of the last call, only the affected region is
+        warped again. If they are the same, the last result is returned."""
+        correspondences = [(tuple(o), tuple(d)) for o, d in
+                           zip(np.asarray(orig, dtype=int).reshape(-1, 2).tolist(),
+                               np.asarray(dest, dtype=int).reshape(-1, 2).tolist())]
+        known = set(self._correspondences)
+        if self._warped is None or not known.issubset(correspondences):
+            # first warp or some correspondences were removed
+            self._correspondences = correspondences
+            self._map = None
+        elif len(known) != len(set(correspondences)):
+            self._correspondences += [c for c in correspondences if c not in known]
+        else:
+            return self._as_geodata()
+
+        orig_p = np.array([c[0] for c in self._correspondences], np.int32).reshape(1, -1, 2)
+        dest_p = np.array([c[1] for c in self._correspondences], np.int32).reshape(1, -1, 2)
+        good_matches = [cv2.DMatch(p, p, 0) for p in range(len(self._correspondences))]
+        tps = cv2.createThinPlateSplineShapeTransformer()
+        tps.estimateTransformation(dest_p, orig_p, good_matches)
+
+        rows, cols = self._image.shape
+        if self._map is None:
+            self._map = self._apply(tps, np.arange(rows), np.arange(cols))
+            self._warped = self._remap(self._map)
+        else:
+            step = max(self.tile_size // 4, 1)
+            sample_rows = np.unique(np.r_[np.arange(0, rows, step), rows - 1])
+            sample_cols = np.unique(np.r_[np.arange(0, cols, step), cols - 1])
+            moved = np.abs(self._apply(tps, sample_rows, sample_cols) -
+                           self._map[np.ix_(sample_rows, sample_cols)]).max(axis=-1) > self.tolerance
+            for r in range(0, rows, self.tile_size):
+                r_end = min(r + self.tile_size, rows)
+                r_samples = (sample_rows >= r) & (sample_rows <= r_end)
+                for c in range(0, cols, self.tile_size):
+                    c_end = min(c + self.tile_size, cols)
+                    c_samples = (sample_cols >= c) & (sample_cols <= c_end)
+                    if moved[np.ix_(r_samples, c_samples)].any():
+                        tile_map = self._apply(tps, np.arange(r, r_end), np.arange(c, c_end))
+                        self._map[r:r_end, c:c_end] = tile_map
+                        self._warped[r:r_end, c:c_end] = self._remap(tile_map)
+        return self._as_geodata()
+
+    @staticmethod
+    def _apply(tps, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """Source position (x, y) of each destination pixel of the rows x cols grid.
+
+        This is the mapping used by the warpImage of the OpenCV transformer."""
+        c, r = np.meshgrid(cols, rows)
+        points = np.stack((c.ravel(), r.ravel()), axis=-1).astype(np.float32).reshape(1, -1, 2)
+        _, mapped = tps.applyTransformation(points)
+        return mapped.reshape(len(rows), len(cols), 2)
+
+    def _remap(self, pixel_map: np.ndarray) -> np.ndarray:
+        return cv2.remap(self._image, pixel_map[..., 0], pixel_map[..., 1], cv2.INTER_LINEAR,
+                         borderMode=cv2.BORDER_CONSTANT, borderValue=np.inf)
+
+    def _as_geodata(self) -> fire_rs.geodata.geo_data.GeoData:
+        warped = self._warped * (self._image_max - self._image_min) + self._image_min
+        new_gd = fire_rs.firemodel.propagation.empty_firemap(self.firemap, layer=self.layer)
+        new_gd.data[self.layer] = warped.T
+        return new_gd
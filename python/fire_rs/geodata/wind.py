@@ -127,7 +127,7 @@ class WindMap(DigitalMap):
             dem = base_tile.as_geo_data().split(self.dem_tile_split, 1)[xi].split(
                 1, self.dem_tile_split)[yi]
             assert position in dem
-            dem.write_to_file(dem_file_name)
+            dem.write_to_file(dem_file_name, tiled=True, compress='DEFLATE')
 
         windfile_paths = [os.path.join(self.scenario['output_path'],
                                        '_'.join([tile_name,
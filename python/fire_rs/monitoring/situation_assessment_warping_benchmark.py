@@ -208,7 +208,7 @@ def perform_situation_assessment(fire_prop_env: Environment,
     """Find an interpolation function that reconstructs the evolution of the fire
     given current and historic partial information."""
     c_ass_wf = SituationAssessment.WildfireCurrentFusionAssessment(
-        fire_prop_env, observations_dict,
+        fire_prop_env, observations_dict, predicted_firemap,
         perimeter_time=datetime.datetime.fromtimestamp(desired_perimeter))
     return c_ass_wf
 
@@ -23,6 +23,7 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import abc
+import copy
 import itertools
 import functools
 import json
@@ -38,11 +39,10 @@ import collections
 from collections import namedtuple
 from enum import Enum
 
-from osgeo import osr
-
 import numpy as np
 # import matplotlib.pyplot as plt
 
+import fire_rs.firemodel.calibration
 import fire_rs.firemodel.propagation
 
 import fire_rs.geodata.wildfire
@@ -103,67 +103,139 @@ class SituationAssessment:
     """Evaluate the current state of a wildfire and provide fire perimeter forecasts"""
 
     class ObservedWildfire:
-        """Store an observed wildfire map updatable from different sources"""
+        """Store an observed wildfire map updatable from different sources
+
+        Observations are kept in the ignition layer of a GeoData along with the index of the source
+        of each observed cell, so they can be read back as arrays without going through dicts.
+        """
 
         def __init__(self, elevation: fire_rs.geodata.geo_data.GeoData):
             self._elevation = elevation
-            self._cells = {}
             self._geodata = fire_rs.firemodel.propagation.empty_firemap(self._elevation)
+            # Index in self._source_names of the source of each cell. 0 is an unknown source
+            self._source = np.zeros(self._geodata.data.shape, dtype=np.int16)
+            self._source_names = [None]  # type: ty.List[ty.Optional[str]]
             self.last_updated = datetime.datetime.now()
 
         @property
         def cells(self) -> ty.ItemsView:
-            return self._cells.items()
+            return self.observations.items()
+
+        @property
+        def cell_indices(self) -> ty.Tuple[np.ndarray, np.ndarray]:
+            """(xs, ys) arrays of the observed cells"""
+            return np.nonzero(np.isfinite(self._geodata.data['ignition']))
+
+        @property
+        def cell_times(self) -> np.ndarray:
+            """Observed ignition time of the cells in cell_indices"""
+            return self._geodata.data['ignition'][self.cell_indices]
+
+        @property
+        def cell_sources(self) -> np.ndarray:
+            """Name of the source (None if unknown) of the cells in cell_indices"""
+            return np.array(self._source_names, dtype=object)[self._source[self.cell_indices]]
+
+        @property
+        def observations(self) -> fire_rs.geodata.wildfire.CellTimes:
+            """Observed {(x, y): time} mapping backed by arrays"""
+            xs, ys = self.cell_indices
+            return fire_rs.geodata.wildfire.CellTimes(xs, ys, self._geodata.data['ignition'][xs, ys])
 
         @property
         def geodata(self) -> fire_rs.geodata.geo_data.GeoData:
             return self._geodata.clone()
 
-        def set_point_ignition(self, ig_pt: geo_data.TimedPoint):
+        def snapshot(self) -> 'SituationAssessment.ObservedWildfire':
+            """Independent copy of the current observations"""
+            other = copy.copy(self)
+            other._geodata = self._geodata.clone()
+            other._source = self._source.copy()
+            other._source_names = list(self._source_names)
+            return other
+
+        def set_point_ignition(self, ig_pt: geo_data.TimedPoint, source: ty.Optional[str] = None):
             """Set some position as on fire.
 
             The current wildfire propagator is not reset.
             """
             c = self._geodata.array_index((ig_pt[0], ig_pt[1]))
-            self.set_cell_ignition((c[0], c[1], ig_pt[2]))
+            self.set_cell_ignition((c[0], c[1], ig_pt[2]), source=source)
 
-        def set_cell_ignition(self, ig_cell: ty.Tuple[int, int, float]):
+        def set_cell_ignition(self, ig_cell: ty.Tuple[int, int, float],
+                              source: ty.Optional[str] = None):
             """Set some cell on fire
             :param ig_cell: (x_cell, y_cell, time)
             """
-            c = (ig_cell[0], ig_cell[1])
-            self._cells[c] = ig_cell[2]
-            self._geodata['ignition'][c] = ig_cell[2]
+            self.update_cells([ig_cell[0]], [ig_cell[1]], [ig_cell[2]], source=source)
+
+        def update_cells(self, xs, ys, times, source: ty.Optional[str] = None):
+            """Set several cells on fire at once.
+
+            Later observations of a cell replace the previous ones.
+            :param xs: array of x indices of the cells
+            :param ys: array of y indices of the cells
+            :param times: array of ignition times of the cells
+            :param source: name of the source of the observations (e.g. the UAV)
+            """
+            xs = np.asarray(xs, dtype=np.int64).ravel()
+            ys = np.asarray(ys, dtype=np.int64).ravel()
+            times = np.asarray(times, dtype=np.float64).ravel()
+            assert len(xs) == len(ys) == len(times)
+            self._geodata.data['ignition'][xs, ys] = times
+            self._source[xs, ys] = self._source_index(source)
+            self.last_updated = datetime.datetime.now()
+
+        def update_from_geodata(self, firemap: fire_rs.geodata.geo_data.GeoData,
+                                layer: str = 'ignition', source: ty.Optional[str] = None):
+            """Merge all the finite cells of an observed firemap on the same grid
+
+            :param firemap: observed firemap with the same shape as the observed wildfire
+            :param layer: layer of firemap with the ignition times
+            :param source: name of the source of the observations (e.g. the UAV)
+            """
+            array = firemap.data[layer]
+            assert array.shape == self._geodata.data.shape, "Observed firemap is not on the same grid"
+            observed = np.isfinite(array)
+            self._geodata.data['ignition'][observed] = array[observed]
+            self._source[observed] = self._source_index(source)
             self.last_updated = datetime.datetime.now()
 
         def clear_observation_cell(self, cell: ty.Tuple[int, int]):
             """Clear some cell that was previously set on fire
             :param cell: (x_cell, y_cell)
             """
-            if cell in self._cells:
-                del self._cells[cell]
             self._geodata['ignition'][cell] = np.inf
+            self._source[cell] = 0
             self.last_updated = datetime.datetime.now()
 
+        def _source_index(self, source: ty.Optional[str]) -> int:
+            if source not in self._source_names:
+                self._source_names.append(source)
+            return self._source_names.index(source)
+
     class WildfireCurrentAssessment:
         """Evaluate the current state of a wildfire from observations"""
 
+        # Observations are merged beyond this number to bound the size of the RBF system
+        MAX_RBF_CENTERS = 1000
+
         def __init__(self, environment: fire_rs.firemodel.propagation.Environment,
-                     observations: ty.MutableMapping[ty.Tuple[int, int], float],
+                     observations: ty.Mapping[ty.Tuple[int, int], float],
                      perimeter_time: ty.Optional[datetime.datetime]):
             self._environment = environment
             self._perimeter = None
             self._interpolated = fire_rs.firemodel.propagation.empty_firemap(
                 self._environment.raster)
-            self._observations = observations
+            self._observations = fire_rs.geodata.wildfire.CellTimes.from_mapping(observations)
 
             self.time = perimeter_time
             self._oldest_obs_timestamp = None
             self._newest_obs_timestamp = None
 
             if self._observations:
-                self._oldest_obs_timestamp = min(*self._observations.values(), 2 ** 64 - 1)
-                self._newest_obs_timestamp = max(*self._observations.values(), 0.)
+                self._oldest_obs_timestamp = float(self._observations.times.min())
+                self._newest_obs_timestamp = float(self._observations.times.max())
                 if not perimeter_time:
                     self.time = datetime.datetime.fromtimestamp(self._newest_obs_timestamp)
                 self._interpolate()
@@ -185,8 +257,8 @@ class SituationAssessment:
 
         def _interpolate(self):
             """RBF interpolation"""
-            x, y = list(zip(*self._observations.keys()))
-            z = np.array(list(self._observations.values()))
+            x, y = self._observations.xs, self._observations.ys
+            z = np.array(self._observations.times, dtype=np.float64)
 
             if len(z) > 1:
                 # Normalise
@@ -197,8 +269,9 @@ class SituationAssessment:
                 z /= z_max - z_min
 
                 # Interpolate on normalised ignition time
-                array = fire_rs.geodata.wildfire.interpolate(x, y, z, self._interpolated.data.shape,
-                                                             function='thin_plate')
+                array = fire_rs.geodata.wildfire.interpolate(
+                    x, y, z, self._interpolated.data.shape, function='thin_plate',
+                    max_centers=self.MAX_RBF_CENTERS)
 
                 # Denormalise
                 array *= z_max - z_min
@@ -228,25 +301,31 @@ class SituationAssessment:
         """Evaluate the current state of a wildfire by fusing a forecast with actual observations"""
 
         def __init__(self, environment: fire_rs.firemodel.propagation.Environment,
-                     observations: ty.MutableMapping[ty.Tuple[int, int], float],
+                     observations: ty.Mapping[ty.Tuple[int, int], float],
                      predicted_firemap: fire_rs.geodata.geo_data.GeoData,
-                     perimeter_time: ty.Optional[datetime.datetime]):
+                     perimeter_time: ty.Optional[datetime.datetime],
+                     warping: ty.Optional[fire_rs.geodata.wildfire.FiremapWarping] = None):
+            """
+            :param warping: warping of a previous assessment of the same predicted_firemap. When
+                given, only the regions affected by the new observations are warped again.
+            """
             self._environment = environment
             self._predicted_firemap = predicted_firemap
+            if warping is None or warping.firemap is not predicted_firemap:
+                warping = fire_rs.geodata.wildfire.FiremapWarping(predicted_firemap)
+            self._warping_transform = warping
             self._perimeter = None
             self._assessment = fire_rs.firemodel.propagation.empty_firemap(
                 self._environment.raster)
-            self._observations = observations
-
-            self._assessment_debug_data
+            self._observations = fire_rs.geodata.wildfire.CellTimes.from_mapping(observations)
 
             self.time = perimeter_time
             self._oldest_obs_timestamp = None
             self._newest_obs_timestamp = None
 
             if self._observations:
-                self._oldest_obs_timestamp = min(*self._observations.values(), 2 ** 64 - 1)
-                self._newest_obs_timestamp = max(*self._observations.values(), 0.)
+                self._oldest_obs_timestamp = float(self._observations.times.min())
+                self._newest_obs_timestamp = float(self._observations.times.max())
                 if not perimeter_time:
                     self.time = datetime.datetime.fromtimestamp(self._newest_obs_timestamp)
                 self._warping()
@@ -260,6 +339,11 @@ class SituationAssessment:
             """Interpolated Wildfire map"""
             return self._assessment
 
+        @property
+        def warping(self) -> fire_rs.geodata.wildfire.FiremapWarping:
+            """Warping transform, to be reused by the next assessment of the same forecast"""
+            return self._warping_transform
+
         @property
         def perimeter(self) -> ty.Optional[fire_rs.geodata.wildfire.Perimeter]:
             if not self._perimeter:
@@ -271,13 +355,11 @@ class SituationAssessment:
 
             # Find cell in the predited wildfire map with the same ignition time as in the
             # observed cells
-            wg = fire_rs.geodata.wildfire.WildfireGraph(self._predicted_firemap)
-            corresponding_cells_in_forecast = [wg.find_parent_or_child_of_time(
-                cell, time) for cell, time in self._observations.items()]
-
-            observed_cell_list = list(self._observations.keys())
-            warped_map = fire_rs.geodata.wildfire.warp_firemap(
-                self._predicted_firemap, corresponding_cells_in_forecast, observed_cell_list)
+            observed_cell_list = np.stack((self._observations.xs, self._observations.ys), axis=-1)
+            corresponding_cells_in_forecast = fire_rs.geodata.wildfire.project_on_fire_front(
+                self._predicted_firemap, observed_cell_list, self._observations.times)
+            warped_map = self._warping_transform.warp(corresponding_cells_in_forecast,
+                                                      observed_cell_list)
 
             self._assessment.data["ignition"] = warped_map.data["ignition"]
 
@@ -297,7 +379,16 @@ class SituationAssessment:
                      perimeter: ty.Optional[fire_rs.geodata.wildfire.Perimeter],
                      pending_ignitions: ty.MutableMapping[float, ty.Tuple[int, int]],
                      current_firemap: fire_rs.geodata.geo_data.GeoData,
-                     until: datetime.datetime):
+                     until: datetime.datetime, step: ty.Optional[datetime.timedelta] = None,
+                     on_milestone: ty.Optional[ty.Callable[
+                         [datetime.datetime, fire_rs.geodata.geo_data.GeoData], None]] = None,
+                     start: ty.Optional[datetime.datetime] = None):
+            """
+            :param step: when given with on_milestone, time between two partial firemaps
+            :param on_milestone: called with each milestone and the firemap up to it while the
+                propagation goes on
+            :param start: the first milestone is one step after this time. Defaults to now
+            """
             self._environment = environment
             self._perimeter = perimeter
             self._pending_ignitions = pending_ignitions
@@ -308,9 +399,14 @@ class SituationAssessment:
             self.until = until
             self.time = datetime.datetime.now()
             if self._perimeter or self._pending_ignitions:
-                self._assess_until(self.until)
-
-        def _assess_until(self, until: datetime.datetime):
+                self._assess_until(self.until, step=step, on_milestone=on_milestone,
+                                   start=start if start is not None else self.time)
+
+        def _assess_until(self, until: datetime.datetime,
+                          step: ty.Optional[datetime.timedelta] = None,
+                          on_milestone: ty.Optional[ty.Callable[
+                              [datetime.datetime, fire_rs.geodata.geo_data.GeoData], None]] = None,
+                          start: ty.Optional[datetime.datetime] = None):
             """Compute an expected wildfire up to some horizon"""
             if self._perimeter:
                 self._pending_ignitions = {**self._pending_ignitions, **self._perimeter.cells}
@@ -330,7 +426,14 @@ class SituationAssessment:
             for k, v in self._pending_ignitions.items():
                 fireprop.set_ignition_cell((k[0], k[1], v))
 
-            fireprop.propagate(until.timestamp())
+            if step is not None and on_milestone is not None:
+                for milestone, partial in fireprop.propagate_by_steps(
+                        until.timestamp(), step.total_seconds(),
+                        start=start.timestamp() if start is not None else None):
+                    partial.data["ignition"][mask] = self._current_firemap["ignition"][mask]
+                    on_milestone(datetime.datetime.fromtimestamp(milestone), partial)
+            else:
+                fireprop.propagate(until.timestamp())
 
             # remove pending ignitions
             self._pending_ignitions = {}
@@ -371,7 +474,7 @@ class SituationAssessment:
 
         self._observed_wildfire = SituationAssessment.ObservedWildfire(self._environment.raster)
         self._wildfire_current_assessment = SituationAssessment.WildfireCurrentAssessment(
-            self._environment, dict(self._observed_wildfire.cells), datetime.datetime.now())
+            self._environment, self._observed_wildfire.observations, datetime.datetime.now())
         self._wildfire_future_propagation = SituationAssessment.WildfireFuturePropagation(
             self._environment, None, {},
             fire_rs.firemodel.propagation.empty_firemap(self._environment.raster),
@@ -420,35 +523,87 @@ class SituationAssessment:
         """Elevation map timestamp"""
         return self._elevation_timestamp
 
-    def assess_current(self, time: ty.Optional[datetime.datetime] = None):
-        """Interpolate observed firemap"""
+    def assess_current(self, time: ty.Optional[datetime.datetime] = None,
+                       observed: ty.Optional['SituationAssessment.ObservedWildfire'] = None,
+                       fusion: bool = False):
+        """Interpolate observed firemap
+
+        :param time: time of the assessed perimeter. Time of the newest observation by default
+        :param observed: snapshot of the observed wildfire to be used instead of the live one
+        :param fusion: if set and a prediction is available, fuse the observations with the
+            predicted firemap instead of interpolating them. Successive fusions on the same
+            prediction reuse the warping of the previous one.
+        """
+        if observed is None:
+            observed = self._observed_wildfire
         if time is None:
             self.logger.info("Assessment of current wildfire state now")
         else:
             self.logger.info("Assessment of current wildfire state at time %s", str(time))
+        predicted = self._wildfire_future_propagation.geodata
         try:
-            self._wildfire_current_assessment = SituationAssessment.WildfireCurrentAssessment(
-                self._environment, dict(self._observed_wildfire.cells), perimeter_time=time)
+            if fusion and np.isfinite(predicted.data["ignition"]).any():
+                previous = self._wildfire_current_assessment
+                warping = previous.warping if isinstance(
+                    previous, SituationAssessment.WildfireCurrentFusionAssessment) else None
+                self._wildfire_current_assessment = \
+                    SituationAssessment.WildfireCurrentFusionAssessment(
+                        self._environment, observed.observations, predicted,
+                        perimeter_time=time, warping=warping)
+            else:
+                self._wildfire_current_assessment = \
+                    SituationAssessment.WildfireCurrentAssessment(
+                        self._environment, observed.observations, perimeter_time=time)
         except IndexError as e:
             self.logger.warning(e)
             self.logger.warning("Cannot make assessment")
             self._wildfire_current_assessment = None
 
-    def assess_until(self, until: datetime.datetime):
-        """Compute an expected wildfire simulation from initial observations."""
+    def calibrate(self, observed: ty.Optional['SituationAssessment.ObservedWildfire'] = None,
+                  n_jobs: int = 1) -> ty.Optional[fire_rs.firemodel.calibration.Calibration]:
+        """Fit the wind factor, moisture scenario and rate of spread scaling of the environment
+        to the observed ignition times. Following future assessments use them.
+
+        :param observed: snapshot of the observed wildfire to be used instead of the live one
+        :param n_jobs: number of calibration candidates evaluated in parallel
+        """
+        if observed is None:
+            observed = self._observed_wildfire
+        calibration = fire_rs.firemodel.calibration.calibrate(
+            self._environment, observed.observations, n_jobs=n_jobs)
+        if calibration is not None:
+            self.logger.info("Fire spread calibration: %s", str(calibration))
+            calibration.apply(self._environment)
+        return calibration
+
+    def assess_until(self, until: datetime.datetime,
+                     observed: ty.Optional['SituationAssessment.ObservedWildfire'] = None,
+                     step: ty.Optional[datetime.timedelta] = None,
+                     on_milestone: ty.Optional[ty.Callable[
+                         [datetime.datetime, fire_rs.geodata.geo_data.GeoData], None]] = None,
+                     start: ty.Optional[datetime.datetime] = None):
+        """Compute an expected wildfire simulation from initial observations.
+
+        :param until: end of the simulation
+        :param observed: snapshot of the observed wildfire to be used instead of the live one
+        :param step: time between two partial firemaps given to on_milestone
+        :param on_milestone: called with each milestone and the predicted firemap up to it
+        :param start: the first milestone is one step after this time. Defaults to now
+        """
+        if observed is None:
+            observed = self._observed_wildfire
         if self._wildfire_current_assessment is not None:
             self.logger.info("Assessment of future wildfire state from %s until %s",
                              str(self._wildfire_current_assessment.time), str(until))
             self._wildfire_future_propagation = SituationAssessment.WildfireFuturePropagation(
                 self._environment, self._wildfire_current_assessment.perimeter, {},
-                self._wildfire_current_assessment.geodata, until)
+                self._wildfire_current_assessment.geodata, until, step=step,
+                on_milestone=on_milestone, start=start)
         else:
             self.logger.info("Assessment of future wildfire state from until %s", str(until))
-            if not self._observed_wildfire.cells:
-                pass
             self._wildfire_future_propagation = SituationAssessment.WildfireFuturePropagation(
-                self._environment, None, dict(self._observed_wildfire.cells),
-                self._observed_wildfire.geodata, until)
+                self._environment, None, observed.observations, observed.geodata, until,
+                step=step, on_milestone=on_milestone, start=start)
 
 
 class ObservationPlanning:
@@ -534,11 +689,21 @@ class ObservationPlanning:
         self._current_planner = planning.Planner(the_plan, {})
 
     def compute_plan(self, planning_duration, vns_conf_name: str, after_time=.0,
-                     frozen_trajs=[]) -> planning.Plan:
-        """Execute the VNS planner for the current plan and return the improved one"""
+                     frozen_trajs=[], on_new_best: ty.Optional[
+                ty.Callable[[planning.Plan], None]] = None) -> planning.Plan:
+        """Execute the VNS planner for the current plan and return the improved one
+
+        :param on_new_best: function called with each new best plan while the planner runs
+        """
         self._current_planner.vns_conf = self._vns_conf_db[vns_conf_name]
         return self._current_planner.compute_plan(planning_duration, after_time,
-                                                  frozen_trajs).final_plan()
+                                                  frozen_trajs,
+                                                  on_new_best=on_new_best).final_plan()
+
+    def cancel_planning(self):
+        """Stop the running planner, which returns the best plan found so far"""
+        if self._current_planner is not None:
+            self._current_planner.cancel()
 
     # class SuperSAOP:
     #     """Supervise a wildifre monitoring mission"""
@@ -746,21 +911,6 @@ class ObservationPlanning:
     #
 
 
-class _CoordinateTransformation:
-
-    def __init__(self, src: int, dst: int):
-        source = osr.SpatialReference()
-        source.ImportFromEPSG(src)
-
-        target = osr.SpatialReference()
-        target.ImportFromEPSG(dst)
-
-        self._transform = osr.CoordinateTransformation(source, target)
-
-    def transform(self, *args) -> ty.Tuple[float, float, float]:
-        return self._transform.TransformPoint(*args)
-
-
 class NeptusBridge:
     """Communicate with the UAV ground control software.
 
@@ -798,7 +948,8 @@ class NeptusBridge:
 
         self.set_coordinate_system(self._projected_cs_epsg)
 
-        self._coor_tran = _CoordinateTransformation(self._geodetic_cs_epsg, self._projected_cs_epsg)
+        self._coor_tran = geo_data.CoordinateTransformation(self._geodetic_cs_epsg,
+                                                           self._projected_cs_epsg)
 
         self.t_imc = threading.Thread(target=self.imccomm.run, daemon=False)
         self.t_gcs = threading.Thread(target=self._create_gcs, daemon=False)
@@ -826,7 +977,8 @@ class NeptusBridge:
             self._projected_cs_epsg = projected_cs
             self._geodetic_cs_epsg = geo_data.EPSG_WGS84
 
-        self._coor_tran = _CoordinateTransformation(self._geodetic_cs_epsg, self._projected_cs_epsg)
+        self._coor_tran = geo_data.CoordinateTransformation(self._geodetic_cs_epsg,
+                                                           self._projected_cs_epsg)
 
     def _create_gcs(self):
         """Create GCS object of this class.
@@ -0,0 +1,76 @@
+# Copyright (c) 2017, CNRS-LAAS
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+#  * Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import logging
+import unittest
+
+import numpy as np
+
+import fire_rs.firemodel.propagation as propagation
+from fire_rs.geodata.geo_data import TimedPoint
+from fire_rs.monitoring.supersaop import SituationAssessment
+
+
+class TestSituationAssessmentFusion(unittest.TestCase):
+
+    def setUp(self):
+        self.test_area = [[480060.0, 485060.0], [6210074.0, 6215074.0]]
+        self.sa = SituationAssessment(self.test_area, logging.getLogger(__name__))
+        self.predicted = propagation.propagate_from_points(
+            self.sa._environment, [TimedPoint(480060 + 800, 6210074 + 2500, 0)],
+            until=3 * 3600).ignitions()
+        self.sa.predicted_wildfire.geodata = self.predicted
+
+        # Observed cells are on the predicted fire front, a bit ahead of time
+        ignition = self.predicted.data["ignition"]
+        xs, ys = np.nonzero((ignition > 3000) & (ignition < 3600))
+        self.xs, self.ys = xs[::max(len(xs) // 10, 1)], ys[::max(len(ys) // 10, 1)]
+        self.times = ignition[self.xs, self.ys] - 300
+
+    def test_fusion_reuses_warping(self):
+        self.sa.observed_wildfire.update_cells(self.xs[:5], self.ys[:5], self.times[:5])
+        self.sa.assess_current(fusion=True)
+        first = self.sa.wildfire
+        self.assertIsInstance(first, SituationAssessment.WildfireCurrentFusionAssessment)
+
+        # Same prediction: the warping is updated with the new observations
+        self.sa.observed_wildfire.update_cells(self.xs[5:], self.ys[5:], self.times[5:])
+        self.sa.assess_current(fusion=True)
+        second = self.sa.wildfire
+        self.assertIsNot(second, first)
+        self.assertIs(second.warping, first.warping)
+
+        # New prediction: a new warping is made
+        self.sa.predicted_wildfire.geodata = self.predicted.clone()
+        self.sa.assess_current(fusion=True)
+        self.assertIsNot(self.sa.wildfire.warping, first.warping)
+
+    def test_interpolation_by_default(self):
+        self.sa.observed_wildfire.update_cells(self.xs, self.ys, self.times)
+        self.sa.assess_current()
+        self.assertIsInstance(self.sa.wildfire, SituationAssessment.WildfireCurrentAssessment)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -259,23 +259,24 @@ def run_benchmark(scenario: Scenario, save_directory: str, instance_name: str,
         raster_data_dir = os.path.join(save_directory, instance_name + "_data")
         if not os.path.exists(raster_data_dir):
             os.makedirs(raster_data_dir)
+        raster_options = {'tiled': True, 'compress': 'DEFLATE'}
         env.raster.write_to_file(os.path.join(raster_data_dir, ".".join(
-            ("_".join((instance_name, "elevation_planning")), 'tif'))), 'elevation_planning')
+            ("_".join((instance_name, "elevation_planning")), 'tif'))), 'elevation_planning', **raster_options)
         env.raster.write_to_file(os.path.join(raster_data_dir, ".".join(
-            ("_".join((instance_name, "wind_velocity")), 'tif'))), 'wind_velocity')
+            ("_".join((instance_name, "wind_velocity")), 'tif'))), 'wind_velocity', **raster_options)
         env.raster.write_to_file(os.path.join(raster_data_dir, ".".join(
-            ("_".join((instance_name, "wind_angle")), 'tif'))), 'wind_angle')
+            ("_".join((instance_name, "wind_angle")), 'tif'))), 'wind_angle', **raster_options)
         prop.ignitions().write_to_file(
             os.path.join(raster_data_dir, ".".join(("_".join((instance_name, "ignition")), 'tif'))),
-            'ignition', nodata=np.inf)
+            'ignition', nodata=np.inf, **raster_options)
         u_initial_map = GeoData.from_cpp_raster(initial_plan.utility_map(), "utility",
                                                 projection=utility.projection)
         u_initial_map.write_to_file(os.path.join(raster_data_dir, ".".join(
-            ("_".join((instance_name, "utility_initial")), 'tif'))), 'utility')
+            ("_".join((instance_name, "utility_initial")), 'tif'))), 'utility', **raster_options)
         u_final_map = GeoData.from_cpp_raster(final_plan.utility_map(), "utility",
                                               projection=utility.projection)
         u_final_map.write_to_file(os.path.join(raster_data_dir, ".".join(
-            ("_".join((instance_name, "utility_final")), 'tif'))), 'utility')
+            ("_".join((instance_name, "utility_final")), 'tif'))), 'utility', **raster_options)
 
     # print([o.as_tuple() for o in final_plan.observations()])
 
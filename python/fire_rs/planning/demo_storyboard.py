@@ -163,13 +163,13 @@ if __name__ == '__main__':
 
     import os
 
-    for i in range(len(sr_1.intermediate_plans)):
+    for i in range(sr_1.history_size()):
         int_gdd = fire_rs.geodata.display.GeoDataDisplay.pyplot_figure(
             env.raster.combine(fire1), frame=(0, 0))
         int_gdd.add_extension(TrajectoryDisplayExtension, (None,), {})
         # int_gdd.draw_elevation_shade()
         int_gdd.draw_ignition_contour()
-        plot_plan_trajectories(sr_1.intermediate_plans[i], int_gdd, trajectories=slice(None),
+        plot_plan_trajectories(sr_1.plan(i), int_gdd, trajectories=slice(None),
                                colors=["blue", "darkgreen"],
                                layers=["bases", "arrows", "trajectory_solid"])
 
@@ -242,6 +242,8 @@ class Planner:
         self.save_improvements = False
         self.save_every = 0
 
+        self._search_control = None  # type: ty.Optional[up.SearchControl]
+
     def update_fire_data(self, fire_map: GeoData, elevation_map: GeoData,
                          fire_map_layer: str = 'ignition', elevation_map_layer: str = 'elevation'):
         """Update wildfire and elevation maps of the current plan"""
@@ -249,17 +251,48 @@ class Planner:
             make_fire_data(fire_map, elevation_map, fire_map_layer, elevation_map_layer))
 
     def compute_plan(self, planning_duration: float = None, after_time=.0,
-                     frozen_trajectories: ty.Sequence[str] = ()) -> up.SearchResult:
-        """Improve the current plan using a VNS planner"""
+                     frozen_trajectories: ty.Sequence[str] = (), deadline: ty.Optional[float] = None,
+                     on_new_best: ty.Optional[ty.Callable[[Plan], None]] = None) -> up.SearchResult:
+        """Improve the current plan using a VNS planner
+
+        :param planning_duration: wall-clock time budget of the search, in seconds
+        :param deadline: stop the search after this many seconds, whatever the planning duration
+        :param on_new_best: function called with each new best plan while the search runs.
+            It is called from the planner threads.
+        """
         planning_conf = SAOPPlannerConf(self.vns_conf, planning_duration, self.save_improvements,
                                         self.save_every)
+        control = up.SearchControl()
+        if deadline is not None:
+            control.set_deadline(deadline)
+        if on_new_best is not None:
+            control.on_new_best(on_new_best)
+        self._search_control = control
 
         # Call the C++ library that calculates the plan
-        res = up.plan_vns(self.current_plan, json.dumps(dict(planning_conf)), after_time,
-                          frozen_trajectories)
+        try:
+            res = up.plan_vns(self.current_plan, json.dumps(dict(planning_conf)), after_time,
+                              frozen_trajectories, control)
+        finally:
+            self._search_control = None
         self.current_plan = res.final_plan()
         return res
 
+    def cancel(self):
+        """Stop the running search, if any. compute_plan then returns with the best plan found so far.
+
+        To be called from another thread than the one running compute_plan."""
+        control = self._search_control
+        if control is not None:
+            control.cancel()
+
+    def best_plan(self) -> ty.Optional[Plan]:
+        """Best plan found so far by the running search, or None if no search is running"""
+        control = self._search_control
+        if control is not None:
+            return control.best_plan()
+        return None
+
 
 if __name__ == "__main__":
     tc = TrajectoryConfig("name", UAVModels.x8("02"),
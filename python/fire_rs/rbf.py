@@ -68,6 +68,7 @@ OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 from __future__ import division, print_function, absolute_import
 
+import concurrent.futures
 import sys
 import numpy as np
 
@@ -125,6 +126,16 @@ class Rbf(object):
         which is called with ``x1 = x1[ndims, newaxis, :]`` and
         ``x2 = x2[ndims, : ,newaxis]`` such that the result is a matrix of the
         distances from each point in ``x1`` to each point in ``x2``.
+    chunk_size : int, optional
+        Number of points evaluated at once when calling the interpolator.
+        By default, it is derived from ``memory_budget``.
+    memory_budget : int, optional
+        Approximate memory, in bytes, used by the distance and kernel
+        matrices when calling the interpolator (default 256 MiB).
+    n_jobs : int, optional
+        Number of threads evaluating chunks concurrently when calling the
+        interpolator (default 1). NumPy releases the GIL in the heavy
+        operations.
 
     Examples
     --------
@@ -235,6 +246,9 @@ class Rbf(object):
 
         self.function = kwargs.pop('function', 'multiquadric')
         self.cond = kwargs.pop('cond', 10**-5)
+        self.chunk_size = kwargs.pop('chunk_size', None)
+        self.memory_budget = kwargs.pop('memory_budget', 2**28)
+        self.n_jobs = kwargs.pop('n_jobs', 1)
 
         # attach anything left in kwargs to self
         #  for use by any user-callable function or
@@ -266,5 +280,25 @@ class Rbf(object):
             raise ValueError("Array lengths must be equal")
         shp = args[0].shape
         xa = np.asarray([a.flatten() for a in args], dtype=np.float_)
-        r = self._call_norm(xa, self.xi)
-        return np.dot(self._function(r), self.nodes).reshape(shp)
+        n = xa.shape[-1]
+
+        chunk_size = self.chunk_size
+        if chunk_size is None:
+            # differences along each dimension, their squares, distances and kernel values
+            bytes_per_point = 8 * self.N * (2 * xa.shape[0] + 2) * max(self.n_jobs, 1)
+            chunk_size = max(int(self.memory_budget // bytes_per_point), 1)
+
+        result = np.empty(n, dtype=np.result_type(self.nodes, np.float_))
+
+        def evaluate(start):
+            r = self._call_norm(xa[:, start:start + chunk_size], self.xi)
+            result[start:start + chunk_size] = np.dot(self._function(r), self.nodes)
+
+        starts = range(0, n, chunk_size)
+        if self.n_jobs > 1 and len(starts) > 1:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.n_jobs) as executor:
+                list(executor.map(evaluate, starts))
+        else:
+            for start in starts:
+                evaluate(start)
+        return result.reshape(shp)
@@ -128,23 +128,20 @@ class CCUBridgeNode:
     def on_wildifre_prediction(self, msg: PredictedWildfireMap):
         def create_drawable_contour(f_map: geo_data.GeoData, time_sec: float,
                                     color: ty.Tuple[int, int, int], one_out_of:int=1):
-            cur_perimeter = _compute_perimeter(firemap, time_sec)
-            count = 0
+            cur_perimeter = _compute_perimeter(f_map, time_sec)
             if cur_perimeter[1]:  # cells
-                coor_tran = geo_data.CoordinateTransformation(firemap.projection_epsg,
-                                                              geo_data.EPSG_WGS84)
-                polygon = []
-                for cell in cur_perimeter[2][0]:
-                    if count % one_out_of:
-                        continue
-                    if not np.isnan(cell[0]) and not np.isnan(cell[1]):
-                        pcs_point = firemap.coordinates(cell)
-                        gcs_point = coor_tran.transform(*pcs_point)
-                        polygon.append({"lat": gcs_point[1], "lon": gcs_point[0]})
-            if polygon:
-                return {"time": time_sec, "color": color, "polygon": polygon}
+                contour = cur_perimeter[2][0][::one_out_of]
+                contour = contour[~np.isnan(contour).any(axis=1)]
+                # Transform all the vertices of the contour at once
+                gcs_points = coor_tran.transform_points(
+                    f_map.x_offset + contour[..., 0] * f_map.cell_width,
+                    f_map.y_offset + contour[..., 1] * f_map.cell_height)
+                polygon = [{"lat": p[1], "lon": p[0]} for p in gcs_points.tolist()]
+                if polygon:
+                    return {"time": time_sec, "color": color, "polygon": polygon}
 
         firemap = serialization.geodata_from_raster_msg(msg.raster, "ignition")
+        coor_tran = geo_data.CoordinateTransformation(firemap.projection_epsg, geo_data.EPSG_WGS84)
         oof = 2
         rospy.loginfo("Sending to Neptus %s out of %s point in contours", str(1), str(oof))
         # Colors from bright red to white, varying saturation: (255, x, x)
@@ -129,6 +129,8 @@ class ObservationPlanningNode:
             self.op.set_elevation(decoded)
 
     def on_wildfire_prediction(self, msg: PredictedWildfireMap):
+        # A running planning is outdated by the new prediction, make it return its current best plan
+        self.op.cancel_planning()
         with self.op_lock:
             rospy.loginfo("Predicted wildfire map received")
             self.op.set_wildfire_map(serialization.geodata_from_raster_msg(
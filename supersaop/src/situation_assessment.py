@@ -31,6 +31,7 @@ import pandas
 import datetime
 import logging
 import threading
+import traceback
 import uuid
 
 import numpy as np
@@ -65,10 +66,19 @@ class SituationAssessmentNode:
         self.last_elevation_timestamp = datetime.datetime.min
 
         self.horizon = rospy.Duration(secs=3 * 60 * 60)
+        # Partial predictions are published every isochrone_step of simulated time. 0 disables it
+        self.isochrone_step = rospy.Duration(secs=rospy.get_param("~isochrone_step", 10 * 60))
+        # Fit the fire spread to the observations before each prediction
+        self.calibrate = rospy.get_param("~calibrate", False)
+        # Fuse the observations with the last prediction instead of interpolating them
+        self.fusion = rospy.get_param("~fusion", False)
 
         self.pub_wildfire_pred = rospy.Publisher('wildfire_prediction',
                                                  PredictedWildfireMap,
                                                  queue_size=10, latch=True)
+        # Partial predictions are not complete forecasts: they have their own, non latched, topic
+        self.pub_wildfire_pred_partial = rospy.Publisher('wildfire_prediction_partial',
+                                                         PredictedWildfireMap, queue_size=10)
         self.pub_wildfire_current = rospy.Publisher('wildfire', WildfireMap,
                                                     queue_size=10, latch=True)
         # self.pub_wildfire_real = rospy.Publisher('wildfire_real', WildfireMap,
@@ -95,31 +105,83 @@ class SituationAssessmentNode:
         self.sub_wildfire_point = rospy.Subscriber("wildfire_point", Timed2DPointStamped,
                                                    self.on_wildfire_obs_point)
 
-        self.assessment_th = None  # self.assessment_th = threading.Thread(None, self.propagate, daemon=True)
+        # Assessments run in a background worker. Observations are only locked while they are
+        # copied, and repeated PropagateCmd received during an assessment are merged in one request
+        self.assessment_cv = threading.Condition()
+        self.assessment_requested = False
+        self.pending_wind = None  # Applied by the worker before the next assessment
+        self.assessment_th = threading.Thread(None, self._assessment_worker, daemon=True)
+        self.assessment_th.start()
+
+    def _assessment_worker(self):
+        while not rospy.is_shutdown():
+            with self.assessment_cv:
+                while not self.assessment_requested:
+                    self.assessment_cv.wait(timeout=1.)
+                    if rospy.is_shutdown():
+                        return
+                self.assessment_requested = False
+            try:
+                self.propagate()
+            except Exception:
+                rospy.logerr("Situation assessment failed: %s", traceback.format_exc())
 
     def propagate(self):
+        with self.assessment_cv:
+            wind, self.pending_wind = self.pending_wind, None
+        if wind is not None:
+            self.sa.set_surface_wind(wind)
+
         with self.sa_lock:
-            # Assess current condition
-            rospy.loginfo("Assessment of current situation")
-            self.sa.assess_current(datetime.datetime.fromtimestamp(rospy.Time.now().to_sec()))
-            w = None
-            w_time = None
-            if self.sa.wildfire:
-                w = self.sa.wildfire.geodata
-                w_time = self.sa.wildfire.time
-
-            rospy.loginfo("Assessment of future situation")
-            until = datetime.datetime.fromtimestamp((rospy.Time.now() + self.horizon).to_sec())
-            self.sa.assess_until(until)
-            p = self.sa.predicted_wildfire.geodata
-            p_time = self.sa.predicted_wildfire.time
-
-            self.emit_propagation(w, w_time, p, p_time, until)
+            observed = self.sa.observed_wildfire.snapshot()
+
+        # Assess current condition
+        rospy.loginfo("Assessment of current situation")
+        self.sa.assess_current(datetime.datetime.fromtimestamp(rospy.Time.now().to_sec()),
+                               observed=observed, fusion=self.fusion)
+        w = None
+        w_time = None
+        if self.sa.wildfire:
+            w = self.sa.wildfire.geodata
+            w_time = self.sa.wildfire.time
+
+        if self.calibrate:
+            rospy.loginfo("Calibration of the fire spread")
+            self.sa.calibrate(observed=observed, n_jobs=-1)
+
+        rospy.loginfo("Assessment of future situation")
+        now = rospy.Time.now()
+        until = datetime.datetime.fromtimestamp((now + self.horizon).to_sec())
+        if self.isochrone_step > rospy.Duration(0):
+            self.sa.assess_until(
+                until, observed=observed,
+                step=datetime.timedelta(seconds=self.isochrone_step.to_sec()),
+                on_milestone=self.emit_partial_prediction,
+                start=datetime.datetime.fromtimestamp(now.to_sec()))
+        else:
+            self.sa.assess_until(until, observed=observed)
+        p = self.sa.predicted_wildfire.geodata
+        p_time = self.sa.predicted_wildfire.time
+
+        self.emit_propagation(w, w_time, p, p_time, until, observed)
+
+    def emit_partial_prediction(self, milestone: datetime.datetime, p: GeoData):
+        """Publish the predicted wildfire up to some milestone while the propagation goes on."""
+        rospy.loginfo("Publishing partial wildfire prediction until %s", str(milestone))
+        self.pub_wildfire_pred_partial.publish(PredictedWildfireMap(
+            header=rospy.Header(stamp=rospy.Time.now()),
+            last_valid=rospy.Time.from_sec(milestone.timestamp()),
+            raster=serialization.raster_msg_from_geodata(p, 'ignition')))
 
     def emit_propagation(self, w: GeoData, w_timestamp: datetime.datetime, p: GeoData,
                          p_timestamp: datetime.datetime,
-                         until: datetime.datetime):
-        """Publish current situation assessment."""
+                         until: datetime.datetime,
+                         observed: SituationAssessment.ObservedWildfire):
+        """Publish current situation assessment.
+
+        :param observed: snapshot of the observed wildfire used by the assessment. The live one
+            is updated concurrently by the observation callbacks.
+        """
         current = None
         if w:
             current = WildfireMap(
@@ -156,7 +218,7 @@ class SituationAssessmentNode:
             g.draw_ignition_shade(with_colorbar=True)
             g.figure.savefig("/home/rbailonr/fuego_cur.png")
             g.close()
-        g = GeoDataDisplay.pyplot_figure(self.sa.observed_wildfire.geodata)
+        g = GeoDataDisplay.pyplot_figure(observed.geodata)
         g.draw_ignition_shade(with_colorbar=True)
         g.figure.savefig("/home/rbailonr/fuego_obs.png")
         # obs_cpp = self.sa.observed_wildfire.geodata.as_cpp_raster("ignition")
@@ -172,17 +234,20 @@ class SituationAssessmentNode:
         rospy.loginfo("Wildfire propagation publishing ended")
 
     def on_mean_wind(self, msg: MeanWindStamped):
-        with self.sa_lock:
-            rospy.loginfo("Mean wind set to %s km/h direction %s °",
-                          str(msg.speed), str(msg.direction / np.pi * 180))
-            self.sa.set_surface_wind((msg.speed, msg.direction))
+        rospy.loginfo("Mean wind set to %s km/h direction %s °",
+                      str(msg.speed), str(msg.direction / np.pi * 180))
+        # The environment is used by the running assessment, the wind is set before the next one
+        with self.assessment_cv:
+            self.pending_wind = (msg.speed, msg.direction)
 
     def on_propagate_cmd(self, msg: PropagateCmd):
-        if self.assessment_th is None:
-            rospy.loginfo("Doing situation asessment")
-            self.propagate()
-        else:
-            rospy.logwarn("Previous situation assessment action has not finished yet")
+        with self.assessment_cv:
+            if self.assessment_requested:
+                rospy.loginfo("Situation assessment already requested")
+            else:
+                rospy.loginfo("Doing situation asessment")
+                self.assessment_requested = True
+                self.assessment_cv.notify()
 
     def _on_wildfire_map_observed(self, msg: WildfireMap, uav: str):
         with self.sa_lock:
@@ -194,9 +259,7 @@ class SituationAssessmentNode:
             del g
             rospy.loginfo("Local wildfire map received from %s", str(uav))
 
-            for cell in zip(*np.where(local_firemap.data["ignition"] < np.inf)):
-                self.sa.observed_wildfire.set_cell_ignition(
-                    (*cell, local_firemap["ignition"][cell]))
+            self.sa.observed_wildfire.update_from_geodata(local_firemap, source=uav)
 
     def on_wildfire_obs_point(self, msg: Timed2DPointStamped):
         # if SA is locked, new observations should be stored in a queue
@@ -205,7 +268,8 @@ class SituationAssessmentNode:
             rospy.loginfo("New fire location received (%s, %s) with time %s",
                           str(msg.x), str(msg.y),
                           str(datetime.datetime.fromtimestamp(msg.t.to_sec())))
-            self.sa.observed_wildfire.set_point_ignition((msg.x, msg.y, msg.t.to_sec()))
+            self.sa.observed_wildfire.set_point_ignition((msg.x, msg.y, msg.t.to_sec()),
+                                                         source="wildfire_point")
             self.last_wildfire_update = datetime.datetime.now()
 
     # TODO: Service providing the current elevation map